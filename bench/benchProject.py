@@ -0,0 +1,258 @@
+'''
+Benchmark of the projectNode compute outside of Maya.
+
+The plugin file is imported against standinOpenMaya (a local stand-in for maya.api.OpenMaya) and
+its compute is driven with synthetic terrain meshes and batches of rays pointing down onto them.
+For every mesh size / ray count it reports the rays per second, the per compute latency
+percentiles and the peak python memory (tracemalloc, numpy allocations included).
+
+    python bench/benchProject.py
+    python bench/benchProject.py --plugin project.v0.1.6.py --triangles 1000 10000 --rays 1 100
+    python bench/benchProject.py --triangles 1000000 --rays 10000 --node array --json result.json
+    python bench/benchProject.py --motion path --triangles 1000000 --rays 1000
+    python bench/benchProject.py --node array --rays 10000 --workers 1 8 32
+    python bench/benchProject.py --triangles 100000 --rays 1000 --stats
+    python bench/benchProject.py --node api --rays 1000 10000
+
+The single node does one compute per ray (one node per contact, like the rigs), the array node
+does one compute for the whole batch and api is one projectOnMesh call for the whole batch,
+without any node. With --motion path the rays slide a little between two
+computes (playback of an animated contact) instead of jumping to random positions.
+'''
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tracemalloc
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+
+kRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+kDefaultPlugin = os.path.join(kRoot, 'project.v0.1.7.py')
+kPathStep = 0.02
+
+
+def translationMatrix(position):
+    matrix = OpenMaya.MMatrix()
+    matrix[12], matrix[13], matrix[14] = (float(value) for value in position)
+    return matrix
+
+
+def meshForTriangles(triangleCount, seed=0):
+    # Grid of quads, two triangles each
+    resolution = max(1, int(round(math.sqrt(triangleCount / 2.0))))
+    return OpenMaya.gridMesh(resolution, size=100.0, height=4.0, seed=seed)
+
+
+def randomRays(rayCount, seed=1):
+    # Sources above the terrain, targets below it, most rays hit the mesh
+    random = numpy.random.RandomState(seed)
+    sources = numpy.column_stack((random.uniform(-55, 55, rayCount), random.uniform(2, 10, rayCount), random.uniform(-55, 55, rayCount)))
+    targets = sources + numpy.column_stack((random.uniform(-3, 3, rayCount), -random.uniform(8, 20, rayCount), random.uniform(-3, 3, rayCount)))
+    return sources, targets
+
+
+def pathRays(rayCount, seed=1):
+    # One contact sliding over the terrain, a small step on every frame
+    sources, targets = randomRays(1, seed)
+    offsets = numpy.arange(rayCount)[:, None] * (kPathStep * numpy.array([1.0, 0.0, 0.7]))
+    return sources + offsets, targets + offsets
+
+
+def meshValue(nodeClass, mesh):
+    # inputMesh is an array from 0.1.7 on, the mesh goes to its first element
+    return {0: mesh} if nodeClass.inMesh.array else mesh
+
+
+def dirty(node, attribute):
+    # What Maya does when an input changes
+    node.setDependentsDirty(OpenMaya.MPlug(node.thisMObject(), attribute), OpenMaya.MPlugArray())
+
+
+def percentiles(samples):
+    samples = numpy.asarray(samples) * 1000.0
+    return dict(('p%d' % rank, float(numpy.percentile(samples, rank))) for rank in (50, 90, 99))
+
+
+def benchSingle(plugin, mesh, sources, targets):
+    nodeClass = plugin.project
+    node = nodeClass()
+    block = OpenMaya.MDataBlock({nodeClass.inMesh: meshValue(nodeClass, mesh), nodeClass.value: 1.0})
+    outputPlug = OpenMaya.MPlug(node.thisMObject(), nodeClass.resultVector)
+    dirty(node, nodeClass.inMesh)
+
+    # First compute builds whatever the plugin caches, timed on its own
+    block.setValue(nodeClass.inputMatrix, translationMatrix(sources[0]))
+    block.setValue(nodeClass.targetMatrix, translationMatrix(targets[0]))
+    start = time.perf_counter()
+    node.compute(outputPlug, block)
+    setup = time.perf_counter() - start
+
+    latencies = []
+    for source, target in zip(sources, targets):
+        block.setValue(nodeClass.inputMatrix, translationMatrix(source))
+        block.setValue(nodeClass.targetMatrix, translationMatrix(target))
+        dirty(node, nodeClass.inputMatrix)
+        dirty(node, nodeClass.targetMatrix)
+        start = time.perf_counter()
+        node.compute(outputPlug, block)
+        latencies.append(time.perf_counter() - start)
+    return setup, latencies, 1, node
+
+
+def benchArray(plugin, mesh, sources, targets, repeat, motion='random', workers=None):
+    nodeClass = plugin.projectArray
+    node = nodeClass()
+    count = len(sources)
+    block = OpenMaya.MDataBlock({
+        nodeClass.inMesh: meshValue(nodeClass, mesh),
+        nodeClass.inputMatrix: dict((index, translationMatrix(source)) for index, source in enumerate(sources)),
+        nodeClass.targetMatrix: dict((index, translationMatrix(target)) for index, target in enumerate(targets)),
+        nodeClass.value: dict((index, 1.0) for index in range(count)),
+    })
+    if workers is not None:
+        block.setValue(nodeClass.workers, workers)
+    outputPlug = OpenMaya.MPlug(node.thisMObject(), nodeClass.resultVector)
+    dirty(node, nodeClass.inMesh)
+
+    start = time.perf_counter()
+    node.compute(outputPlug, block)
+    setup = time.perf_counter() - start
+
+    latencies = []
+    for iteration in range(repeat):
+        if motion == 'path':
+            offset = (iteration + 1) * kPathStep * numpy.array([1.0, 0.0, 0.7])
+            block.setValue(nodeClass.inputMatrix, dict((index, translationMatrix(source + offset)) for index, source in enumerate(sources)))
+            block.setValue(nodeClass.targetMatrix, dict((index, translationMatrix(target + offset)) for index, target in enumerate(targets)))
+            dirty(node, nodeClass.targetMatrix)
+        dirty(node, nodeClass.inputMatrix)
+        start = time.perf_counter()
+        node.compute(outputPlug, block)
+        latencies.append(time.perf_counter() - start)
+    return setup, latencies, count, node
+
+
+def benchApi(plugin, mesh, sources, targets, repeat, workers=None):
+    # The same batch through projectOnMesh, the cache keeps the BVH between the calls like a node does
+    cache = plugin.MeshSetCache()
+    start = time.perf_counter()
+    plugin.projectOnMesh(mesh, sources, targets, cache=cache, workers=workers or 0)
+    setup = time.perf_counter() - start
+
+    latencies = []
+    for iteration in range(repeat):
+        start = time.perf_counter()
+        plugin.projectOnMesh(mesh, sources, targets, cache=cache, workers=workers or 0)
+        latencies.append(time.perf_counter() - start)
+    return setup, latencies, len(sources), None
+
+
+def runCase(plugin, nodeType, triangleCount, rayCount, repeat, motion='random', workers=None):
+    mesh = meshForTriangles(triangleCount)
+    if motion == 'path' and nodeType == 'single':
+        sources, targets = pathRays(rayCount)
+    else:
+        sources, targets = randomRays(rayCount)
+
+    if nodeType == 'single':
+        setup, latencies, raysPerCompute, node = benchSingle(plugin, mesh, sources, targets)
+    elif nodeType == 'api':
+        setup, latencies, raysPerCompute, node = benchApi(plugin, mesh, sources, targets, repeat, workers)
+    else:
+        setup, latencies, raysPerCompute, node = benchArray(plugin, mesh, sources, targets, repeat, motion, workers)
+    stats = node.getStats().asDict() if hasattr(node, 'getStats') else None
+
+    # Memory is measured on a second pass, tracing allocations slows the timed code down
+    tracemalloc.start()
+    if nodeType == 'single':
+        benchSingle(plugin, mesh, sources[:1], targets[:1])
+    elif nodeType == 'api':
+        benchApi(plugin, mesh, sources, targets, 1, workers)
+    else:
+        benchArray(plugin, mesh, sources, targets, 1, workers=workers)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    result = {
+        'node': nodeType,
+        'motion': motion,
+        'workers': workers,
+        'triangles': len(mesh.triangles()[1]) // 3,
+        'rays': rayCount,
+        'setupSeconds': setup,
+        'raysPerSecond': raysPerCompute * len(latencies) / total if total else float('inf'),
+        'latencyMs': percentiles(latencies),
+        'peakMemoryMB': peak / (1024.0 * 1024.0),
+    }
+    if stats is not None and plugin.NodeStats.enabled:
+        result['stats'] = stats
+    return result
+
+
+def formatResult(result):
+    latency = result['latencyMs']
+    node = result['node'] if result.get('workers') is None else '%s/%d' % (result['node'], result['workers'])
+    return '%-9s %9d tris %6d rays  setup %8.3fs  %12.1f rays/s  p50 %9.3fms  p90 %9.3fms  p99 %9.3fms  peak %8.1fMB' % (
+        node, result['triangles'], result['rays'], result['setupSeconds'], result['raysPerSecond'],
+        latency['p50'], latency['p90'], latency['p99'], result['peakMemoryMB'])
+
+
+def formatStats(stats):
+    # Counters on one line, then the seconds of every phase, slowest first
+    lines = ['    ' + '  '.join('%s %d' % item for item in sorted(stats['counters'].items()))]
+    for name, seconds in sorted(stats['seconds'].items(), key=lambda item: -item[1]):
+        lines.append('    %-14s %9.4fs' % (name, seconds))
+    return '\n'.join(lines)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to benchmark')
+    parser.add_argument('--triangles', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--rays', type=int, nargs='+', default=[1, 100, 1000])
+    parser.add_argument('--node', choices=('single', 'array', 'api', 'both'), default='both')
+    parser.add_argument('--repeat', type=int, default=10, help='computes per case for the array node')
+    parser.add_argument('--workers', type=int, nargs='+', help='worker threads of the array node (0 for one per cpu)')
+    parser.add_argument('--motion', choices=('random', 'path'), default='random', help='how the rays move between two computes')
+    parser.add_argument('--json', help='also write the results to this json file')
+    parser.add_argument('--stats', action='store_true', help='record and print the projectStats counters and phase timings of the nodes')
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    plugin.initializePlugin(OpenMaya.MObject('plugin'))
+    if options.stats and hasattr(plugin, 'NodeStats'):
+        plugin.NodeStats.enabled = True
+    nodeTypes = ['single', 'array'] if options.node == 'both' else [options.node]
+    # Older versions of the plugin only have the single node
+    nodeTypes = [nodeType for nodeType in nodeTypes if nodeType == 'single' or hasattr(plugin, 'projectArray')]
+    nodeTypes = [nodeType for nodeType in nodeTypes if nodeType != 'api' or hasattr(plugin, 'projectOnMesh')]
+
+    results = []
+    for triangleCount in options.triangles:
+        for rayCount in options.rays:
+            for nodeType in nodeTypes:
+                # Only the array node and the api split their rays across workers
+                workerCounts = options.workers if options.workers and nodeType in ('array', 'api') else [None]
+                for workers in workerCounts:
+                    result = runCase(plugin, nodeType, triangleCount, rayCount, options.repeat, options.motion, workers)
+                    results.append(result)
+                    print(formatResult(result))
+                    if 'stats' in result:
+                        print(formatStats(result['stats']))
+                    sys.stdout.flush()
+
+    if options.json:
+        with open(options.json, 'w') as outFile:
+            json.dump({'plugin': os.path.basename(options.plugin), 'results': results}, outFile, indent=4)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+'''
+Checks the projectBake command and the baked playback of the project nodes.
+
+The command is run through the stand-in scene on nodes whose inputs are animated (moving rays,
+a deforming mesh next to a static one). Then the baked nodes and the same nodes without a bake
+are played over the range : every output of every frame has to be the same, and the baked
+frames must not cast a ray or update a mesh acceleration. Last, undo has to put back the bake
+the node had before (a bake or a clear undone) and the time connection.
+
+    python bench/checkBake.py
+    python bench/checkBake.py --frames 48
+'''
+import os
+import sys
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph, countRayCasts, kRayOutputs
+
+
+def bakeMeshes(time):
+    # A static terrain and a wave going up and down, the same data for the same time
+    terrain = OpenMaya.gridMesh(12, size=40.0, height=2.0, seed=0)
+    wave = OpenMaya.gridMesh(8, size=40.0, height=1.0, seed=1)
+    return {0: terrain, 1: wave.deformed(numpy.tile([0.0, 0.5 * numpy.sin(0.6 * time) - 1.0, 0.0], (len(wave.points), 1)))}
+
+
+class BakeCase(object):
+    '''Animated inputs of one node setup, as functions of the time.'''
+
+    def __init__(self, nodeClass, rayCount, settings, seed):
+        random = numpy.random.RandomState(seed)
+        self.nodeClass = nodeClass
+        self.rayCount = rayCount
+        self.settings = settings
+        self.starts = numpy.column_stack((random.uniform(-15, 15, rayCount), random.uniform(3, 6, rayCount), random.uniform(-15, 15, rayCount)))
+        self.velocity = random.uniform(-1.5, 1.5, (rayCount, 3)) * [1.0, 0.3, 1.0]
+        self.animated = {
+            nodeClass.inputMatrix: lambda time: self.arrayValue([translationMatrix(source) for source in self.sources(time)]),
+            nodeClass.targetMatrix: lambda time: self.arrayValue([translationMatrix(source - [0.0, 10.0, 0.0]) for source in self.sources(time)]),
+            nodeClass.inMesh: bakeMeshes,
+        }
+
+    def sources(self, time):
+        return self.starts + self.velocity * time
+
+    def arrayValue(self, values):
+        return dict(enumerate(values)) if self.nodeClass.inputMatrix.array else values[0]
+
+    def createGraph(self, name=None):
+        graph = DependencyGraph(self.nodeClass, OpenMaya.MDataBlock())
+        graph.block.animated = dict(self.animated)
+        for attributeName, value in self.settings.items():
+            graph.setInput(getattr(self.nodeClass, attributeName), value)
+        if name:
+            OpenMaya.addNode(name, graph.node, graph.block, self.nodeClass.__name__)
+        return graph
+
+    def setTime(self, graph, time):
+        # What playback does : the animated inputs and the time change
+        for attribute, function in self.animated.items():
+            graph.setInput(attribute, function(time))
+        graph.setInput(self.nodeClass.time, OpenMaya.MTime(time))
+
+    def pull(self, graph):
+        results = []
+        for name in kRayOutputs:
+            attribute = getattr(self.nodeClass, name)
+            graph.pull(attribute)
+            if attribute.array:
+                results.append([graph.block.getValue(attribute, index) for index in range(self.rayCount)])
+            else:
+                results.append(graph.block.getValue(attribute))
+        return results
+
+
+def countMeshUpdates(plugin):
+    # Counts the updates of the mesh accelerations of the nodes
+    counter = [0]
+    update = plugin.MeshSetCache.update
+
+    def countedUpdate(*arguments, **keywords):
+        counter[0] += 1
+        return update(*arguments, **keywords)
+    plugin.MeshSetCache.update = countedUpdate
+    return counter
+
+
+def checkCase(plugin, case, name, frames, casts, updates):
+    failures = []
+    baked = case.createGraph(name)
+    live = case.createGraph()
+    bakedFrames = OpenMaya.executeCommand('projectBake', '-st', 1, '-et', frames, name)
+    if bakedFrames != frames:
+        failures.append('%s : baked %s frames, expected %d' % (name, bakedFrames, frames))
+    if not OpenMaya.MPlug(baked.node.thisMObject(), case.nodeClass.time).isDestination:
+        failures.append('%s : the bake did not connect the time attribute' % name)
+
+    def play(times, expectBaked=True):
+        for time in times:
+            case.setTime(baked, time)
+            case.setTime(live, time)
+            castsBefore, updatesBefore = casts[0], updates[0]
+            bakedResults = case.pull(baked)
+            if expectBaked and (casts[0], updates[0]) != (castsBefore, updatesBefore):
+                failures.append('%s : baked frame %g took %d ray casts and %d mesh updates' % (
+                    name, time, casts[0] - castsBefore, updates[0] - updatesBefore))
+            if bakedResults != case.pull(live):
+                failures.append('%s : frame %g differs from the live evaluation' % (name, time))
+
+    play(range(1, frames + 1))
+
+    # A second bake over half the range, undone : the first bake is served again
+    OpenMaya.executeCommand('projectBake', '-st', 1, '-et', frames // 2, '-by', 0.5, name)
+    OpenMaya.undo()
+    if len(baked.node.getBakeCache().times) != frames:
+        failures.append('%s : undoing a bake did not put back the bake before it' % name)
+    play([frames])
+
+    # A clear undone puts the bake back too
+    OpenMaya.executeCommand('projectBake', '-clear', name)
+    if baked.node.getBakeCache() is not None:
+        failures.append('%s : projectBake -clear left a bake' % name)
+    OpenMaya.undo()
+    play([frames - 1])
+
+    # Undoing the first bake leaves nothing baked and the time attribute unconnected
+    OpenMaya.undo()
+    if baked.node.getBakeCache() is not None:
+        failures.append('%s : undoing the first bake left a bake' % name)
+    if OpenMaya.MPlug(baked.node.thisMObject(), case.nodeClass.time).isDestination:
+        failures.append('%s : undoing the first bake left the time attribute connected' % name)
+    play([frames + 1], expectBaked=False)
+    OpenMaya.deleteNode(name)
+    return failures
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    parser.add_argument('--frames', type=int, default=12)
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    plugin.initializePlugin(OpenMaya.MObject('plugin'))
+    casts = countRayCasts(plugin)
+    updates = countMeshUpdates(plugin)
+
+    cases = [
+        ('projectNode1', BakeCase(plugin.project, 1, {}, 0)),
+        ('projectArrayNode1', BakeCase(plugin.projectArray, 8, {'direction': 0}, 1)),
+        ('projectArrayNode2', BakeCase(plugin.projectArray, 8, {'sweep': True, 'missMode': 1}, 2)),
+    ]
+    failures = []
+    for name, case in cases:
+        caseFailures = checkCase(plugin, case, name, options.frames, casts, updates)
+        print('%-18s %s' % (name, 'ok' if not caseFailures else '%d failures' % len(caseFailures)))
+        failures.extend(caseFailures)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+'''
+Checks the dependency wiring of the project nodes against a stand-in dependency graph.
+
+For every input of projectNode and projectArrayNode the input is changed, the dirty state is
+propagated the way Maya does (attributeAffects, then setDependentsDirty on the node) and every
+dirty output is pulled. It asserts exactly which outputs get dirty for each input and how many
+ray casts the pulls take, e.g. a change of value has to re-blend resultVector from the kept hit
+without casting the ray again. Removing an element of the inputs of projectArrayNode has to drop
+the same element of every output.
+
+    python bench/checkDependencies.py
+    python bench/checkDependencies.py --plugin project.v0.1.7.py
+'''
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, meshForTriangles, translationMatrix
+
+kRayOutputs = ('deltaVector', 'resultVector', 'resultRotate', 'dotProduct')
+
+# Input changed : (outputs it dirties, ray casts needed to pull them all)
+kExpected = {
+    'inputMatrix': (kRayOutputs, 1),
+    'targetMatrix': (kRayOutputs, 1),
+    'inMesh': (kRayOutputs, 1),
+    'direction': (kRayOutputs, 1),
+    'warmStart': (kRayOutputs, 1),
+    'missMode': (kRayOutputs, 1),
+    'maxDistance': (kRayOutputs, 1),
+    'accelerator': (kRayOutputs, 1),
+    'sweep': (kRayOutputs, 1),
+    'value': (('resultVector',), 0),
+    'rotateOrder': (('resultRotate',), 0),
+    'normalMode': (('dotProduct', 'resultRotate'), 0),
+    'time': (kRayOutputs, 0),
+}
+
+
+class DependencyGraph(object):
+    '''
+    Stand-in of the Maya dirty propagation for one node : an input change dirties the outputs
+    the node class declared with attributeAffects and tells the node through setDependentsDirty.
+    Pulling an output computes it only if it is dirty.
+    '''
+
+    def __init__(self, nodeClass, block):
+        self.nodeClass = nodeClass
+        self.node = nodeClass()
+        self.block = block
+        self.dirty = set(getattr(nodeClass, name) for name in kRayOutputs)
+
+    def setInput(self, attribute, value):
+        self.block.values[attribute] = value
+        affected = self.nodeClass.affectedBy(attribute)
+        self.node.setDependentsDirty(OpenMaya.MPlug(self.node.thisMObject(), attribute), OpenMaya.MPlugArray())
+        self.dirty.update(affected)
+        return affected
+
+    def pull(self, attribute):
+        if attribute in self.dirty:
+            plug = OpenMaya.MPlug(self.node.thisMObject(), attribute)
+            if attribute.array:
+                plug = plug.elementByLogicalIndex(0)
+            self.node.compute(plug, self.block)
+            self.dirty.discard(attribute)
+        return self.block.getValue(attribute, 0 if attribute.array else None)
+
+
+def countRayCasts(plugin):
+    # Counts the ray queries done through the plugin engine, by the BVH or Maya's accelerator
+    counter = [0]
+
+    def counted(closestIntersection):
+        def countedIntersection(*arguments, **keywords):
+            counter[0] += 1
+            return closestIntersection(*arguments, **keywords)
+        return countedIntersection
+
+    for accelClass in (plugin.projectCore.MeshBVH, plugin.MayaMeshAccel):
+        accelClass.closestIntersection = counted(accelClass.closestIntersection)
+    return counter
+
+
+def inputValues(nodeClass, step):
+    # New values for every input, different for every step
+    sourceMatrix = translationMatrix((0.3 + 0.1 * step, 8.0, 0.2))
+    targetMatrix = translationMatrix((0.1 * step, -8.0, 0.4))
+    values = {
+        'inputMatrix': sourceMatrix,
+        'targetMatrix': targetMatrix,
+        'inMesh': meshForTriangles(200, seed=step),
+        'direction': step % 3,
+        'value': 0.25 * step,
+        'rotateOrder': step % 6,
+        'warmStart': bool(step % 2),
+        'missMode': step % 2,
+        'maxDistance': 0.5 * step,
+        'accelerator': step % 2,
+        'sweep': bool(step % 2),
+        'normalMode': step % 2,
+        'time': OpenMaya.MTime(step),
+    }
+    if nodeClass.inputMatrix.array:
+        for name in ('inputMatrix', 'targetMatrix', 'value'):
+            values[name] = {0: values[name]}
+    if nodeClass.inMesh.array:
+        values['inMesh'] = {0: values['inMesh']}
+    return values
+
+
+def checkNode(nodeClass, counter):
+    failures = []
+    block = OpenMaya.MDataBlock()
+    graph = DependencyGraph(nodeClass, block)
+    for name, value in inputValues(nodeClass, 0).items():
+        graph.setInput(getattr(nodeClass, name), value)
+    for name in kRayOutputs:
+        graph.pull(getattr(nodeClass, name))
+
+    for step, name in enumerate(sorted(kExpected), 1):
+        expectedOutputs, expectedCasts = kExpected[name]
+        affected = graph.setInput(getattr(nodeClass, name), inputValues(nodeClass, step)[name])
+        dirtied = sorted(attribute.name for attribute in affected)
+        if dirtied != sorted(expectedOutputs):
+            failures.append('%s : %s dirties %s, expected %s' % (nodeClass.__name__, name, dirtied, sorted(expectedOutputs)))
+
+        casts = counter[0]
+        for outputName in kRayOutputs:
+            graph.pull(getattr(nodeClass, outputName))
+        if counter[0] - casts != expectedCasts:
+            failures.append('%s : %s took %d ray casts, expected %d' % (nodeClass.__name__, name, counter[0] - casts, expectedCasts))
+    return failures
+
+
+def checkRemovedElement(nodeClass):
+    # Three rays, then the middle inputMatrix element is removed
+    block = OpenMaya.MDataBlock()
+    graph = DependencyGraph(nodeClass, block)
+    values = inputValues(nodeClass, 0)
+    graph.setInput(nodeClass.inMesh, values['inMesh'])
+    graph.setInput(nodeClass.value, dict((index, 1.0) for index in range(3)))
+    graph.setInput(nodeClass.targetMatrix, dict((index, translationMatrix((index, -8.0, 0.0))) for index in range(3)))
+    graph.setInput(nodeClass.inputMatrix, dict((index, translationMatrix((index, 8.0, 0.0))) for index in range(3)))
+    for name in kRayOutputs:
+        graph.pull(getattr(nodeClass, name))
+    graph.setInput(nodeClass.inputMatrix, dict((index, translationMatrix((index, 8.0, 0.0))) for index in (0, 2)))
+
+    failures = []
+    for name in kRayOutputs:
+        graph.pull(getattr(nodeClass, name))
+        elements = sorted(block.getArray(getattr(nodeClass, name)))
+        if elements != [0, 2]:
+            failures.append('%s : %s has the elements %s after inputMatrix[1] was removed, expected [0, 2]' % (nodeClass.__name__, name, elements))
+    return failures
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    plugin.initializePlugin(OpenMaya.MObject('plugin'))
+    counter = countRayCasts(plugin)
+
+    failures = []
+    for nodeClass in (plugin.project, plugin.projectArray):
+        nodeFailures = checkNode(nodeClass, counter)
+        if nodeClass.inputMatrix.array:
+            nodeFailures += checkRemovedElement(nodeClass)
+        print('%-14s %s' % (nodeClass.__name__, 'ok' if not nodeFailures else '%d failures' % len(nodeFailures)))
+        failures.extend(nodeFailures)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+'''
+Checks the exactness of the ray queries of projectCore against themselves.
+
+The warm start only changes how fast a ray finds its hit, never which hit : rays cast with the
+faces of the last frame, or with any other faces, have to get the same hits as the rays cast
+without them, including a surface coming in between the source and the faces they start from.
+
+The same goes for the worker threads : the ray casts, swept casts and closest points of one mesh
+and of several meshes have to be the same bit for bit on one thread and split across workers,
+also once the thread pools were shut down and created again.
+
+    python bench/checkEngine.py
+    python bench/checkEngine.py --rays 20000 --workers 2 3 16
+'''
+import os
+import sys
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kRoot
+
+sys.path.insert(0, kRoot)
+import projectCore
+
+kResultNames = ('hit', 'hitPoint', 'hitParam', 'hitFace', 'hitTriangle', 'hitBary1', 'hitBary2')
+
+
+def meshBVH(mesh):
+    # BVH of a stand-in mesh with its polygon face ids, like MeshCache builds it
+    counts, vertices = mesh.triangles()
+    faceIds = numpy.repeat(numpy.arange(len(counts)), counts)
+    triIds = numpy.arange(len(faceIds)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return projectCore.MeshBVH(mesh.points, numpy.array(vertices).reshape(-1, 3), faceIds, triIds)
+
+
+def layeredMesh():
+    # A terrain with a smaller terrain floating above part of it, one mesh
+    ground = OpenMaya.gridMesh(24, size=60.0, height=3.0, seed=0)
+    roof = OpenMaya.gridMesh(10, size=30.0, height=1.0, seed=1)
+    offset = len(ground.points)
+    return OpenMaya.MeshData(numpy.vstack((ground.points, roof.points + [0.0, 6.0, 0.0])),
+                             ground.polygons + [[vertex + offset for vertex in polygon] for polygon in roof.polygons])
+
+
+def compare(name, expected, result):
+    failures = []
+    for arrayName, expectedArray, array in zip(kResultNames, expected, result):
+        # The swept hits have a nan param, nan is the same as nan here
+        equalNan = expectedArray.dtype.kind == 'f'
+        if not numpy.array_equal(expectedArray, array, equal_nan=equalNan):
+            different = (expectedArray != array) & ~(numpy.isnan(expectedArray) & numpy.isnan(array) if equalNan else False)
+            rays = numpy.flatnonzero(different.reshape(len(expectedArray), -1).any(axis=1))
+            failures.append('%s : %s differs on %d rays (first %d)' % (name, arrayName, len(rays), rays[0]))
+    return failures
+
+
+def checkWarmStart(rayCount, seed):
+    bvh = meshBVH(layeredMesh())
+    random = numpy.random.RandomState(seed)
+    origins = numpy.column_stack((random.uniform(-28, 28, rayCount), random.uniform(10, 14, rayCount), random.uniform(-28, 28, rayCount)))
+    directions = numpy.column_stack((random.uniform(-2, 2, rayCount), -random.uniform(15, 25, rayCount), random.uniform(-2, 2, rayCount)))
+    cold = bvh.closestIntersection(origins, directions, 1.0)
+
+    # The faces of the ground under every ray (what a ray hit before the roof came in), the faces
+    # of the cold hits and random faces
+    groundOrigins = origins.copy()
+    groundOrigins[:, 1] = 4.0
+    groundFaces = bvh.closestIntersection(groundOrigins, directions, 1.0)[3]
+    randomFaces = random.randint(-1, bvh.faceIds.max() + 1, rayCount)
+
+    failures = []
+    for name, warmFaces in (('ground faces', groundFaces), ('hit faces', cold[3]), ('random faces', randomFaces)):
+        failures += compare('warm start from the %s' % name, cold, bvh.closestIntersection(origins, directions, 1.0, warmFaces=warmFaces))
+    return failures
+
+
+def checkWorkers(rayCount, seed, workerCounts):
+    random = numpy.random.RandomState(seed)
+    mesh = meshBVH(layeredMesh())
+    scene = projectCore.SceneBVH([mesh, meshBVH(OpenMaya.gridMesh(9, size=30.0, height=2.0, seed=2))], [len(mesh.faceIds), 81])
+    origins = numpy.column_stack((random.uniform(-32, 32, rayCount), random.uniform(-2, 14, rayCount), random.uniform(-32, 32, rayCount)))
+    directions = random.uniform(-20, 20, (rayCount, 3))
+    previous = origins + random.uniform(-3, 3, (rayCount, 3))
+    warmFaces = random.randint(-1, 400, rayCount)
+
+    queries = {
+        'closestIntersection': lambda bvh, workers: bvh.closestIntersection(origins, directions, 1.0, projectCore.kBoth, warmFaces, workers, 1),
+        'sweptIntersection': lambda bvh, workers: projectCore.sweptIntersection(bvh, previous, origins, directions, 1.0, projectCore.kForward,
+                                                                                warmFaces, workers, 1),
+        'closestPoints': lambda bvh, workers: bvh.closestPoints(origins, 6.0, workers, 1),
+    }
+    failures = []
+    for bvhName, bvh in (('mesh', mesh), ('scene', scene)):
+        for queryName, query in sorted(queries.items()):
+            serial = query(bvh, 1)
+            for workers in workerCounts:
+                failures += compare('%s %s on %d workers' % (bvhName, queryName, workers), serial, query(bvh, workers))
+            projectCore.shutdownThreadPools()
+            if projectCore.threadPools:
+                failures.append('shutdownThreadPools left %d pools' % len(projectCore.threadPools))
+            failures += compare('%s %s after the pools were shut down' % (bvhName, queryName), serial, query(bvh, workerCounts[-1]))
+    return failures
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--rays', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 7], help='worker counts compared with one thread')
+    options = parser.parse_args(arguments)
+
+    failures = []
+    for name, check in (('warmStart', lambda: checkWarmStart(options.rays, options.seed)),
+                        ('workers', lambda: checkWorkers(options.rays, options.seed, options.workers))):
+        checkFailures = check()
+        print('%-14s %s' % (name, 'ok' if not checkFailures else '%d failures' % len(checkFailures)))
+        failures.extend(checkFailures)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
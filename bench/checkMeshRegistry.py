@@ -0,0 +1,181 @@
+'''
+Checks the sharing of the mesh acceleration between project nodes through the meshRegistry.
+
+A few hundred nodes read the same meshes and every mesh version has to be built once, whatever
+the number of nodes, and only read (fingerprint and triangles) by the first node given its
+data. Then the meshes deform (a refit per version), the nodes are deleted (their
+entries go back to the registry), a budget the entries nobody holds fit in keeps them, a
+smaller one evicts them and uninitializePlugin empties the registry. The results of the nodes are compared with a node
+computing on its own after every step. Last, a mesh wired differently with the same counts (and
+the same points) has to get a BVH of its own, neither shared nor refitted from the first one.
+
+    python bench/checkMeshRegistry.py
+    python bench/checkMeshRegistry.py --nodes 1000
+'''
+import os
+import sys
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph
+
+
+def checkMeshes(frame):
+    # Two terrains and a deforming one
+    terrain = OpenMaya.gridMesh(16, size=40.0, height=2.0, seed=0)
+    hills = OpenMaya.gridMesh(8, size=40.0, height=3.0, seed=1)
+    wave = OpenMaya.gridMesh(12, size=40.0, height=1.0, seed=2)
+    wave = wave.deformed(numpy.tile([0.0, 0.3 * numpy.sin(0.7 * frame) - 1.5, 0.0], (len(wave.points), 1)))
+    return terrain, hills, wave
+
+
+def rewiredMesh(mesh):
+    # The same points and counts with every quad split along its other diagonal
+    return OpenMaya.MeshData(mesh.points, [polygon[1:] + polygon[:1] for polygon in mesh.polygons])
+
+
+def buildNodes(plugin, count, meshes):
+    # Graphs of projectNodes, every node reads one or two of the meshes
+    random = numpy.random.RandomState(0)
+    graphs = []
+    for index in range(count):
+        nodeClass = plugin.project
+        graph = DependencyGraph(nodeClass, OpenMaya.MDataBlock())
+        graph.meshes = sorted(set(random.choice(len(meshes), random.randint(1, 3)).tolist()))
+        source = (random.uniform(-18, 18), random.uniform(2, 6), random.uniform(-18, 18))
+        graph.setInput(nodeClass.inputMatrix, translationMatrix(source))
+        graph.setInput(nodeClass.targetMatrix, translationMatrix((source[0], source[1] - 10.0, source[2])))
+        graph.setInput(nodeClass.value, 1.0)
+        graphs.append(graph)
+    return graphs
+
+
+def evaluate(graph, meshes):
+    graph.setInput(graph.nodeClass.inMesh, dict((index, meshes[mesh]) for index, mesh in enumerate(graph.meshes)))
+    return graph.pull(graph.nodeClass.resultVector)
+
+
+def reference(plugin, graph, meshes):
+    # The same node on its own, with an empty registry
+    registry = plugin.meshRegistry
+    plugin.meshRegistry = plugin.MeshRegistry(0)
+    try:
+        single = DependencyGraph(graph.nodeClass, OpenMaya.MDataBlock(dict(graph.block.values)))
+        single.meshes = graph.meshes
+        result = evaluate(single, meshes)
+        single.node.release()
+    finally:
+        plugin.meshRegistry = registry
+    return result
+
+
+def countCalls(plugin, name, counts):
+    # Counts the calls to a function of the plugin in counts[name]
+    function = getattr(plugin, name)
+
+    def counted(*args):
+        counts[name] = counts.get(name, 0) + 1
+        return function(*args)
+    setattr(plugin, name, counted)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    parser.add_argument('--nodes', type=int, default=300)
+    parser.add_argument('--frames', type=int, default=3)
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    pluginObject = OpenMaya.MObject('plugin')
+    plugin.initializePlugin(pluginObject)
+    registry = plugin.meshRegistry
+    failures = []
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    def stats():
+        return registry.asDict()
+
+    # Every version is built once however many nodes read it, then the deforming mesh is refitted
+    # once per frame. The three mesh data of a frame are read once each, whatever the number of
+    # nodes reading them
+    graphs = buildNodes(plugin, options.nodes, checkMeshes(0))
+    reads = {}
+    for name in ('getMeshFingerprint', 'getMeshTriangles'):
+        countCalls(plugin, name, reads)
+    for frame in range(options.frames):
+        meshes = checkMeshes(frame)
+        reads.clear()
+        results = [evaluate(graph, meshes) for graph in graphs]
+        expected = stats()
+        expect(expected['builds'] == 3, 'frame %d : %d builds, expected 3' % (frame, expected['builds']))
+        expect(expected['refits'] == frame, 'frame %d : %d refits, expected %d' % (frame, expected['refits'], frame))
+        expect(reads == {'getMeshFingerprint': 3, 'getMeshTriangles': 3}, 'frame %d : the meshes were read %s, expected 3 times each' % (
+            frame, reads))
+        for graph, result in list(zip(graphs, results))[::max(1, options.nodes // 20)]:
+            expect(result == reference(plugin, graph, meshes), 'frame %d : a shared node differs from one on its own' % frame)
+    print('shared       %s' % stats())
+
+    # Only the current version of every mesh is in use, the older ones stay until evicted
+    expect(stats()['entriesInUse'] == 3, '%d entries in use, expected 3' % stats()['entriesInUse'])
+    expect(stats()['entries'] == 2 + options.frames, '%d entries, expected %d' % (stats()['entries'], 2 + options.frames))
+    # The budget only covers the entries nobody holds : one fitting them keeps them all, however
+    # much the entries in use take
+    unused = sum(entry.nbytes() for entry in registry.entries.values() if entry.refCount == 0)
+    registry.setBudget(unused)
+    expect(stats()['entries'] == 2 + options.frames, 'a budget of the unused entries left %d entries, expected %d' % (
+        stats()['entries'], 2 + options.frames))
+    registry.setBudget(0)
+    expect(stats()['entries'] == 3, 'a zero budget left %d entries, expected the 3 in use' % stats()['entries'])
+
+    # Deleting the nodes gives their entries back, the budget then evicts them all
+    for graph in graphs:
+        OpenMaya.MDGMessage.removeNode(graph.node.thisMObject(), plugin.kNodeName)
+    expect(stats()['entriesInUse'] == 0, '%d entries still in use after the nodes were deleted' % stats()['entriesInUse'])
+    expect(stats()['entries'] == 0, '%d entries left past a zero budget' % stats()['entries'])
+    print('released     %s' % stats())
+
+    # A deleted node coming back (undo) acquires its meshes again
+    registry.setBudget(plugin.getMeshBudget())
+    meshes = checkMeshes(options.frames)
+    expect(evaluate(graphs[0], meshes) == reference(plugin, graphs[0], meshes), 'a node brought back differs from one on its own')
+    expect(stats()['entriesInUse'] == len(graphs[0].meshes), 'a node brought back holds %d entries' % stats()['entriesInUse'])
+
+    # Meshes with the same counts but other triangles : the rewired mesh is a build of its own
+    # and so is its deformed version read after the first mesh, never a refit of it
+    terrain = checkMeshes(0)[1]
+    rewired = rewiredMesh(terrain)
+    lifted = rewired.deformed(numpy.tile([0.0, 0.25, 0.0], (len(rewired.points), 1)))
+    graph = graphs[0]
+    graph.meshes = [0]
+    for step, meshes in enumerate(([terrain], [rewired], [terrain], [lifted])):
+        before = stats()
+        expect(evaluate(graph, meshes) == reference(plugin, graph, meshes), 'rewired step %d : the node differs from one on its own' % step)
+        after = stats()
+        if step in (1, 3):
+            expect(after['builds'] == before['builds'] + 1 and after['refits'] == before['refits'],
+                   'rewired step %d : %d builds and %d refits, expected one build' % (
+                       step, after['builds'] - before['builds'], after['refits'] - before['refits']))
+    expect(evaluate(graph, [rewired]) != evaluate(graph, [terrain]), 'the rewired mesh gives the same results, it checks nothing')
+    print('rewired      %s' % stats())
+
+    plugin.uninitializePlugin(pluginObject)
+    expect(stats()['entries'] == 0, 'uninitializePlugin left %d entries' % stats()['entries'])
+    expect(not OpenMaya.MDGMessage.callbacks, 'uninitializePlugin left %d callbacks' % len(OpenMaya.MDGMessage.callbacks))
+    print('uninitialize %s' % stats())
+
+    print('meshRegistry %s' % ('ok' if not failures else '%d failures' % len(failures)))
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+'''
+Checks projectOnMesh against the outputs of a projectArrayNode with the same inputs.
+
+A terrain shape sits under a rotated and translated transform in the stand-in scene. The node
+reads its world space mesh data (worldMesh connected to inputMesh), projectOnMesh gets the name
+of the shape, which is read through its dag path, and the mesh data itself. For both
+accelerators (BVH and mayaGrid) and both miss modes (target and closestPoint, which goes through
+the MMeshIntersector of the shape), the positions, rotations and dot products of projectOnMesh
+have to be the ones of the node.
+
+    python bench/checkProjectOnMesh.py
+    python bench/checkProjectOnMesh.py --rays 500
+'''
+import os
+import sys
+import math
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph
+
+kShapeName = 'terrainShape'
+
+
+def shapeMatrix():
+    # World matrix of the terrain : 30 degrees around y, then moved
+    angle = math.radians(30.0)
+    cosine, sine = math.cos(angle), math.sin(angle)
+    return OpenMaya.MMatrix([cosine, 0.0, -sine, 0.0, 0.0, 1.0, 0.0, 0.0, sine, 0.0, cosine, 0.0, 2.0, 1.0, -3.0, 1.0])
+
+
+def nodeResults(plugin, worldMesh, sources, targets, settings):
+    # resultVector, resultRotate and dotProduct of a projectArrayNode as (count, 3), (count, 3) and (count,) arrays
+    nodeClass = plugin.projectArray
+    graph = DependencyGraph(nodeClass, OpenMaya.MDataBlock())
+    graph.setInput(nodeClass.inputMatrix, dict(enumerate(sources)))
+    graph.setInput(nodeClass.targetMatrix, dict(enumerate(targets)))
+    graph.setInput(nodeClass.inMesh, {0: worldMesh})
+    graph.setInput(nodeClass.value, dict((index, 1.0) for index in range(len(sources))))
+    for name, value in settings.items():
+        graph.setInput(getattr(nodeClass, name), value)
+    results = []
+    for name in ('resultVector', 'resultRotate', 'dotProduct'):
+        attribute = getattr(nodeClass, name)
+        graph.pull(attribute)
+        results.append(numpy.array([graph.block.getValue(attribute, index) for index in range(len(sources))]))
+    graph.node.release()
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    parser.add_argument('--rays', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    pluginObject = OpenMaya.MObject('plugin')
+    plugin.initializePlugin(pluginObject)
+
+    dagPath = OpenMaya.addMesh(kShapeName, OpenMaya.gridMesh(14, size=30.0, height=2.0, seed=3), shapeMatrix())
+    worldMesh = dagPath.worldMesh()
+
+    # Rays over the terrain and past its edges, the ones missing it snap in the closestPoint mode
+    random = numpy.random.RandomState(options.seed)
+    positions = numpy.column_stack((random.uniform(-24, 24, options.rays), random.uniform(3, 8, options.rays),
+                                    random.uniform(-24, 24, options.rays)))
+    drops = numpy.column_stack((random.uniform(-2, 2, options.rays), -random.uniform(6, 14, options.rays),
+                                random.uniform(-2, 2, options.rays)))
+    sources = [translationMatrix(position) for position in positions]
+    targets = [translationMatrix(position) for position in positions + drops]
+
+    failures = []
+    for accelerator, acceleratorName in ((plugin.kAccelBVH, 'bvh'), (plugin.kAccelMayaGrid, 'mayaGrid')):
+        hitCounts = {}
+        for missMode, missName in ((plugin.kMissTarget, 'target'), (plugin.kMissClosestPoint, 'closestPoint')):
+            settings = {'accelerator': accelerator, 'missMode': missMode, 'maxDistance': 4.0, 'normalMode': plugin.kNormalFace,
+                        'rotateOrder': 0, 'direction': plugin.projectCore.kForward}
+            expected = nodeResults(plugin, worldMesh, sources, targets, settings)
+            for meshName, mesh in (('name', kShapeName), ('mesh data', worldMesh)):
+                result = plugin.projectOnMesh(mesh, sources, targets, **settings)
+                for outputName, expectedArray, array in zip(('resultVector', 'resultRotate', 'dotProduct'), expected, result):
+                    different = ~numpy.isclose(expectedArray, array, atol=1e-4).reshape(options.rays, -1).all(axis=1)
+                    if different.any():
+                        failures.append('%s %s, mesh by %s : %s differs on %d rays (first %d)' % (
+                            acceleratorName, missName, meshName, outputName, different.sum(), numpy.flatnonzero(different)[0]))
+            print('%-9s %-13s %3d hits  %s' % (acceleratorName, missName, result[3].sum(),
+                                              'ok' if not failures else '%d failures' % len(failures)))
+            hitCounts[missMode] = result[3].sum()
+
+        # The closestPoint mode has to snap some of the rays which miss, or it was not checked
+        if hitCounts[plugin.kMissClosestPoint] <= hitCounts[plugin.kMissTarget]:
+            failures.append('%s : no ray snapped to its closest point' % acceleratorName)
+
+    plugin.uninitializePlugin(pluginObject)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+'''
+Checks the projectStats command against the counters of a known compute sequence.
+
+Two nodes of the stand-in scene (a projectNode and a projectArrayNode) are pulled while
+recording is off, on and off again, and the command has to return the counters the sequence
+implies : evaluations, reused and recast hits, rays cast, accelerator rebuilds and refits. The
+query of one node, -reset, -file, -meshRegistry and -meshBudget are checked on the way.
+
+    python bench/checkStats.py
+'''
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph
+
+kCounterNames = ('evaluations', 'hitCacheHits', 'hitCacheMisses', 'bakeHits', 'accelRebuilds', 'accelRefits', 'raysCast')
+
+
+def createGraph(nodeClass, name, typeName, rayCount, mesh):
+    # A node of the scene with rayCount rays going down onto the mesh
+    graph = DependencyGraph(nodeClass, OpenMaya.MDataBlock())
+    sources = [translationMatrix((2.0 * ray - rayCount, 5.0, 1.0)) for ray in range(rayCount)]
+    targets = [translationMatrix((2.0 * ray - rayCount, -5.0, 1.0)) for ray in range(rayCount)]
+    if nodeClass.inputMatrix.array:
+        graph.setInput(nodeClass.inputMatrix, dict(enumerate(sources)))
+        graph.setInput(nodeClass.targetMatrix, dict(enumerate(targets)))
+    else:
+        graph.setInput(nodeClass.inputMatrix, sources[0])
+        graph.setInput(nodeClass.targetMatrix, targets[0])
+    graph.setInput(nodeClass.inMesh, {0: mesh})
+    OpenMaya.addNode(name, graph.node, graph.block, typeName)
+    return graph
+
+
+def projectStats(*args):
+    return json.loads(OpenMaya.executeCommand('projectStats', *args))
+
+
+def counters(stats, name):
+    # Every counter of the node, 0 for the ones never counted
+    nodeCounters = stats[name]['counters']
+    return dict((counter, nodeCounters.get(counter, 0)) for counter in kCounterNames)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    parser.add_argument('--rays', type=int, default=6, help='rays of the projectArrayNode')
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    pluginObject = OpenMaya.MObject('plugin')
+    plugin.initializePlugin(pluginObject)
+    failures = []
+
+    def expect(stats, name, expected, step):
+        result = counters(stats, name)
+        expectedCounters = dict((counter, expected.get(counter, 0)) for counter in kCounterNames)
+        if result != expectedCounters:
+            failures.append('%s : %s counters %s, expected %s' % (step, name, result, expectedCounters))
+
+    mesh = OpenMaya.gridMesh(10, size=40.0, height=1.0, seed=0)
+    single = createGraph(plugin.project, 'projectNode1', plugin.kNodeName, 1, mesh)
+    array = createGraph(plugin.projectArray, 'projectArrayNode1', plugin.kArrayNodeName, options.rays, mesh)
+
+    # Nothing is recorded before -enable
+    single.pull(plugin.project.resultVector)
+    stats = projectStats()
+    if sorted(stats) != ['projectArrayNode1', 'projectNode1']:
+        failures.append('disabled : stats of %s, expected the two nodes' % sorted(stats))
+    expect(stats, 'projectNode1', {}, 'disabled')
+    if stats['projectNode1']['seconds'] or stats['projectNode1']['type'] != plugin.kNodeName:
+        failures.append('disabled : projectNode1 stats %s' % stats['projectNode1'])
+
+    # Two outputs of every node : the second one reuses the hits of the first. The mesh was
+    # built while recording was off, the array node gets the same BVH from the registry
+    projectStats('-enable', 'on')
+    for graph in (single, array):
+        graph.setInput(graph.nodeClass.inMesh, {0: mesh.deformed(numpy.zeros((len(mesh.points), 3)))})
+        graph.pull(graph.nodeClass.resultVector)
+        graph.pull(graph.nodeClass.resultRotate)
+    stats = projectStats()
+    expect(stats, 'projectNode1', {'evaluations': 2, 'hitCacheHits': 1, 'hitCacheMisses': 1, 'raysCast': 1}, 'enabled')
+    expect(stats, 'projectArrayNode1', {'evaluations': 2, 'hitCacheHits': 1, 'hitCacheMisses': 1, 'raysCast': options.rays,
+                                        'accelRebuilds': 1}, 'enabled')
+    for phase in ('matrixDecode', 'meshUpdate', 'rayCast', 'rotationSolve', 'outputWrite'):
+        if not stats['projectArrayNode1']['seconds'].get(phase, 0.0) > 0.0:
+            failures.append('enabled : no %s seconds recorded' % phase)
+
+    # A deformed mesh is a refit, the query of one node only returns that node
+    deformed = mesh.deformed(numpy.tile([0.0, 0.5, 0.0], (len(mesh.points), 1)))
+    single.setInput(plugin.project.inMesh, {0: deformed})
+    single.pull(plugin.project.dotProduct)
+    stats = projectStats('projectNode1')
+    if sorted(stats) != ['projectNode1']:
+        failures.append('query : stats of %s, expected projectNode1' % sorted(stats))
+    expect(stats, 'projectNode1', {'evaluations': 3, 'hitCacheHits': 1, 'hitCacheMisses': 2, 'raysCast': 2, 'accelRefits': 1}, 'query')
+    if stats['projectNode1']['type'] != plugin.kNodeName:
+        failures.append('query : projectNode1 is a %s' % stats['projectNode1']['type'])
+
+    # -reset of one node leaves the other one, -file writes what the command returns
+    stats = projectStats('-reset', 'projectNode1')
+    expect(stats, 'projectNode1', {}, 'reset')
+    statsFile = os.path.join(tempfile.mkdtemp(), 'projectStats.json')
+    stats = projectStats('-file', statsFile)
+    expect(stats, 'projectArrayNode1', {'evaluations': 2, 'hitCacheHits': 1, 'hitCacheMisses': 1, 'raysCast': options.rays,
+                                        'accelRebuilds': 1}, 'reset')
+    with open(statsFile) as readFile:
+        if json.load(readFile) != stats:
+            failures.append('file : %s differs from the result of the command' % statsFile)
+
+    # Nothing is recorded once disabled again
+    projectStats('-enable', 'off')
+    array.setInput(plugin.projectArray.inMesh, {0: deformed})
+    array.pull(plugin.projectArray.resultVector)
+    single.pull(plugin.project.resultVector)
+    stats = projectStats()
+    expect(stats, 'projectNode1', {}, 'disabled again')
+    expect(stats, 'projectArrayNode1', {'evaluations': 2, 'hitCacheHits': 1, 'hitCacheMisses': 1, 'raysCast': options.rays,
+                                        'accelRebuilds': 1}, 'disabled again')
+
+    # -meshRegistry returns the registry stats : the versions of the mesh in one entry (built
+    # once, refitted once), the two nodes hold the deformed one
+    registry = projectStats('-meshRegistry')
+    if registry != plugin.meshRegistry.asDict():
+        failures.append('meshRegistry : %s, expected %s' % (registry, plugin.meshRegistry.asDict()))
+    for name, expected in (('builds', 1), ('refits', 1), ('shares', 2), ('entriesInUse', 1), ('entries', 2)):
+        if registry.get(name) != expected:
+            failures.append('meshRegistry : %s is %s, expected %d' % (name, registry.get(name), expected))
+
+    # -meshBudget sets the budget in megabytes, the entries nobody holds are evicted at 0
+    registry = projectStats('-meshBudget', 0.5, '-meshRegistry')
+    if registry['budget'] != 512 * 1024:
+        failures.append('meshBudget : budget %d, expected %d' % (registry['budget'], 512 * 1024))
+    registry = projectStats('-meshBudget', 0, '-meshRegistry')
+    if (registry['budget'], registry['entries'], registry['evictions']) != (0, 1, 1):
+        failures.append('meshBudget 0 : budget %(budget)d, %(entries)d entries, %(evictions)d evictions' % registry)
+    try:
+        projectStats('-meshBudget', -1)
+        failures.append('meshBudget : a negative budget was accepted')
+    except RuntimeError:
+        pass
+
+    for name in ('projectNode1', 'projectArrayNode1'):
+        OpenMaya.deleteNode(name)
+    plugin.uninitializePlugin(pluginObject)
+    print('projectStats %s' % ('ok' if not failures else '%d failures' % len(failures)))
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
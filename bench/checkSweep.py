@@ -0,0 +1,106 @@
+'''
+Checks that the sweep stops fast sources on a thin surface.
+
+A single quad lies at y=0 and the sources fall through it from one frame to the next, too fast
+for the ray from the source to its target (a little under the source) to see the quad. With
+sweep on, every output has to put the source on the quad : when it falls right away, after it
+rested on frames where nothing changed, on a sub-step and for the rays of an array node that
+fall next to a ray which keeps resting. Without sweep they have to go through, or the check
+proves nothing.
+
+    python bench/checkSweep.py
+'''
+import os
+import sys
+import argparse
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph
+
+kSurface = OpenMaya.MeshData([[-10.0, 0.0, -10.0], [-10.0, 0.0, 10.0], [10.0, 0.0, 10.0], [10.0, 0.0, -10.0]], [[0, 1, 2, 3]])
+kStart = 2.0
+kEnd = -2.0
+kDrop = 0.1
+
+
+def createGraph(nodeClass, rayCount, accelerator, sweep):
+    graph = DependencyGraph(nodeClass, OpenMaya.MDataBlock())
+    graph.rayCount = rayCount
+    graph.setInput(nodeClass.inMesh, {0: kSurface})
+    graph.setInput(nodeClass.direction, 0)
+    graph.setInput(nodeClass.accelerator, accelerator)
+    graph.setInput(nodeClass.sweep, sweep)
+    graph.setInput(nodeClass.value, dict((ray, 1.0) for ray in range(rayCount)) if nodeClass.inputMatrix.array else 1.0)
+    return graph
+
+
+def setFrame(graph, time, heights):
+    # Sources at the given heights, only set when they moved like a static animation curve does
+    nodeClass = graph.nodeClass
+    sources = [translationMatrix((1.0 + ray, height, 1.0)) for ray, height in enumerate(heights)]
+    targets = [translationMatrix((1.0 + ray, height - kDrop, 1.0)) for ray, height in enumerate(heights)]
+    if getattr(graph, 'heights', None) != list(heights):
+        graph.heights = list(heights)
+        if nodeClass.inputMatrix.array:
+            graph.setInput(nodeClass.inputMatrix, dict(enumerate(sources)))
+            graph.setInput(nodeClass.targetMatrix, dict(enumerate(targets)))
+        else:
+            graph.setInput(nodeClass.inputMatrix, sources[0])
+            graph.setInput(nodeClass.targetMatrix, targets[0])
+    graph.setInput(nodeClass.time, OpenMaya.MTime(time))
+    graph.pull(nodeClass.resultVector)
+    if nodeClass.inputMatrix.array:
+        return [graph.block.getValue(nodeClass.resultVector, ray)[1] for ray in range(graph.rayCount)]
+    return [graph.block.getValue(nodeClass.resultVector)[1]]
+
+
+def play(graph, keys):
+    # Heights of the outputs on the last key, keys are (time, heights of the sources)
+    for time, heights in keys:
+        result = setFrame(graph, time, heights)
+    return result
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to check')
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    pluginObject = OpenMaya.MObject('plugin')
+    plugin.initializePlugin(pluginObject)
+
+    # (name, node class, ray count, keys, expected heights with sweep)
+    cases = [
+        ('fall', plugin.project, 1, [(1, [kStart]), (2, [kEnd])], [0.0]),
+        ('fall after a rest', plugin.project, 1, [(1, [kStart]), (2, [kStart]), (3, [kStart]), (4, [kEnd])], [0.0]),
+        ('fall on a sub-step', plugin.project, 1, [(1, [kStart]), (2, [kStart]), (2.5, [kEnd])], [0.0]),
+        ('array with resting rays', plugin.projectArray, 3,
+         [(1, [kStart, kStart, kStart]), (2, [kStart, kStart, kStart]), (3, [kStart, kStart, kStart]), (4, [kEnd, kEnd, kStart])],
+         [0.0, 0.0, kStart - kDrop]),
+    ]
+    failures = []
+    for accelerator, acceleratorName in ((plugin.kAccelBVH, 'bvh'), (plugin.kAccelMayaGrid, 'mayaGrid')):
+        for name, nodeClass, rayCount, keys, expected in cases:
+            swept = play(createGraph(nodeClass, rayCount, accelerator, True), keys)
+            through = play(createGraph(nodeClass, rayCount, accelerator, False), keys)
+            caseFailures = []
+            if not numpy.allclose(swept, expected, atol=1e-6):
+                caseFailures.append('%s %s : the sources end at heights %s, expected %s' % (acceleratorName, name, swept, expected))
+            if not any(height < -1.0 for height in through):
+                caseFailures.append('%s %s : without sweep no source went through the surface (%s)' % (acceleratorName, name, through))
+            print('%-9s %-24s %s' % (acceleratorName, name, 'ok' if not caseFailures else '%d failures' % len(caseFailures)))
+            failures.extend(caseFailures)
+
+    plugin.uninitializePlugin(pluginObject)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
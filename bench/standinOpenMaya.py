@@ -0,0 +1,1334 @@
+'''
+Lightweight stand-in for the parts of maya.api.OpenMaya the project plugin touches.
+
+It is only meant to drive project.compute outside of Maya for benchmarking : the math types
+(MMatrix, MVector, MPoint ...) are plain python, meshes are numpy arrays (MeshData) and the data
+block just stores the values set on the node. install() registers it as maya.api.OpenMaya so
+that the plugin file can be imported unchanged with loadPlugin().
+
+The commands run through executeCommand() against a minimal scene : addNode() names a node
+instance and its data block so MSelectionList finds it, and the plugs read the data block, at
+the time of the current MDGContextGuard for the inputs given as functions of the time.
+'''
+import sys
+import math
+import types
+import importlib.util
+
+import numpy
+
+
+class MSpace(object):
+    kInvalid = 0
+    kTransform = 1
+    kPreTransform = 2
+    kPostTransform = 3
+    kWorld = 4
+    kObject = kPreTransform
+
+
+class MTypeId(object):
+    def __init__(self, typeId=0):
+        self.typeId = typeId
+
+    def id(self):
+        return self.typeId
+
+
+class MObject(object):
+    kNullObj = None
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def isNull(self):
+        return self.name is None
+
+    def __repr__(self):
+        return 'MObject(%r)' % self.name
+
+MObject.kNullObj = MObject()
+
+
+class MObjectHandle(object):
+    def __init__(self, mObject=None):
+        self._object = mObject
+
+    def object(self):
+        return self._object
+
+    def hashCode(self):
+        return id(self._object)
+
+    def isAlive(self):
+        # The handle holds the object, it can not go away
+        return self._object is not None
+
+
+# ---------------------------------------------------------------------------------------------
+# Math types
+
+class MVector(object):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, *args):
+        if len(args) == 1:
+            args = tuple(args[0])[:3]
+        self.x, self.y, self.z = (float(value) for value in (args or (0.0, 0.0, 0.0)))
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z)[index]
+
+    def __len__(self):
+        return 3
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __neg__(self):
+        return type(self)(-self.x, -self.y, -self.z)
+
+    def __mul__(self, other):
+        # Vector * vector is the dot product, vector * scalar scales
+        if isinstance(other, (MVector, MPoint)):
+            return self.x * other.x + self.y * other.y + self.z * other.z
+        return type(self)(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    def __xor__(self, other):
+        return type(self)(self.y * other.z - self.z * other.y,
+                          self.z * other.x - self.x * other.z,
+                          self.x * other.y - self.y * other.x)
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def normal(self):
+        length = self.length()
+        if length == 0.0:
+            return type(self)(self)
+        return type(self)(self.x / length, self.y / length, self.z / length)
+
+    def normalize(self):
+        self.x, self.y, self.z = self.normal()
+        return self
+
+    def __repr__(self):
+        return '%s(%g, %g, %g)' % (type(self).__name__, self.x, self.y, self.z)
+
+
+class MFloatVector(MVector):
+    __slots__ = ()
+
+
+class MPoint(object):
+    __slots__ = ('x', 'y', 'z', 'w')
+
+    def __init__(self, *args):
+        if len(args) == 1:
+            args = tuple(args[0])
+        values = [float(value) for value in args] or [0.0, 0.0, 0.0]
+        self.x, self.y, self.z = values[:3]
+        self.w = values[3] if len(values) > 3 else 1.0
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z, self.w))
+
+    def __getitem__(self, index):
+        return (self.x, self.y, self.z, self.w)[index]
+
+    def __len__(self):
+        return 4
+
+    def __sub__(self, other):
+        if isinstance(other, MPoint):
+            return MVector(self.x - other.x, self.y - other.y, self.z - other.z)
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __add__(self, other):
+        return type(self)(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __repr__(self):
+        return '%s(%g, %g, %g)' % (type(self).__name__, self.x, self.y, self.z)
+
+
+class MFloatPoint(MPoint):
+    __slots__ = ()
+
+    def __sub__(self, other):
+        if isinstance(other, MPoint):
+            return MFloatVector(self.x - other.x, self.y - other.y, self.z - other.z)
+        return type(self)(self.x - other.x, self.y - other.y, self.z - other.z)
+
+
+class MPointArray(list):
+    pass
+
+
+class MFloatPointArray(list):
+    pass
+
+
+class MIntArray(list):
+    pass
+
+
+class MFloatArray(list):
+    pass
+
+
+class MMatrix(object):
+    '''Row major 4x4 matrix using row vectors, like Maya.'''
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        if values is None:
+            self.values = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+        elif isinstance(values, MMatrix):
+            self.values = list(values.values)
+        else:
+            values = list(values)
+            if len(values) == 4:
+                values = [value for row in values for value in row]
+            self.values = [float(value) for value in values]
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        self.values[index] = float(value)
+
+    def __len__(self):
+        return 16
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __mul__(self, other):
+        a = numpy.array(self.values).reshape(4, 4)
+        b = numpy.array(other.values).reshape(4, 4)
+        return MMatrix(numpy.dot(a, b).ravel())
+
+    def __eq__(self, other):
+        return isinstance(other, MMatrix) and self.values == other.values
+
+    def __ne__(self, other):
+        return not self == other
+
+    def getElement(self, row, column):
+        return self.values[row * 4 + column]
+
+    def setElement(self, row, column, value):
+        self.values[row * 4 + column] = float(value)
+
+    def __repr__(self):
+        return 'MMatrix(%r)' % (self.values,)
+
+
+class MEulerRotation(object):
+    kXYZ = 0
+    kYZX = 1
+    kZXY = 2
+    kXZY = 3
+    kYXZ = 4
+    kZYX = 5
+
+    def __init__(self, x=0.0, y=0.0, z=0.0, order=0):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.order = order
+
+
+class MTransformationMatrix(object):
+    def __init__(self, matrix=None):
+        self.matrix = MMatrix(matrix)
+
+    def asMatrix(self):
+        return MMatrix(self.matrix)
+
+    def translation(self, space):
+        return MVector(self.matrix[12], self.matrix[13], self.matrix[14])
+
+    def rotation(self, asQuaternion=False):
+        # Removing the scale of the rows and decomposing the xyz rotate order
+        rows = numpy.array(self.matrix.values).reshape(4, 4)[:3, :3]
+        rows = rows / numpy.linalg.norm(rows, axis=1)[:, None]
+        y = math.asin(max(-1.0, min(1.0, -rows[0, 2])))
+        if abs(rows[0, 2]) < 1.0 - 1e-12:
+            x = math.atan2(rows[1, 2], rows[2, 2])
+            z = math.atan2(rows[0, 1], rows[0, 0])
+        else:
+            x = math.atan2(-rows[2, 1], rows[1, 1])
+            z = 0.0
+        return MEulerRotation(x, y, z)
+
+
+class MTime(object):
+    kSeconds = 1
+    kFilm = 6
+
+    def __init__(self, value=0.0, unit=6):
+        self._value = float(value)
+        self.unit = unit
+
+    @property
+    def value(self):
+        return self._value
+
+    def asUnits(self, unit):
+        return self._value
+
+    @staticmethod
+    def uiUnit():
+        return MTime.kFilm
+
+
+# ---------------------------------------------------------------------------------------------
+# Mesh data
+
+class MeshData(MObject):
+    '''Stand-in for mesh data : world space points and a list of polygons (vertex index lists).'''
+
+    def __init__(self, points, polygons):
+        MObject.__init__(self, 'mesh')
+        self.points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        self.polygons = [list(polygon) for polygon in polygons]
+        self._triangles = None
+        # Number of times the cached grid of this data was freed
+        self.gridFrees = 0
+
+    def triangles(self):
+        # Fan triangulation of every polygon, like the default triangulation of a convex face
+        if self._triangles is None:
+            counts = []
+            vertices = []
+            for polygon in self.polygons:
+                counts.append(len(polygon) - 2)
+                for corner in range(1, len(polygon) - 1):
+                    vertices.extend((polygon[0], polygon[corner], polygon[corner + 1]))
+            self._triangles = (counts, vertices)
+        return self._triangles
+
+    def deformed(self, offsets):
+        '''Copy of the mesh with the same topology and moved points.'''
+        mesh = MeshData(self.points + offsets, [])
+        mesh.polygons = self.polygons
+        mesh._triangles = self._triangles
+        return mesh
+
+
+def gridMesh(resolution, size=100.0, height=0.0, seed=0):
+    '''Builds a terrain like grid of resolution x resolution quads (2 triangles each).'''
+    random = numpy.random.RandomState(seed)
+    axis = numpy.linspace(-size * 0.5, size * 0.5, resolution + 1)
+    xs, zs = numpy.meshgrid(axis, axis)
+    ys = height * (numpy.sin(xs * 0.15) * numpy.cos(zs * 0.11)) + random.uniform(-0.05, 0.05, xs.shape) * height
+    points = numpy.stack((xs.ravel(), ys.ravel(), zs.ravel()), axis=1)
+    row = numpy.arange(resolution)
+    corners = (row[:, None] * (resolution + 1) + row[None, :]).ravel()
+    polygons = numpy.stack((corners, corners + resolution + 1, corners + resolution + 2, corners + 1), axis=1)
+    return MeshData(points, polygons.tolist())
+
+
+class MDagPath(object):
+    '''Path to a mesh shape : its mesh data (node()) under a world matrix (inclusiveMatrix()).'''
+
+    def __init__(self, meshObject=None, matrix=None):
+        self._node = meshObject
+        self._matrix = MMatrix(matrix)
+        self._worldMesh = None
+
+    def node(self):
+        return self._node
+
+    def inclusiveMatrix(self):
+        return MMatrix(self._matrix)
+
+    def worldMesh(self):
+        # The mesh data with its points in world space, what MFnMesh reads through the path
+        if self._worldMesh is None:
+            matrix = numpy.array(self._matrix.values).reshape(4, 4)
+            self._worldMesh = self._node.deformed(0.0)
+            self._worldMesh.points = numpy.dot(self._node.points, matrix[:3, :3]) + matrix[3, :3]
+        return self._worldMesh
+
+
+class MFnMesh(object):
+    def __init__(self, meshObject=None):
+        # Through a dag path every query is in world space, whatever space is asked for
+        self.meshObject = meshObject.worldMesh() if isinstance(meshObject, MDagPath) else meshObject
+
+    @property
+    def numVertices(self):
+        return len(self.meshObject.points)
+
+    @property
+    def numPolygons(self):
+        return len(self.meshObject.polygons)
+
+    @property
+    def numFaceVertices(self):
+        return sum(len(polygon) for polygon in self.meshObject.polygons)
+
+    def getPoints(self, space=MSpace.kObject):
+        return [MPoint(point) for point in self.meshObject.points]
+
+    def getFloatPoints(self, space=MSpace.kObject):
+        return [MFloatPoint(point) for point in self.meshObject.points]
+
+    def getTriangles(self):
+        return self.meshObject.triangles()
+
+    def getPolygonVertices(self, polygonId):
+        return list(self.meshObject.polygons[polygonId])
+
+    def getPolygonNormal(self, polygonId, space=MSpace.kObject):
+        # Newell normal of the polygon
+        corners = self.meshObject.points[self.meshObject.polygons[polygonId]]
+        following = numpy.roll(corners, -1, axis=0)
+        normal = numpy.cross(corners, following).sum(axis=0)
+        return MVector(normal / numpy.linalg.norm(normal))
+
+    def allIntersections(self, raySource, rayDirection, space, maxParam, testBothDirections,
+                         faceIds=None, triIds=None, idsSorted=False, accelParams=None, tolerance=1e-6):
+        # Brute force test against every triangle, this is what the baseline plugin costs
+        counts, vertices = self.meshObject.triangles()
+        corners = self.meshObject.points[numpy.array(vertices, dtype=numpy.int64).reshape(-1, 3)]
+        faces = numpy.repeat(numpy.arange(len(counts)), counts)
+        triangles = numpy.arange(len(faces)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        origin = numpy.array([raySource.x, raySource.y, raySource.z])
+        direction = numpy.array([rayDirection.x, rayDirection.y, rayDirection.z])
+        e1 = corners[:, 1] - corners[:, 0]
+        e2 = corners[:, 2] - corners[:, 0]
+        pvec = numpy.cross(direction, e2)
+        det = (e1 * pvec).sum(axis=1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            invDet = 1.0 / det
+            tvec = origin - corners[:, 0]
+            u = (tvec * pvec).sum(axis=1) * invDet
+            qvec = numpy.cross(tvec, e1)
+            v = (direction * qvec).sum(axis=1) * invDet
+            t = (e2 * qvec).sum(axis=1) * invDet
+        hit = (numpy.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t <= maxParam)
+        hit &= (t >= -maxParam) if testBothDirections else (t >= 0)
+        hits = numpy.flatnonzero(hit)
+        points = [MFloatPoint(origin + t[index] * direction) for index in hits]
+        return (points, [float(t[index]) for index in hits], [int(faces[index]) for index in hits],
+                [int(triangles[index]) for index in hits], [float(u[index]) for index in hits],
+                [float(v[index]) for index in hits])
+
+    def closestIntersection(self, raySource, rayDirection, space, maxParam, testBothDirections,
+                            faceIds=None, triIds=None, idsSorted=False, accelParams=None, tolerance=1e-6):
+        # Nearest of the brute force hits, a face of -1 when nothing is hit
+        points, params, faces, triangles, bary1, bary2 = self.allIntersections(
+            raySource, rayDirection, space, maxParam, testBothDirections, faceIds, triIds, idsSorted, accelParams, tolerance)
+        if not params:
+            return MFloatPoint(), 0.0, -1, -1, 0.0, 0.0
+        nearest = int(numpy.argmin(numpy.abs(params)))
+        return points[nearest], params[nearest], faces[nearest], triangles[nearest], bary1[nearest], bary2[nearest]
+
+    def autoUniformGridParams(self):
+        return MMeshIsectAccelParams()
+
+    def freeCachedIntersectionAccelerator(self):
+        self.meshObject.gridFrees += 1
+
+
+class MMeshIsectAccelParams(object):
+    pass
+
+
+class MPointOnMesh(object):
+    def __init__(self, point, face, triangle, barycentricCoords):
+        self.point = point
+        self.face = face
+        self.triangle = triangle
+        self.barycentricCoords = barycentricCoords
+
+
+class MMeshIntersector(object):
+    '''Brute force closest point queries, the triangle math comes from projectCore.'''
+
+    def __init__(self):
+        self.meshObject = None
+
+    def create(self, meshObject, matrix=None):
+        # Only mesh data, the query points are moved into its space by the inverse of the matrix
+        # and the closest points come back in that space, like Maya does
+        if not isinstance(meshObject, MeshData):
+            raise RuntimeError('MMeshIntersector.create needs a mesh object, got %r' % (meshObject,))
+        self.meshObject = meshObject
+        self.matrix = numpy.array(MMatrix(matrix).values).reshape(4, 4)
+
+    @property
+    def isCreated(self):
+        return self.meshObject is not None
+
+    def getClosestPoint(self, point, maxDistance=sys.float_info.max):
+        import projectCore
+
+        counts, vertices = self.meshObject.triangles()
+        corners = self.meshObject.points[numpy.array(vertices, dtype=numpy.int64).reshape(-1, 3)]
+        faces = numpy.repeat(numpy.arange(len(counts)), counts)
+        triangles = numpy.arange(len(faces)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        origin = numpy.dot(numpy.array([point.x, point.y, point.z, 1.0]), numpy.linalg.inv(self.matrix))[:3]
+        e1 = corners[:, 1] - corners[:, 0]
+        e2 = corners[:, 2] - corners[:, 0]
+        squared, u, v = projectCore.closestPointsOnTriangles(corners[:, 0], e1, e2, numpy.tile(origin, (len(corners), 1)))
+        nearest = int(numpy.argmin(squared))
+        if squared[nearest] > maxDistance * maxDistance:
+            raise RuntimeError('No point of the mesh within %g' % maxDistance)
+        closest = corners[nearest, 0] + u[nearest] * e1[nearest] + v[nearest] * e2[nearest]
+        return MPointOnMesh(MPoint(closest), int(faces[nearest]), int(triangles[nearest]), (float(u[nearest]), float(v[nearest])))
+
+
+# ---------------------------------------------------------------------------------------------
+# Attributes
+
+class MFnData(object):
+    kInvalid = 0
+    kNumeric = 1
+    kPlugin = 2
+    kString = 4
+    kMatrix = 5
+    kMesh = 13
+
+
+class MFnNumericData(object):
+    kInvalid = 0
+    kBoolean = 1
+    kByte = 2
+    kChar = 3
+    kShort = 4
+    k2Short = 5
+    k3Short = 6
+    kLong = 7
+    kInt = 7
+    k2Long = 8
+    k3Long = 9
+    kFloat = 11
+    k2Float = 12
+    k3Float = 13
+    kDouble = 14
+    k2Double = 15
+    k3Double = 16
+
+
+class Attribute(MObject):
+    '''Attribute MObject remembering the flags set through the attribute function sets.'''
+
+    def __init__(self, longName, shortName, kind, default=None):
+        MObject.__init__(self, longName)
+        self.shortName = shortName
+        self.kind = kind
+        self.default = default
+        self.array = False
+        self.children = []
+        self.parent = None
+        self.flags = {}
+
+
+class MFnAttribute(object):
+    _flagNames = ('readable', 'writable', 'storable', 'keyable', 'hidden', 'connectable', 'array',
+                  'usesArrayDataBuilder', 'indexMatters', 'cached', 'channelBox', 'affectsAppearance')
+
+    def __init__(self, attribute=None):
+        object.__setattr__(self, 'attribute', attribute)
+
+    def __setattr__(self, name, value):
+        if name in self._flagNames:
+            if name == 'array':
+                self.attribute.array = bool(value)
+            self.attribute.flags[name] = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        if name in MFnAttribute._flagNames:
+            return self.attribute.flags.get(name, name == 'array' and self.attribute.array)
+        raise AttributeError(name)
+
+    def _create(self, longName, shortName, kind, default=None):
+        attribute = Attribute(longName, shortName, kind, default)
+        object.__setattr__(self, 'attribute', attribute)
+        return attribute
+
+
+class MFnNumericAttribute(MFnAttribute):
+    def create(self, longName, shortName, numericType, default=0.0):
+        if numericType in (MFnNumericData.k3Float, MFnNumericData.k3Double):
+            attribute = self._create(longName, shortName, numericType, (default, default, default))
+            for axis in 'XYZ':
+                child = Attribute(longName + axis, shortName + axis, MFnNumericData.kFloat, default)
+                child.parent = attribute
+                attribute.children.append(child)
+            return attribute
+        return self._create(longName, shortName, numericType, default)
+
+    def setMin(self, value):
+        self.attribute.flags['min'] = value
+
+    def setMax(self, value):
+        self.attribute.flags['max'] = value
+
+
+class MFnMatrixAttribute(MFnAttribute):
+    kFloat = 0
+    kDouble = 1
+
+    def create(self, longName, shortName, matrixType=1):
+        return self._create(longName, shortName, MFnData.kMatrix, MMatrix())
+
+
+class MFnTypedAttribute(MFnAttribute):
+    def create(self, longName, shortName, dataType, default=None):
+        return self._create(longName, shortName, dataType, MObject())
+
+
+class MFnEnumAttribute(MFnAttribute):
+    def create(self, longName, shortName, default=0):
+        attribute = self._create(longName, shortName, MFnNumericData.kShort, default)
+        attribute.fields = {}
+        return attribute
+
+    def addField(self, name, value):
+        self.attribute.fields[name] = value
+
+
+class MFnUnitAttribute(MFnAttribute):
+    kInvalid = 0
+    kAngle = 1
+    kDistance = 2
+    kTime = 3
+
+    def create(self, longName, shortName, unitType, default=0.0):
+        if unitType == MFnUnitAttribute.kTime and not isinstance(default, MTime):
+            default = MTime(default)
+        return self._create(longName, shortName, unitType, default)
+
+
+class MFnMatrixData(object):
+    def __init__(self, matrixObject=None):
+        self._matrix = getattr(matrixObject, 'matrix', MMatrix())
+
+    def create(self, matrix):
+        self._matrix = MMatrix(matrix)
+        data = MObject('matrixData')
+        data.matrix = self._matrix
+        return data
+
+    def matrix(self):
+        return self._matrix
+
+    def transformation(self):
+        return MTransformationMatrix(self._matrix)
+
+
+# ---------------------------------------------------------------------------------------------
+# Node, plugs and data block
+
+class MPlug(object):
+    def __init__(self, node=None, attribute=None, logicalIndex=None):
+        self._node = node
+        self._attribute = attribute
+        self._logicalIndex = logicalIndex
+        self._parentPlug = None
+
+    def attribute(self):
+        return self._attribute
+
+    def node(self):
+        return self._node
+
+    @property
+    def isChild(self):
+        return self._parentPlug is not None
+
+    @property
+    def isElement(self):
+        return self._logicalIndex is not None
+
+    @property
+    def isArray(self):
+        return self._attribute.array and self._logicalIndex is None
+
+    def parent(self):
+        return self._parentPlug
+
+    def array(self):
+        return MPlug(self._node, self._attribute)
+
+    def logicalIndex(self):
+        return self._logicalIndex
+
+    def elementByLogicalIndex(self, index):
+        return MPlug(self._node, self._attribute, index)
+
+    # Values, read from the data block of the node (addNode) at the time of the current context
+
+    def _value(self):
+        return self._node.dataBlock.valueAt(self._attribute, self._logicalIndex, contextTime())
+
+    def asShort(self):
+        return int(self._value())
+
+    asInt = asShort
+
+    def asDouble(self):
+        return float(self._value())
+
+    asFloat = asDouble
+
+    def asBool(self):
+        return bool(self._value())
+
+    def asMTime(self):
+        value = self._value()
+        return value if isinstance(value, MTime) else MTime(value)
+
+    def asMObject(self):
+        value = self._value()
+        if isinstance(value, MMatrix):
+            return MFnMatrixData().create(value)
+        return value if isinstance(value, MObject) else MObject()
+
+    def evaluateNumElements(self):
+        return len(self._elements())
+
+    def elementByPhysicalIndex(self, index):
+        return MPlug(self._node, self._attribute, self._elements()[index])
+
+    def _elements(self):
+        return sorted(self._node.dataBlock.valueAt(self._attribute, None, contextTime()) or {})
+
+    @property
+    def isDestination(self):
+        return self._attribute in self._node.dataBlock.connections
+
+    def child(self, index):
+        plug = MPlug(self._node, self._attribute.children[index])
+        plug._parentPlug = self
+        return plug
+
+    def __eq__(self, other):
+        if isinstance(other, MPlug):
+            return (self._attribute is other._attribute and self._logicalIndex == other._logicalIndex
+                    and self._parentPlug == other._parentPlug)
+        return self._attribute is other and self._logicalIndex is None and self._parentPlug is None
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._attribute), self._logicalIndex))
+
+    def __repr__(self):
+        index = '' if self._logicalIndex is None else '[%d]' % self._logicalIndex
+        return 'MPlug(%s%s)' % (self._attribute.name, index)
+
+
+class MPlugArray(list):
+    pass
+
+
+class MDataHandle(object):
+    def __init__(self, block, attribute, index=None):
+        self.block = block
+        self.attribute = attribute
+        self.index = index
+
+    def _get(self):
+        return self.block.getValue(self.attribute, self.index)
+
+    def _set(self, value):
+        self.block.setValue(self.attribute, value, self.index)
+
+    def asMatrix(self):
+        return MMatrix(self._get())
+
+    def asFloat(self):
+        return float(self._get())
+
+    asDouble = asFloat
+
+    def asInt(self):
+        return int(self._get())
+
+    asShort = asInt
+    asLong = asInt
+
+    def asBool(self):
+        return bool(self._get())
+
+    def asTime(self):
+        value = self._get()
+        return value if isinstance(value, MTime) else MTime(value)
+
+    def asMesh(self):
+        value = self._get()
+        return value if value is not None else MObject()
+
+    def asFloat3(self):
+        return tuple(self._get())
+
+    def set3Float(self, x, y, z):
+        self._set((float(x), float(y), float(z)))
+
+    def setFloat(self, value):
+        self._set(float(value))
+
+    setDouble = setFloat
+
+    def setInt(self, value):
+        self._set(int(value))
+
+    def setBool(self, value):
+        self._set(bool(value))
+
+    def setMMatrix(self, value):
+        self._set(MMatrix(value))
+
+    def setClean(self):
+        pass
+
+
+class MArrayDataBuilder(object):
+    def __init__(self, block, attribute, numElements=0):
+        self.block = block
+        self.attribute = attribute
+        self.values = {}
+
+    def addElement(self, index):
+        self.values.setdefault(index, None)
+        return _BuilderHandle(self, index)
+
+
+class _BuilderHandle(MDataHandle):
+    def __init__(self, builder, index):
+        MDataHandle.__init__(self, builder.block, builder.attribute, index)
+        self.builder = builder
+
+    def _set(self, value):
+        self.builder.values[self.index] = value
+
+
+class MArrayDataHandle(object):
+    def __init__(self, block, attribute):
+        self.block = block
+        self.attribute = attribute
+        self.indices = sorted(block.getArray(attribute))
+        self.position = 0
+
+    def __len__(self):
+        return len(self.indices)
+
+    def jumpToPhysicalElement(self, position):
+        self.position = position
+
+    def jumpToLogicalElement(self, index):
+        self.position = self.indices.index(index)
+
+    def elementLogicalIndex(self):
+        return self.indices[self.position]
+
+    def inputValue(self):
+        return MDataHandle(self.block, self.attribute, self.indices[self.position])
+
+    outputValue = inputValue
+
+    def builder(self):
+        # Like Maya, the builder of an array handle starts with the elements already there
+        builder = MArrayDataBuilder(self.block, self.attribute)
+        builder.values = dict(self.block.getArray(self.attribute))
+        return builder
+
+    def set(self, builder):
+        self.block.values[self.attribute] = dict(builder.values)
+        self.indices = sorted(builder.values)
+
+    def setAllClean(self):
+        pass
+
+
+class MDataBlock(object):
+    '''Stores the attribute values of one node, array attributes are dicts keyed by logical index.'''
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.cleaned = []
+        # Functions of the time giving the values of the animated inputs, read by the plugs
+        # evaluated in a time context (getAttr -time, MDGContextGuard)
+        self.animated = {}
+        # Attributes driven by a connection (MDGModifier.connect)
+        self.connections = set()
+        # Time of the context compute is evaluated in, None for the normal context
+        self.contextTime = None
+
+    def valueAt(self, attribute, index=None, time=None):
+        # Value of an attribute at the given time, the current value for None
+        if time is not None and attribute in self.animated:
+            value = self.animated[attribute](time)
+            return value if index is None else value.get(index, attribute.default)
+        return self.getValue(attribute, index)
+
+    def getValue(self, attribute, index=None):
+        if index is not None:
+            return self.values.get(attribute, {}).get(index, attribute.default)
+        return self.values.get(attribute, attribute.default)
+
+    def setValue(self, attribute, value, index=None):
+        if index is not None:
+            self.values.setdefault(attribute, {})[index] = value
+        else:
+            self.values[attribute] = value
+
+    def getArray(self, attribute):
+        return self.values.get(attribute, {})
+
+    def inputValue(self, attribute):
+        if isinstance(attribute, MPlug):
+            return MDataHandle(self, attribute.attribute(), attribute.logicalIndex())
+        return MDataHandle(self, attribute)
+
+    outputValue = inputValue
+
+    def inputArrayValue(self, attribute):
+        return MArrayDataHandle(self, attribute)
+
+    outputArrayValue = inputArrayValue
+
+    def setClean(self, plug):
+        self.cleaned.append(plug)
+
+    def context(self):
+        return MDGContext(None if self.contextTime is None else MTime(self.contextTime))
+
+
+class MDGContext(object):
+    kNormal = None
+
+    def __init__(self, time=None):
+        self.time = time
+
+    def isNormal(self):
+        return self.time is None
+
+    def getTime(self):
+        return self.time if self.time is not None else MTime()
+
+MDGContext.kNormal = MDGContext()
+
+contextStack = []
+
+
+def contextTime():
+    # Time the plugs are read at : the one of the innermost MDGContextGuard, None in the normal context
+    context = contextStack[-1] if contextStack else MDGContext.kNormal
+    if context.time is None:
+        return None
+    return context.time.value if isinstance(context.time, MTime) else float(context.time)
+
+
+class MDGContextGuard(object):
+    '''Makes the given context current until the guard is deleted.'''
+
+    def __init__(self, context):
+        contextStack.append(context)
+        self.context = context
+
+    def __del__(self):
+        if self.context in contextStack:
+            contextStack.remove(self.context)
+
+
+class MPxNode(object):
+    '''
+    Base node. addAttribute and attributeAffects record the node layout on the class being
+    initialized so the harness can work out which plugs an input change dirties.
+    '''
+    kDependNode = 0
+    kSerial = 0
+    kParallel = 1
+    kGloballySerial = 2
+    kUntrusted = 3
+
+    def __init__(self):
+        self._thisMObject = MObject('node')
+        self._thisMObject.userNode = self
+
+    def thisMObject(self):
+        return self._thisMObject
+
+    def postConstructor(self):
+        pass
+
+    def compute(self, plug, dataBlock):
+        return None
+
+    def setDependentsDirty(self, plug, plugArray):
+        return None
+
+    def schedulingType(self):
+        return MPxNode.kSerial
+
+    @classmethod
+    def addAttribute(cls, attribute):
+        if '_attributes' not in cls.__dict__:
+            cls._attributes = []
+            cls._affects = {}
+        cls._attributes.append(attribute)
+
+    @classmethod
+    def attributeAffects(cls, whenChanges, isAffected):
+        cls._affects.setdefault(whenChanges, []).append(isAffected)
+
+    @classmethod
+    def affectedBy(cls, attribute):
+        '''Attributes dirtied when the given input attribute changes.'''
+        return list(cls.__dict__.get('_affects', {}).get(attribute, []))
+
+
+class MFnDependencyNode(object):
+    def __init__(self, mobject=None):
+        self.mobject = mobject
+
+    def userNode(self):
+        return getattr(self.mobject, 'userNode', None)
+
+    def name(self):
+        return self.mobject.name
+
+    @property
+    def typeName(self):
+        return getattr(self.mobject, 'typeName', '')
+
+    def findPlug(self, name, wantNetworkedPlug=True):
+        attributes = getattr(self.mobject, 'attributes', None)
+        if attributes is None:
+            attributes = dict((attribute.name, attribute) for attribute in vars(type(self.userNode())).values() if isinstance(attribute, Attribute))
+        if name not in attributes:
+            raise RuntimeError('%s has no attribute %s' % (self.name(), name))
+        return MPlug(self.mobject, attributes[name])
+
+
+# ---------------------------------------------------------------------------------------------
+# Scene : named nodes the commands can find, connections, commands and undo
+
+sceneNodes = {}
+
+
+def addNode(name, node, block, typeName):
+    '''Names a node instance and its data block, like creating the node in a scene.'''
+    mobject = node.thisMObject()
+    mobject.name = name
+    mobject.dataBlock = block
+    mobject.typeName = typeName
+    sceneNodes[name] = mobject
+    return mobject
+
+
+def deleteNode(name):
+    mobject = sceneNodes.pop(name)
+    MDGMessage.removeNode(mobject, mobject.typeName)
+
+
+def addMesh(name, meshObject, matrix=None):
+    '''Names a mesh shape with its data in object space under the given world matrix.'''
+    dagPath = MDagPath(meshObject, matrix)
+    sceneNodes[name] = dagPath
+    return dagPath
+
+
+def addTimeNode():
+    # time1, the outTime the bake connects to the time attribute of the nodes
+    mobject = MObject('time1')
+    mobject.typeName = 'time'
+    mobject.attributes = {'outTime': Attribute('outTime', 'o', MFnUnitAttribute.kTime, MTime())}
+    mobject.dataBlock = MDataBlock()
+    sceneNodes['time1'] = mobject
+    return mobject
+
+addTimeNode()
+
+
+class MFn(object):
+    kInvalid = 0
+    kPluginDependNode = 449
+    kMesh = 296
+
+
+class MItDependencyNodes(object):
+    def __init__(self, filterType=MFn.kInvalid):
+        self.nodes = [mobject for mobject in sceneNodes.values() if getattr(mobject, 'userNode', None) is not None]
+        self.position = 0
+
+    def isDone(self):
+        return self.position >= len(self.nodes)
+
+    def thisNode(self):
+        return self.nodes[self.position]
+
+    def next(self):
+        self.position += 1
+
+
+class MSelectionList(object):
+    def __init__(self):
+        self.items = []
+
+    def add(self, name):
+        if name not in sceneNodes:
+            raise RuntimeError('No object matches name: %s' % name)
+        self.items.append(sceneNodes[name])
+        return self
+
+    def length(self):
+        return len(self.items)
+
+    def getDependNode(self, index):
+        return self.items[index]
+
+    def getDagPath(self, index):
+        if not isinstance(self.items[index], MDagPath):
+            raise RuntimeError('(kInvalidParameter): Object is incompatible with this method')
+        return self.items[index]
+
+
+class MDGModifier(object):
+    def __init__(self):
+        self.connections = []
+
+    def connect(self, source, destination):
+        self.connections.append((source, destination))
+
+    def doIt(self):
+        for source, destination in self.connections:
+            destination.node().dataBlock.connections.add(destination.attribute())
+
+    def undoIt(self):
+        for source, destination in self.connections:
+            destination.node().dataBlock.connections.discard(destination.attribute())
+
+
+class MMessage(object):
+    @staticmethod
+    def removeCallbacks(ids):
+        for callbackId in ids:
+            MDGMessage.callbacks.pop(callbackId, None)
+
+
+class MDGMessage(object):
+    '''
+    Node removed callbacks only. There is no scene to delete nodes from, the harness calls
+    removeNode() with the node and its type name where Maya would delete it.
+    '''
+    callbacks = {}
+    nextId = 0
+
+    @staticmethod
+    def addNodeRemovedCallback(function, nodeType='dependNode', clientData=None):
+        MDGMessage.nextId += 1
+        MDGMessage.callbacks[MDGMessage.nextId] = (function, nodeType, clientData)
+        return MDGMessage.nextId
+
+    @staticmethod
+    def removeNode(node, nodeType):
+        for function, callbackType, clientData in list(MDGMessage.callbacks.values()):
+            if callbackType in (nodeType, 'dependNode'):
+                function(node, clientData)
+
+
+class MSyntax(object):
+    kNoArg = 1
+    kBoolean = 2
+    kLong = 3
+    kDouble = 4
+    kString = 5
+    kNone = 1
+    kStringObjects = 1
+    kSelectionList = 2
+
+    def __init__(self):
+        self.flags = {}
+        self.objectRange = (0, None)
+
+    def addFlag(self, shortName, longName, *argumentTypes):
+        flag = (shortName, longName, [argumentType for argumentType in argumentTypes if argumentType != MSyntax.kNoArg])
+        self.flags[shortName] = self.flags[longName] = flag
+
+    def setObjectType(self, objectType, minimum=0, maximum=None):
+        self.objectRange = (minimum, maximum)
+
+
+class MArgList(list):
+    pass
+
+
+class MArgDatabase(object):
+    '''Parses a list of command arguments (strings) against the flags of an MSyntax.'''
+
+    def __init__(self, syntax, args):
+        self.values = {}
+        self.objects = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg in syntax.flags:
+                shortName, longName, argumentTypes = syntax.flags[arg]
+                if len(args) < len(argumentTypes):
+                    raise RuntimeError('Flag %s needs %d arguments' % (arg, len(argumentTypes)))
+                self.values[shortName] = [self.convert(argumentType, args.pop(0)) for argumentType in argumentTypes]
+            elif isinstance(arg, str) and arg.startswith('-') and not self.isNumber(arg):
+                raise RuntimeError('Invalid flag: %s' % arg)
+            else:
+                self.objects.append(arg)
+        minimum, maximum = syntax.objectRange
+        if len(self.objects) < minimum or (maximum is not None and len(self.objects) > maximum):
+            raise RuntimeError('Wrong number of objects: %d' % len(self.objects))
+        self.syntax = syntax
+
+    @staticmethod
+    def isNumber(arg):
+        try:
+            float(arg)
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def convert(argumentType, value):
+        if argumentType == MSyntax.kBoolean:
+            return str(value).lower() in ('1', 'true', 'on', 'yes')
+        if argumentType == MSyntax.kLong:
+            return int(value)
+        if argumentType == MSyntax.kDouble:
+            return float(value)
+        return str(value)
+
+    def isFlagSet(self, name):
+        return name in self.syntax.flags and self.syntax.flags[name][0] in self.values
+
+    def flagArgument(self, name, index):
+        return self.values[self.syntax.flags[name][0]][index]
+
+    flagArgumentBool = flagArgument
+    flagArgumentInt = flagArgument
+    flagArgumentDouble = flagArgument
+    flagArgumentString = flagArgument
+
+    def getObjectStrings(self):
+        return [str(name) for name in self.objects]
+
+
+class MPxCommand(object):
+    def __init__(self):
+        self._result = None
+        self._syntax = MSyntax()
+
+    def syntax(self):
+        return self._syntax
+
+    def isUndoable(self):
+        return False
+
+    def setResult(self, value):
+        self._result = value
+
+    @staticmethod
+    def clearResult():
+        pass
+
+
+class MFnPlugin(object):
+    def __init__(self, mobject=None, vendor='', version='', apiVersion='Any'):
+        self.nodes = {}
+        self.commands = {}
+
+    def registerNode(self, name, typeId, creator, initializer, nodeType=MPxNode.kDependNode, classification=None):
+        initializer()
+        self.nodes[name] = (typeId, creator)
+
+    def deregisterNode(self, typeId):
+        pass
+
+    def registerCommand(self, name, creator, syntaxCreator=None):
+        self.commands[name] = creator
+        commands[name] = (creator, syntaxCreator)
+
+    def deregisterCommand(self, name):
+        commands.pop(name, None)
+
+
+# Commands registered by the plugins and the undo queue of executeCommand
+commands = {}
+undoQueue = []
+
+
+def executeCommand(name, *args):
+    '''Runs a registered command like the script editor would, returns its result.'''
+    if name not in commands:
+        raise RuntimeError('Cannot find procedure "%s"' % name)
+    creator, syntaxCreator = commands[name]
+    command = creator()
+    if syntaxCreator is not None:
+        command._syntax = syntaxCreator()
+    command.doIt(MArgList(str(arg) for arg in args))
+    if command.isUndoable():
+        undoQueue.append(command)
+    return command._result
+
+
+def undo():
+    undoQueue.pop().undoIt()
+
+
+class MAnimControl(object):
+    '''Playback range of maya.api.OpenMayaAnim.'''
+    playbackRange = (MTime(1.0), MTime(24.0))
+
+    @staticmethod
+    def minTime():
+        return MAnimControl.playbackRange[0]
+
+    @staticmethod
+    def maxTime():
+        return MAnimControl.playbackRange[1]
+
+    @staticmethod
+    def setMinMaxTime(minTime, maxTime):
+        MAnimControl.playbackRange = (minTime, maxTime)
+
+
+def install():
+    '''Registers this module as maya.api.OpenMaya (and its parent packages).'''
+    module = sys.modules[__name__]
+    maya = sys.modules.get('maya') or types.ModuleType('maya')
+    api = sys.modules.get('maya.api') or types.ModuleType('maya.api')
+    anim = sys.modules.get('maya.api.OpenMayaAnim') or types.ModuleType('maya.api.OpenMayaAnim')
+    anim.MAnimControl = MAnimControl
+    maya.api = api
+    api.OpenMaya = module
+    api.OpenMayaAnim = anim
+    sys.modules['maya'] = maya
+    sys.modules['maya.api'] = api
+    sys.modules['maya.api.OpenMaya'] = module
+    sys.modules['maya.api.OpenMayaAnim'] = anim
+    return module
+
+
+def loadPlugin(path, name='projectPlugin'):
+    '''Imports a plugin file (the file names have dots in them) against the stand-in.'''
+    install()
+    spec = importlib.util.spec_from_file_location(name, path)
+    plugin = importlib.util.module_from_spec(spec)
+    sys.modules[name] = plugin
+    spec.loader.exec_module(plugin)
+    return plugin
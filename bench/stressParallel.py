@@ -0,0 +1,239 @@
+'''
+Stress test of the project nodes under parallel evaluation, outside of Maya.
+
+A scene of thousands of projectNode and projectArrayNode instances sharing a few animated meshes
+is played over a number of frames twice : once evaluating every node in turn on the calling
+thread, once with a stand-in of the parallel scheduler running the nodes on a pool of threads.
+Every output of every node on every frame has to be the same bit for bit in both runs.
+
+The scheduler dirties the changed inputs of every node on the main thread (like the dirty
+propagation of a frame change), then evaluates the nodes on the pool. In the node mode a node
+is one task pulling all its outputs, like the evaluation manager does. In the plug mode every
+output is its own task, so the outputs of one node are pulled from several threads at once,
+which is more than Maya ever does to a kParallel node.
+
+With --context the parallel run also evaluates every node at the frame before in a time context
+(its own data block, like getAttr -time or a background evaluation), at the same time as the
+normal evaluations. The normal outputs still have to match the serial run, the ones of the
+context have to match a new node evaluating the same inputs.
+
+    python bench/stressParallel.py
+    python bench/stressParallel.py --nodes 5000 --frames 6 --threads 32 --mode plug
+    python bench/stressParallel.py --nodes 500 --context
+'''
+import os
+import sys
+import time
+import argparse
+from concurrent import futures
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import standinOpenMaya as OpenMaya
+from benchProject import kDefaultPlugin, translationMatrix
+from checkDependencies import DependencyGraph, kRayOutputs
+
+
+def sceneMeshes(frame, seed=0):
+    # A static terrain, a deforming one and a wall moving along x, shared by all the nodes
+    terrain = OpenMaya.gridMesh(16, size=40.0, height=2.0, seed=seed)
+    wave = OpenMaya.gridMesh(12, size=40.0, height=1.0, seed=seed + 1)
+    wave = wave.deformed(numpy.tile([0.0, 0.3 * numpy.sin(0.7 * frame) - 1.5, 0.0], (len(wave.points), 1)))
+    wall = OpenMaya.MeshData(numpy.array([[0.0, -2.0, -20.0], [0.0, -2.0, 20.0], [0.0, 8.0, 20.0], [0.0, 8.0, -20.0]]) + [frame * 0.5 - 2.0, 0.0, 0.0],
+                             [[0, 1, 2, 3]])
+    return terrain, wave, wall
+
+
+class SceneNode(object):
+    '''One node of the scene : its dependency graph, its settings and how its rays move.'''
+
+    def __init__(self, plugin, index, random):
+        self.nodeClass = plugin.projectArray if index % 4 == 0 else plugin.project
+        self.graph = DependencyGraph(self.nodeClass, OpenMaya.MDataBlock())
+        self.rayCount = random.randint(2, 9) if self.isArray else 1
+        self.starts = numpy.column_stack((random.uniform(-22, 22, self.rayCount), random.uniform(1, 8, self.rayCount),
+                                          random.uniform(-22, 22, self.rayCount)))
+        self.velocity = random.uniform(-1.5, 1.5, (1, 3)) * [1.0, 0.2, 1.0]
+        self.drop = random.uniform(6, 14)
+        self.meshes = sorted(random.choice(3, random.randint(1, 4), replace=True).tolist())
+        self.settings = {
+            'direction': int(random.randint(0, 3)),
+            'rotateOrder': int(random.randint(0, 6)),
+            'warmStart': bool(random.randint(0, 2)),
+            'missMode': int(random.randint(0, 2)),
+            'maxDistance': float(random.choice([0.0, 3.0])),
+            'accelerator': int(random.rand() < 0.05),
+            'sweep': bool(random.randint(0, 2)),
+            'normalMode': int(random.randint(0, 2)),
+        }
+
+    @property
+    def isArray(self):
+        return bool(self.nodeClass.inputMatrix.array)
+
+    def frameInputs(self, frame, meshes):
+        # (attribute, value) of the inputs changing with the frame
+        sources = self.starts + self.velocity * frame
+        targets = sources - [0.0, self.drop, 0.0]
+        return [(self.nodeClass.inMesh, dict((index, meshes[mesh]) for index, mesh in enumerate(self.meshes))),
+                (self.nodeClass.inputMatrix, self.arrayValue([translationMatrix(source) for source in sources])),
+                (self.nodeClass.targetMatrix, self.arrayValue([translationMatrix(target) for target in targets])),
+                (self.nodeClass.time, OpenMaya.MTime(frame))]
+
+    def setFrame(self, frame, meshes):
+        # Sets the inputs of the frame through the graph, only what changed gets dirty
+        graph = self.graph
+        if frame == 0:
+            for name, value in self.settings.items():
+                graph.setInput(getattr(self.nodeClass, name), value)
+            graph.setInput(self.nodeClass.value, self.arrayValue([0.75] * self.rayCount))
+        for attribute, value in self.frameInputs(frame, meshes):
+            graph.setInput(attribute, value)
+
+    def contextBlock(self, frame, meshes):
+        # Data block of the node evaluated at the given frame in a time context
+        block = OpenMaya.MDataBlock(self.graph.block.values)
+        block.values.update(self.frameInputs(frame, meshes))
+        block.contextTime = frame
+        return block
+
+    def arrayValue(self, values):
+        return dict(enumerate(values)) if self.isArray else values[0]
+
+    def pull(self, name, block=None, node=None):
+        # Computes one output, returns all of its elements. block and node default to the ones of
+        # the graph
+        attribute = getattr(self.nodeClass, name)
+        block = self.graph.block if block is None else block
+        (node or self.graph.node).compute(self.outputPlug(attribute), block)
+        if attribute.array:
+            return [block.getValue(attribute, index) for index in range(self.rayCount)]
+        return [block.getValue(attribute)]
+
+    def pullContext(self, block):
+        # All the outputs in the context of the block
+        return [self.pull(name, block) for name in kRayOutputs]
+
+    def pullFresh(self, block):
+        # All the outputs of a new node reading the values of the block in the normal context
+        node = self.nodeClass()
+        freshBlock = OpenMaya.MDataBlock(block.values)
+        results = [self.pull(name, freshBlock, node) for name in kRayOutputs]
+        node.release()
+        return results
+
+    def outputPlug(self, attribute):
+        plug = OpenMaya.MPlug(self.graph.node.thisMObject(), attribute)
+        return plug.elementByLogicalIndex(0) if attribute.array else plug
+
+
+def buildScene(plugin, nodeCount, seed):
+    random = numpy.random.RandomState(seed)
+    return [SceneNode(plugin, index, random) for index in range(nodeCount)]
+
+
+def playScene(scene, frames, pool=None, mode='node', contexts=None):
+    # Results[frame][node][output], evaluated serially without a pool. With a contexts list the
+    # nodes are also evaluated at the frame before in a time context, (node, block, outputs) of
+    # them are added to it
+    results = []
+    for frame in range(frames):
+        meshes = sceneMeshes(frame)
+        for node in scene:
+            node.setFrame(frame, meshes)
+
+        contextJobs = []
+        if contexts is not None and frame > 0:
+            previousMeshes = sceneMeshes(frame - 1)
+            for node in scene:
+                block = node.contextBlock(frame - 1, previousMeshes)
+                contextJobs.append((node, block, pool.submit(node.pullContext, block)))
+
+        if pool is None:
+            frameResults = [[node.pull(name) for name in kRayOutputs] for node in scene]
+        elif mode == 'node':
+            jobs = [pool.submit(lambda node=node: [node.pull(name) for name in kRayOutputs]) for node in scene]
+            frameResults = [job.result() for job in jobs]
+        else:
+            jobs = [[pool.submit(node.pull, name) for name in kRayOutputs] for node in scene]
+            frameResults = [[job.result() for job in nodeJobs] for nodeJobs in jobs]
+        results.append(frameResults)
+        for node, block, job in contextJobs:
+            contexts.append((node, block, job.result()))
+    return results
+
+
+def compareResults(serial, parallel):
+    mismatches = []
+    for frame, (serialFrame, parallelFrame) in enumerate(zip(serial, parallel)):
+        for node, (serialNode, parallelNode) in enumerate(zip(serialFrame, parallelFrame)):
+            for name, serialValue, parallelValue in zip(kRayOutputs, serialNode, parallelNode):
+                if serialValue != parallelValue:
+                    mismatches.append('frame %d node %d %s : %s != %s' % (frame, node, name, serialValue, parallelValue))
+    return mismatches
+
+
+def compareContexts(contexts):
+    mismatches = []
+    for node, block, contextResults in contexts:
+        for name, contextValue, freshValue in zip(kRayOutputs, contextResults, node.pullFresh(block)):
+            if contextValue != freshValue:
+                mismatches.append('context frame %g %s %s : %s != %s' % (block.contextTime, node.nodeClass.__name__, name,
+                                                                         contextValue, freshValue))
+    return mismatches
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--plugin', default=kDefaultPlugin, help='plugin file to stress')
+    parser.add_argument('--nodes', type=int, default=2000, help='node instances in the scene')
+    parser.add_argument('--frames', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16, help='threads of the stand-in scheduler')
+    parser.add_argument('--mode', choices=('node', 'plug'), default='node', help='one task per node or per output plug')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--context', action='store_true', help='also evaluate the nodes at the frame before in a time context')
+    options = parser.parse_args(arguments)
+
+    plugin = OpenMaya.loadPlugin(os.path.abspath(options.plugin))
+    plugin.initializePlugin(OpenMaya.MObject('plugin'))
+    for nodeClass in (plugin.project, plugin.projectArray):
+        if nodeClass().schedulingType() != OpenMaya.MPxNode.kParallel:
+            print('%s is not kParallel' % nodeClass.__name__)
+            return 1
+
+    start = time.perf_counter()
+    serial = playScene(buildScene(plugin, options.nodes, options.seed), options.frames)
+    serialSeconds = time.perf_counter() - start
+
+    # The parallel run builds the shared meshes again, with many nodes asking for each at once
+    registry = getattr(plugin, 'meshRegistry', None)
+    if registry is not None:
+        registry.clear()
+
+    # Switching threads as often as possible so the nodes interleave in the middle of their computes
+    switchInterval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        start = time.perf_counter()
+        with futures.ThreadPoolExecutor(max_workers=options.threads) as pool:
+            contexts = [] if options.context else None
+            parallel = playScene(buildScene(plugin, options.nodes, options.seed), options.frames, pool, options.mode, contexts)
+        parallelSeconds = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(switchInterval)
+
+    mismatches = compareResults(serial, parallel)
+    if contexts is not None:
+        mismatches += compareContexts(contexts)
+    print('%d nodes  %d frames  serial %.2fs  %d threads (%s) %.2fs  %d mismatches' % (
+        options.nodes, options.frames, serialSeconds, options.threads, options.mode, parallelSeconds, len(mismatches)))
+    if registry is not None:
+        print('meshRegistry %s' % registry.asDict())
+    for mismatch in mismatches[:20]:
+        print('    ' + mismatch)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2062 @@
+'''
+Version - 0.1.7
+Author - Pranay Meher   pranaymeher@gmail.com
+Description - API plugin to create a project node which moves to the target position when the
+value is set to 1. If it finds an intersection on the input mesh then the result position
+is set on the collision point on the mesh
+
+0.1.2 Update :
+    Instead of connecting the worldMesh of the mesh now I'm taking the dagPath of the mesh
+    to initialize the MFnMesh function set.
+
+0.1.3 Update :
+    Going back to the kMesh type for the mesh input instead of kString as it has updation issues
+    instead of closestIntersection method, using allIntersection method as it is more stable
+
+0.1.4 Update :
+    Now the plugin respects the hierarchical transformation of the source and target objects.
+    This is as good as using the inclusiveMatrix of the objects. Added a new function getTranslation()
+
+0.1.5 Update:
+    Changing the code to use new API 2.0
+
+0.1.6 Update:
+    Adding Rotation projection and dot product value of the hit face normal and the hit ray
+
+0.1.7 Update:
+    The ray query now goes through a BVH of the mesh, refitted when only the points move and
+    rebuilt when the topology changes, and returns the hit closest to the source. The BVH and the
+    projection math are in projectCore.py which has to sit next to this file. Needs numpy.
+    New projectArrayNode with array inputs and outputs, all its rays are cast in one batch.
+    New direction attribute to look forward, backward or both ways along the ray.
+    New rotateOrder attribute, resultRotate is solved straight from the hit frame.
+    compute only works out the output asked for and the other outputs reuse its hits.
+    Fixed attributeAffects : inMesh affects dotProduct and deltaVector is a real output.
+    New warmStart attribute, a ray first looks around the face it hit on the last ray cast.
+    New projectBake command to bake the hits of a node over a frame range.
+    New workers and parallelThreshold attributes to split big batches of rays across threads.
+    projectFarm.py and projectIO.py run the projection on files without Maya.
+    New missMode and maxDistance attributes to snap the rays which miss to the closest point.
+    New accelerator attribute to use Maya's own grid (mayaGrid) instead of the BVH.
+    New projectStats command with per node counters and timings.
+    Rays missing the bounding box of the mesh cost next to nothing.
+    inputMesh is now an array and every connected mesh is a collider (use inputMesh[0]).
+    New sweep attribute so fast sources do not go through thin surfaces between two frames.
+    New normalMode attribute to use smooth normals at the hits.
+    New projectOnMesh() function to project a batch of points without any node.
+    Both nodes are kParallel for the evaluation manager.
+    The nodes reading the same mesh share its BVH, projectStats -meshBudget sets how much memory
+    the versions no node uses any more can keep.
+
+'''
+import os
+import sys
+import maya.api.OpenMaya as OpenMaya
+import math
+import zlib
+import json
+import time
+import contextlib
+import threading
+import collections
+import numpy
+#import maya.OpenMayaMPx as OpenMayaMPx
+
+# The ray casting engine lives next to the plugin file in projectCore.py
+try:
+    import projectCore
+except ImportError:
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import projectCore
+
+kNodeName = "projectNode"
+kNodeId = OpenMaya.MTypeId(0x0007ffff)
+kArrayNodeName = "projectArrayNode"
+kArrayNodeId = OpenMaya.MTypeId(0x0007fffe)
+kBakeCommandName = "projectBake"
+kStatsCommandName = "projectStats"
+
+# Miss modes, what a ray which hits nothing does
+kMissTarget = 0
+kMissClosestPoint = 1
+
+# Normals of the hits used by resultRotate and dotProduct : the flat face normal or the vertex
+# normals blended across the hit triangle
+kNormalFace = 0
+kNormalSmooth = 1
+
+# Longest time step (ui units) the sweep covers, the sources of an evaluation further back are
+# not swept from
+kMaxSweepStep = 1.0
+
+# Accelerators of the mesh queries : the numpy BVH of projectCore or Maya's own grid
+kAccelBVH = 0
+kAccelMayaGrid = 1
+
+# Megabytes the mesh versions no node uses any more can take in the meshRegistry before the least
+# recently used are evicted, the environment variable overrides it and projectStats -meshBudget
+# sets it in a session
+kMeshBudgetMB = 1024.0
+kMeshBudgetVariable = "PROJECT_MESH_BUDGET_MB"
+
+# Ids of the node removed callbacks releasing the meshes of the deleted nodes
+callbackIds = []
+
+def maya_useNewAPI():
+    """
+    Must be present for Maya to know it's using the new 2.0 api
+    """
+    pass
+
+# Command
+class project(OpenMaya.MPxNode):
+    '''
+    Moves the source to the target blended by value, stopping on the nearest hit on the meshes
+    of inputMesh. compute only works out the output asked for : resultVector and deltaVector
+    are the ray cast, dotProduct adds the normal at the hit and only resultRotate solves the
+    hit frame. The hits are kept (ProjectionHits) until an input of the ray cast gets dirty,
+    so the outputs pulled in the same evaluation share one ray cast.
+    The caches of the node (mesh structures, hits, warm start, sweep sources, bake, stats)
+    belong to the instance and are only used under its lock, so the node is kParallel. They
+    only follow the normal context : an evaluation in another context casts from a MeshSetCache
+    of its own, dropped after the compute, and leaves them as they are.
+    '''
+
+    inputMatrix = OpenMaya.MObject()
+    targetMatrix = OpenMaya.MObject()
+    resultVector = OpenMaya.MObject()
+    deltaVector = OpenMaya.MObject()
+    value = OpenMaya.MObject()
+    inMesh = OpenMaya.MObject()
+    resultRotate = OpenMaya.MObject()
+    dotProduct = OpenMaya.MObject()
+    direction = OpenMaya.MObject()
+    rotateOrder = OpenMaya.MObject()
+    warmStart = OpenMaya.MObject()
+    missMode = OpenMaya.MObject()
+    maxDistance = OpenMaya.MObject()
+    accelerator = OpenMaya.MObject()
+    sweep = OpenMaya.MObject()
+    normalMode = OpenMaya.MObject()
+    time = OpenMaya.MObject()
+
+    def __init__(self):
+        OpenMaya.MPxNode.__init__(self)
+
+        # Acceleration structures of the input meshes. They live as long as the node does and
+        # a mesh is only looked at again when its inputMesh element gets dirty (all of them when
+        # the whole array does)
+        self._meshSet = MeshSetCache()
+        self._meshDirty = True
+        self._dirtyMeshes = set()
+
+        # Hits of the current ray inputs, shared by the outputs pulled in the same evaluation and
+        # thrown away when an input of the ray cast gets dirty. Like the warm start and the last
+        # sources below, only the normal context reads or writes them
+        self._hits = None
+
+        # Face hit by every ray (keyed by logical index) on the last ray cast, the next ray cast
+        # starts looking around it. Dropped when the mesh gets rebuilt as the face ids change
+        self._warmFaces = {}
+
+        # Time, logical indices and source positions of the last ray cast, where the sources sweep
+        # from on the next one
+        self._lastSources = None
+
+        # Hits baked over a frame range by the projectBake command, None until something is baked
+        self._bakeCache = None
+
+        # Counters and phase timings, only recorded while projectStats has them enabled
+        self._stats = NodeStats()
+
+        # All of the state above belongs to this node only and is only touched while holding its
+        # lock, so the parallel evaluation can run any number of nodes at once (schedulingType)
+        self._lock = threading.RLock()
+
+    def schedulingType(self):
+        return OpenMaya.MPxNode.kParallel
+
+    def setDependentsDirty(self, plug, plugArray):
+        attribute = plug.attribute()
+        with self._lock:
+            # Flagging the mesh caches for an update when a new mesh comes in
+            if attribute == self.inMesh:
+                if plug.isElement:
+                    self._dirtyMeshes.add(plug.logicalIndex())
+                else:
+                    self._meshDirty = True
+
+            # Anything changing the rays needs a new ray cast
+            if attribute in getRayInputs(self):
+                self._hits = None
+
+    def preEvaluation(self, context, evaluationNode):
+        # Under the evaluation manager setDependentsDirty is not called, the dirty plugs are checked here
+        if not context.isNormal():
+            return
+        with self._lock:
+            if evaluationNode.dirtyPlugExists(self.inMesh):
+                self._meshDirty = True
+            for attribute in getRayInputs(self):
+                if evaluationNode.dirtyPlugExists(attribute):
+                    self._hits = None
+
+    def getMeshes(self, datahandle):
+        # Connected input meshes keyed by logical index
+        meshes = getArrayValues(datahandle.inputArrayValue(self.inMesh), 'asMesh')
+        return dict((index, meshObject) for index, meshObject in meshes.items() if not meshObject.isNull())
+
+    def getBVH(self, meshes, accelerator=kAccelBVH, fingerprints=None, meshSet=None):
+        # Returns the SceneBVH of the input meshes, refitting or rebuilding the BVH of a mesh only if
+        # it has changed. With the Maya grid accelerator the meshes get a MayaMeshAccel instead.
+        # fingerprints are the ones getMeshKey already worked out, by logical index. meshSet is
+        # the MeshSetCache of an evaluation outside the normal context, every mesh is looked at
+        if meshSet is not None:
+            with self._stats.phase('meshUpdate'):
+                faceIdsChanged, statuses = meshSet.update(meshes, None, accelerator, fingerprints)
+            self._stats.count('accelRebuilds', statuses.count(MeshCache.kRebuild))
+            self._stats.count('accelRefits', statuses.count(MeshCache.kRefit))
+            return meshSet.bvh
+
+        with self._stats.phase('meshUpdate'):
+            faceIdsChanged, statuses = self._meshSet.update(meshes, None if self._meshDirty else self._dirtyMeshes, accelerator,
+                                                            fingerprints)
+        if faceIdsChanged:
+            self._warmFaces = {}
+        self._stats.count('accelRebuilds', statuses.count(MeshCache.kRebuild))
+        self._stats.count('accelRefits', statuses.count(MeshCache.kRefit))
+        self._meshDirty = False
+        self._dirtyMeshes = set()
+        return self._meshSet.bvh
+
+    def getMeshKey(self, meshes, fingerprints, meshSet=None):
+        # Fingerprints of the given meshes like MeshSetCache.key(), without any BVH work : the meshes
+        # which may have changed are fingerprinted (and added to fingerprints for getBVH) unless the
+        # meshRegistry knows their data, the others keep the key of their accelerator. With the
+        # meshSet of another context they all are
+        dirty = None if self._meshDirty or meshSet is not None else self._dirtyMeshes
+        caches = self._meshSet.caches
+        meshKey = []
+        for index in sorted(meshes):
+            if dirty is None or index in dirty or index not in caches:
+                key = meshRegistry.getKey(meshes[index])
+                if key is None:
+                    fingerprints[index] = getMeshFingerprint(OpenMaya.MFnMesh(meshes[index]))
+                    key = (fingerprints[index][0], fingerprints[index][2])
+                meshKey.append((index, key))
+            else:
+                meshKey.append((index, caches[index].key()))
+        return tuple(meshKey)
+
+    def release(self):
+        # Gives the meshes of the node back to the meshRegistry when the node is deleted, they are
+        # acquired again if the deletion is undone and the node computes
+        with self._lock:
+            self._meshSet.free()
+            self._meshDirty = True
+            self._dirtyMeshes = set()
+            self._hits = None
+            self._warmFaces = {}
+
+    def getRays(self, datahandle):
+        # Logical indices, (count, 16) source matrices and (count, 3) target positions of the rays
+        inputMatrixMatrix = datahandle.inputValue(self.inputMatrix).asMatrix()
+        targetMatrixMatrix = datahandle.inputValue(self.targetMatrix).asMatrix()
+        return [0], getMatrixArray([inputMatrixMatrix]), numpy.array([getTranslation(targetMatrixMatrix)], dtype=numpy.float64)
+
+    def readRays(self):
+        # Same as getRays, read through the plugs of the node for the bake
+        thisNode = self.thisMObject()
+        inputMatrixMatrix = getPlugMatrix(OpenMaya.MPlug(thisNode, self.inputMatrix))
+        targetMatrixMatrix = getPlugMatrix(OpenMaya.MPlug(thisNode, self.targetMatrix))
+        return [0], getMatrixArray([inputMatrixMatrix]), numpy.array([getTranslation(targetMatrixMatrix)], dtype=numpy.float64)
+
+    def readFrame(self, time):
+        # Inputs of the ray cast at the given time (ui units) : indices, source matrices, target
+        # positions, query (direction, miss distance and sweep) and meshes by logical index, with the graph
+        # evaluated at that time
+        guard = OpenMaya.MDGContextGuard(OpenMaya.MDGContext(OpenMaya.MTime(time, OpenMaya.MTime.uiUnit())))
+        try:
+            thisNode = self.thisMObject()
+            indices, sourceArray, targets = self.readRays()
+            query = (OpenMaya.MPlug(thisNode, self.direction).asShort(),
+                     getMissDistance(OpenMaya.MPlug(thisNode, self.missMode).asShort(), OpenMaya.MPlug(thisNode, self.maxDistance).asDouble()),
+                     OpenMaya.MPlug(thisNode, self.sweep).asBool())
+            meshes = getPlugArrayMeshes(OpenMaya.MPlug(thisNode, self.inMesh))
+        finally:
+            del guard
+        return indices, sourceArray, targets, query, meshes
+
+    def getValues(self, datahandle, indices):
+        return numpy.array([datahandle.inputValue(self.value).asFloat()], dtype=numpy.float64)
+
+    def getParallelism(self, datahandle):
+        # Worker threads and minimum rays per worker for the ray cast, one ray is never split
+        return 1, projectCore.kMinParallelRays
+
+    def writeOutput(self, datahandle, attribute, indices, values, setter):
+        with self._stats.phase('outputWrite'):
+            self.setOutput(datahandle, attribute, indices, values, setter)
+
+    def setOutput(self, datahandle, attribute, indices, values, setter):
+        datahandleOutput = datahandle.outputValue(attribute)
+        if setter == 'set3Float':
+            datahandleOutput.set3Float(float(values[0][0]), float(values[0][1]), float(values[0][2]))
+        else:
+            getattr(datahandleOutput, setter)(float(values[0]))
+
+    def getHits(self, datahandle, meshSet=None):
+        # Casts the rays of the node, only if the inputs of the ray cast changed since the last time.
+        # The evaluations in another context (another time, background evaluation) are not
+        # followed by setDependentsDirty, they cast fresh from their own meshSet (see compute)
+        # and leave the caches to the normal one
+        normal = datahandle.context().isNormal()
+        hits = self._hits if normal else None
+        if hits is not None:
+            self._stats.count('hitCacheHits')
+            # The sources rested since the last ray cast, the next sweep starts from where they
+            # are at this time instead of the time of that cast
+            if self._lastSources is not None:
+                time = datahandle.inputValue(self.time).asTime().asUnits(OpenMaya.MTime.uiUnit())
+                self._lastSources = (time,) + self._lastSources[1:]
+        else:
+            self._stats.count('hitCacheMisses')
+            with self._stats.phase('matrixDecode'):
+                indices, sourceArray, targets = self.getRays(datahandle)
+            meshes = self.getMeshes(datahandle)
+            direction = datahandle.inputValue(self.direction).asShort()
+            missDistance = getMissDistance(datahandle.inputValue(self.missMode).asShort(), datahandle.inputValue(self.maxDistance).asDouble())
+            accelerator = datahandle.inputValue(self.accelerator).asShort()
+            sweep = datahandle.inputValue(self.sweep).asBool()
+            time = datahandle.inputValue(self.time).asTime().asUnits(OpenMaya.MTime.uiUnit())
+            hasRays = bool(meshes) and bool(len(indices))
+
+            # The baked hits of the current frame are used as long as the inputs are the ones
+            # they were baked from. The meshes are only fingerprinted for that, the BVHs are left
+            # as they are unless the frame has to be cast
+            hits = None
+            fingerprints = {}
+            if self._bakeCache is not None and hasRays:
+                hits = self._bakeCache.lookup(time, indices, sourceArray, targets, (direction, missDistance, sweep),
+                                              self.getMeshKey(meshes, fingerprints, meshSet))
+                if hits is not None:
+                    self._stats.count('bakeHits')
+
+            # Otherwise calculating the hit closest to the source from the BVH of the mesh, the
+            # search starts around the faces hit on the last ray cast. In the closestPoint miss
+            # mode the rays which miss snap to the closest point of the mesh from the same BVH.
+            # With sweep the sources stop on the earliest hit of their path since the last frame
+            if hits is None:
+                bvh = self.getBVH(meshes, accelerator, fingerprints, meshSet) if hasRays else None
+                warmFaces = None
+                if bvh is not None and normal and datahandle.inputValue(self.warmStart).asBool():
+                    warmFaces = [self._warmFaces.get(index, -1) for index in indices]
+                previousSources = self.getPreviousSources(time, indices) if sweep and normal else None
+                workers, minParallelRays = self.getParallelism(datahandle)
+                with self._stats.phase('rayCast'):
+                    hits = castRays(bvh, indices, sourceArray, targets, direction, missDistance, warmFaces, workers, minParallelRays,
+                                    previousSources)
+                self._stats.count('raysCast', len(indices))
+                if previousSources is not None:
+                    self._stats.count('raysSwept', len(indices))
+            if normal:
+                self._warmFaces = dict(zip(indices, hits.hitFace.tolist()))
+                self._lastSources = (time, list(indices), hits.sources)
+                self._hits = hits
+        return hits
+
+    def getPreviousSources(self, time, indices):
+        # Sources of the last ray cast if the time stepped forward by at most kMaxSweepStep since
+        # then with the same rays, None otherwise (first evaluation, scrubbing back, jumps)
+        if self._lastSources is None:
+            return None
+        lastTime, lastIndices, lastSources = self._lastSources
+        if lastIndices != list(indices) or not isSweepStep(lastTime, time):
+            return None
+        return lastSources
+
+    def bake(self, times):
+        '''
+        Casts the rays of the node for every time (ui units) and keeps the hits in a BakeCache
+        which compute serves from while the inputs are unchanged. The inputs are read with
+        readFrame, the frames sharing the meshes (same fingerprints), a direction, a miss mode and
+        a sweep are cast together in one batch. With sweep a frame sweeps from the sources of the
+        frame before it, as it does on playback. Returns the number of baked frames.
+        '''
+        frames = [self.readFrame(time) for time in times]
+        indices = list(frames[0][0]) if frames else []
+        for frame in frames:
+            if list(frame[0]) != indices:
+                raise RuntimeError("The inputs of %s change over the bake range" % OpenMaya.MFnDependencyNode(self.thisMObject()).name())
+
+        bakeCache = BakeCache(times, indices)
+        meshSet = MeshSetCache()
+        group = []
+        for frameIndex, (frameIndices, sourceArray, targets, query, meshes) in enumerate(frames):
+            fingerprints = dict((index, getMeshFingerprint(OpenMaya.MFnMesh(meshObject))) for index, meshObject in meshes.items())
+            meshKey = tuple((index, (fingerprints[index][0], fingerprints[index][2])) for index in sorted(fingerprints))
+            bakeCache.setInputs(frameIndex, sourceArray, targets, query, meshKey)
+
+            # New meshes or a new query close the current batch
+            if group and (meshKey, query) != group[0][1:3]:
+                bakeCache.cast(group, meshSet, frames)
+                group = []
+            group.append((frameIndex, meshKey, query, fingerprints))
+        if group:
+            bakeCache.cast(group, meshSet, frames)
+        meshSet.free()
+
+        self.setBakeCache(bakeCache)
+        return len(frames)
+
+    def getBakeCache(self):
+        return self._bakeCache
+
+    def setBakeCache(self, bakeCache):
+        # Serves the given BakeCache (None for none), projectBake puts the one before back on undo
+        with self._lock:
+            self._bakeCache = bakeCache
+            self._hits = None
+
+    def clearBake(self):
+        self.setBakeCache(None)
+
+    def getStats(self):
+        return self._stats
+
+    def getHitNormals(self, datahandle, hits, meshSet=None):
+        # World space normals at the hits, flat or smooth as normalMode asks, looked up once per ray
+        # cast, from the meshes of the node or from the meshSet of another context
+        smooth = datahandle.inputValue(self.normalMode).asShort() == kNormalSmooth
+        normals = hits.smoothNormals if smooth else hits.faceNormals
+        if normals is None:
+            normals = numpy.zeros((len(hits.indices), 3))
+            if hits.hit.any():
+                # Baked hits come without touching the meshes, they are brought up to date first
+                if meshSet is None and (self._meshDirty or self._dirtyMeshes):
+                    self.getBVH(self.getMeshes(datahandle), datahandle.inputValue(self.accelerator).asShort())
+                elif meshSet is not None and meshSet.bvh is None:
+                    self.getBVH(self.getMeshes(datahandle), datahandle.inputValue(self.accelerator).asShort(), None, meshSet)
+                with self._stats.phase('faceNormals'):
+                    normals = (self._meshSet if meshSet is None else meshSet).normals(hits.hit, hits.hitFace, hits.hitTriangle, hits.hitPoint, smooth)
+            if smooth:
+                hits.smoothNormals = normals
+            else:
+                hits.faceNormals = normals
+        return normals
+
+    # Invoked when the command is run.
+    def compute(self,plug,datahandle):
+        # The evaluation manager can call the nodes from any thread, one node computes one plug at a time
+        with self._lock:
+            if datahandle.context().isNormal():
+                return self.computePlug(plug, datahandle)
+
+            # Another context reads other meshes than the ones the node keeps up to date with
+            # setDependentsDirty, they get a MeshSetCache of their own for this evaluation (the
+            # BVHs still come from the meshRegistry) and the caches of the node stay as they are
+            meshSet = MeshSetCache()
+            try:
+                return self.computePlug(plug, datahandle, meshSet)
+            finally:
+                meshSet.free()
+
+    def computePlug(self, plug, datahandle, meshSet=None):
+        # Requests can come for an element or a child of an element of the outputs
+        if plug.isChild:
+            plug = plug.parent()
+        if plug.isElement:
+            plug = plug.array()
+        self._stats.count('evaluations')
+
+        # Every output only computes what it needs, the hits are shared between them
+        if plug == self.deltaVector:
+            # Vector from the source to the hit, or to the target without a hit
+            hits = self.getHits(datahandle, meshSet)
+            self.writeOutput(datahandle, self.deltaVector, hits.indices, hits.deltaVectors, 'set3Float')
+
+        elif plug == self.resultVector:
+            hits = self.getHits(datahandle, meshSet)
+            values = self.getValues(datahandle, hits.indices)
+            computedVectors = hits.sources + hits.deltaVectors * values[:, None]
+            self.writeOutput(datahandle, self.resultVector, hits.indices, computedVectors, 'set3Float')
+
+        elif plug == self.dotProduct:
+            # Dot product between the hit ray and the face normal, 1.0 without a hit
+            hits = self.getHits(datahandle, meshSet)
+            dotProducts = getDotProducts(hits, self.getHitNormals(datahandle, hits, meshSet))
+            self.writeOutput(datahandle, self.dotProduct, hits.indices, dotProducts, 'setFloat')
+
+        elif plug == self.resultRotate:
+            # Rotation of the frame on the hit face, zero without a hit
+            hits = self.getHits(datahandle, meshSet)
+            faceNormals = self.getHitNormals(datahandle, hits, meshSet)
+            rotateOrder = datahandle.inputValue(self.rotateOrder).asShort()
+            with self._stats.phase('rotationSolve'):
+                rotations = getRotations(hits, faceNormals, rotateOrder)
+            self.writeOutput(datahandle, self.resultRotate, hits.indices, rotations, 'set3Float')
+
+        else:
+            return None
+
+        datahandle.setClean(plug)
+
+class projectArray(project):
+    '''
+    Multi variant of the project node. inputMatrix, targetMatrix and value are array attributes and
+    every logical index is one projection, written to the same index of the deltaVector,
+    resultVector, resultRotate and dotProduct array outputs, which only have the elements of the
+    current inputs. All the rays are cast in one batch against the meshes of the inputMesh array
+    (the SceneBVH over the BVH of every mesh).
+    '''
+
+    inputMatrix = OpenMaya.MObject()
+    targetMatrix = OpenMaya.MObject()
+    resultVector = OpenMaya.MObject()
+    deltaVector = OpenMaya.MObject()
+    value = OpenMaya.MObject()
+    inMesh = OpenMaya.MObject()
+    resultRotate = OpenMaya.MObject()
+    dotProduct = OpenMaya.MObject()
+    direction = OpenMaya.MObject()
+    rotateOrder = OpenMaya.MObject()
+    warmStart = OpenMaya.MObject()
+    missMode = OpenMaya.MObject()
+    maxDistance = OpenMaya.MObject()
+    accelerator = OpenMaya.MObject()
+    sweep = OpenMaya.MObject()
+    normalMode = OpenMaya.MObject()
+    time = OpenMaya.MObject()
+    workers = OpenMaya.MObject()
+    parallelThreshold = OpenMaya.MObject()
+
+    def getRays(self, datahandle):
+        sourceMatrices = getArrayValues(datahandle.inputArrayValue(self.inputMatrix), 'asMatrix')
+        targetMatrices = getArrayValues(datahandle.inputArrayValue(self.targetMatrix), 'asMatrix')
+        return getRayArrays(sourceMatrices, targetMatrices)
+
+    def readRays(self):
+        thisNode = self.thisMObject()
+        sourceMatrices = getPlugArrayMatrices(OpenMaya.MPlug(thisNode, self.inputMatrix))
+        targetMatrices = getPlugArrayMatrices(OpenMaya.MPlug(thisNode, self.targetMatrix))
+        return getRayArrays(sourceMatrices, targetMatrices)
+
+    def getValues(self, datahandle, indices):
+        inputValues = getArrayValues(datahandle.inputArrayValue(self.value), 'asFloat')
+        return numpy.array([inputValues.get(index, 0.0) for index in indices], dtype=numpy.float64)
+
+    def setOutput(self, datahandle, attribute, indices, values, setter):
+        setArrayValues(datahandle, attribute, indices, values, setter)
+
+    def getParallelism(self, datahandle):
+        return datahandle.inputValue(self.workers).asInt(), datahandle.inputValue(self.parallelThreshold).asInt()
+
+class projectBake(OpenMaya.MPxCommand):
+    '''
+    Bakes the hits of a projectNode or projectArrayNode over a frame range :
+
+        projectBake -startTime 1 -endTime 120 projectNode1
+        projectBake -clear projectNode1
+
+    The range defaults to the playback range, -by sets the step. The time attribute of the node
+    is connected to time1.outTime if nothing drives it yet, so the node knows which baked frame
+    to serve. Returns the number of baked frames. Undo puts back the bake the node had before,
+    for a bake and a clear alike.
+    '''
+    kStartTimeFlag = ('-st', '-startTime')
+    kEndTimeFlag = ('-et', '-endTime')
+    kByFlag = ('-by', '-by')
+    kClearFlag = ('-cl', '-clear')
+
+    def __init__(self):
+        OpenMaya.MPxCommand.__init__(self)
+        self._node = None
+        self._times = []
+        self._clear = False
+        self._previousBake = None
+        self._modifier = OpenMaya.MDGModifier()
+
+    def doIt(self, args):
+        argData = OpenMaya.MArgDatabase(self.syntax(), args)
+        selection = OpenMaya.MSelectionList()
+        selection.add(argData.getObjectStrings()[0])
+        nodeObject = selection.getDependNode(0)
+        self._node = OpenMaya.MFnDependencyNode(nodeObject).userNode()
+        if not isinstance(self._node, project):
+            raise RuntimeError("%s is not a %s or %s" % (argData.getObjectStrings()[0], kNodeName, kArrayNodeName))
+
+        self._clear = argData.isFlagSet(self.kClearFlag[0])
+        if not self._clear:
+            import maya.api.OpenMayaAnim as OpenMayaAnim
+            uiUnit = OpenMaya.MTime.uiUnit()
+            startTime = OpenMayaAnim.MAnimControl.minTime().asUnits(uiUnit)
+            endTime = OpenMayaAnim.MAnimControl.maxTime().asUnits(uiUnit)
+            by = 1.0
+            if argData.isFlagSet(self.kStartTimeFlag[0]):
+                startTime = argData.flagArgumentDouble(self.kStartTimeFlag[0], 0)
+            if argData.isFlagSet(self.kEndTimeFlag[0]):
+                endTime = argData.flagArgumentDouble(self.kEndTimeFlag[0], 0)
+            if argData.isFlagSet(self.kByFlag[0]):
+                by = argData.flagArgumentDouble(self.kByFlag[0], 0)
+            if by <= 0.0 or endTime < startTime:
+                raise RuntimeError("The bake range is empty")
+            self._times = [startTime + by * step for step in range(int(math.floor((endTime - startTime) / by + 1e-9)) + 1)]
+
+            # Driving the time attribute with the scene time
+            timePlug = OpenMaya.MPlug(nodeObject, self._node.time)
+            if not timePlug.isDestination:
+                selection = OpenMaya.MSelectionList()
+                selection.add("time1")
+                self._modifier.connect(OpenMaya.MFnDependencyNode(selection.getDependNode(0)).findPlug("outTime", False), timePlug)
+        self.redoIt()
+
+    def redoIt(self):
+        self._previousBake = self._node.getBakeCache()
+        if self._clear:
+            self._node.clearBake()
+            return
+        self._modifier.doIt()
+        self.setResult(self._node.bake(self._times))
+
+    def undoIt(self):
+        self._node.setBakeCache(self._previousBake)
+        self._modifier.undoIt()
+
+    def isUndoable(self):
+        return True
+
+class projectStats(OpenMaya.MPxCommand):
+    '''
+    Counters and phase timings of the project nodes, to find the expensive ones in a rig :
+
+        projectStats -enable on
+        projectStats
+        projectStats -file "/tmp/projectStats.json" projectNode1 projectArrayNode1
+        projectStats -reset
+        projectStats -enable off
+        projectStats -meshRegistry
+        projectStats -meshBudget 512
+
+    Recording is off until enabled and then applies to every node. The command returns the stats
+    of the given nodes (all the project nodes of the scene by default) as a json string, keyed by
+    node name, and -file writes the same json to a file. -reset sets them back to zero.
+    -meshRegistry returns the stats of the shared meshRegistry instead (entries, bytes, builds,
+    refits, shares and evictions), -meshBudget sets its budget in megabytes.
+    '''
+    kEnableFlag = ('-e', '-enable')
+    kResetFlag = ('-r', '-reset')
+    kFileFlag = ('-f', '-file')
+    kMeshRegistryFlag = ('-mr', '-meshRegistry')
+    kMeshBudgetFlag = ('-mb', '-meshBudget')
+
+    def __init__(self):
+        OpenMaya.MPxCommand.__init__(self)
+
+    def doIt(self, args):
+        argData = OpenMaya.MArgDatabase(self.syntax(), args)
+        if argData.isFlagSet(self.kEnableFlag[0]):
+            NodeStats.enabled = argData.flagArgumentBool(self.kEnableFlag[0], 0)
+        if argData.isFlagSet(self.kMeshBudgetFlag[0]):
+            budget = argData.flagArgumentDouble(self.kMeshBudgetFlag[0], 0)
+            if budget < 0.0:
+                raise RuntimeError("The mesh budget can not be negative")
+            meshRegistry.setBudget(int(budget * 1024 * 1024))
+
+        if argData.isFlagSet(self.kMeshRegistryFlag[0]):
+            stats = meshRegistry.asDict()
+        else:
+            nodes = getProjectNodes(argData.getObjectStrings())
+            if argData.isFlagSet(self.kResetFlag[0]):
+                for name, node in nodes:
+                    node.getStats().reset()
+
+            stats = {}
+            for name, node in nodes:
+                stats[name] = node.getStats().asDict()
+                stats[name]['type'] = kArrayNodeName if isinstance(node, projectArray) else kNodeName
+        text = json.dumps(stats, indent=4, sort_keys=True)
+        if argData.isFlagSet(self.kFileFlag[0]):
+            with open(argData.flagArgumentString(self.kFileFlag[0], 0), 'w') as statsFile:
+                statsFile.write(text)
+        self.setResult(text)
+
+class NodeStats(object):
+    '''
+    Counters and seconds per compute phase of one node. Counters are evaluations, hitCacheHits and
+    hitCacheMisses (hits reused or recast), bakeHits, accelRebuilds, accelRefits and raysCast. The
+    phases are matrixDecode, meshUpdate, rayCast, faceNormals, rotationSolve and outputWrite.
+    Nothing is recorded unless NodeStats.enabled is set (projectStats -enable), count() and
+    phase() only test the flag then.
+    '''
+    enabled = False
+    kNoPhase = contextlib.nullcontext()
+
+    def __init__(self):
+        # The command reads and resets the stats while nodes may be evaluating on other threads
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.seconds = {}
+
+    def count(self, name, amount=1):
+        if NodeStats.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def phase(self, name):
+        # Context timing the code it wraps into the given phase
+        if not NodeStats.enabled:
+            return NodeStats.kNoPhase
+        return self.timePhase(name)
+
+    @contextlib.contextmanager
+    def timePhase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def asDict(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'seconds': dict(self.seconds)}
+
+class ProjectionHits(object):
+    '''
+    Result of the ray cast of a node for its current inputs : the logical indices of the rays,
+    their source matrices (count, 16) and positions, the deltas from the sources to the hits (or
+    to the targets for the rays which missed), the hit flags, points, faces and triangles (index
+    in the face). The face and smooth normals are only filled in when an output needs them.
+    '''
+
+    def __init__(self, indices, sourceArray, sources, deltaVectors, hit, hitPoint, hitFace, hitTriangle):
+        self.indices = indices
+        self.sourceArray = sourceArray
+        self.sources = sources
+        self.deltaVectors = deltaVectors
+        self.hit = hit
+        self.hitPoint = hitPoint
+        self.hitFace = hitFace
+        self.hitTriangle = hitTriangle
+        self.faceNormals = None
+        self.smoothNormals = None
+
+class BakeCache(object):
+    '''
+    Hits of a node baked over a list of times, stored in (frame, ray) arrays : deltas, hit flags,
+    points, faces, triangles and face normals. Every frame also keeps a crc32 of the ray inputs it was cast
+    from and the fingerprint of the mesh, lookup() only hands out the hits of a frame while the
+    inputs of the node at that time are still the same.
+    '''
+
+    def __init__(self, times, indices):
+        frameCount = len(times)
+        rayCount = len(indices)
+        self.times = numpy.asarray(times, dtype=numpy.float64)
+        self.indices = list(indices)
+        self.inputHashes = numpy.zeros(frameCount, dtype=numpy.int64)
+        self.meshKeys = [None] * frameCount
+        self.deltaVectors = numpy.zeros((frameCount, rayCount, 3))
+        self.hit = numpy.zeros((frameCount, rayCount), dtype=bool)
+        self.hitPoint = numpy.zeros((frameCount, rayCount, 3))
+        self.hitFace = numpy.full((frameCount, rayCount), -1, dtype=numpy.int64)
+        self.hitTriangle = numpy.full((frameCount, rayCount), -1, dtype=numpy.int64)
+        self.faceNormals = numpy.zeros((frameCount, rayCount, 3))
+
+    def setInputs(self, frame, sourceArray, targets, query, meshKey):
+        self.inputHashes[frame] = getInputHash(sourceArray, targets, query)
+        self.meshKeys[frame] = meshKey
+
+    def cast(self, group, meshSet, frames):
+        # Casts the rays of a group of frames sharing the same meshes and query in one batch
+        frameIndices = [frameIndex for frameIndex, meshKey, query, fingerprints in group]
+        frameIndex, meshKey, query, fingerprints = group[0]
+        sourceArray = numpy.concatenate([frames[index][1] for index in frameIndices])
+        targets = numpy.concatenate([frames[index][2] for index in frameIndices])
+        previousSources = None
+        if query[2]:
+            previousSources = numpy.concatenate([self.getPreviousSources(index, frames) for index in frameIndices])
+        bvh = None
+        if meshKey and len(self.indices):
+            meshSet.update(frames[frameIndex][4], fingerprints=fingerprints)
+            bvh = meshSet.bvh
+        hits = castRays(bvh, None, sourceArray, targets, query[0], query[1], workers=0, previousSources=previousSources)
+
+        rayCount = len(self.indices)
+        shape = (len(frameIndices), rayCount)
+        self.deltaVectors[frameIndices] = hits.deltaVectors.reshape(shape + (3,))
+        self.hit[frameIndices] = hits.hit.reshape(shape)
+        self.hitPoint[frameIndices] = hits.hitPoint.reshape(shape + (3,))
+        self.hitFace[frameIndices] = hits.hitFace.reshape(shape)
+        self.hitTriangle[frameIndices] = hits.hitTriangle.reshape(shape)
+        if hits.hit.any():
+            faceNormals = meshSet.normals(hits.hit, hits.hitFace)
+            self.faceNormals[frameIndices] = faceNormals.reshape(shape + (3,))
+
+    def getPreviousSources(self, frame, frames):
+        # Sources the rays of a frame sweep from, the ones of the frame before it unless that is
+        # more than kMaxSweepStep earlier (then the rays are not swept)
+        if frame and isSweepStep(self.times[frame - 1], self.times[frame]):
+            return projectCore.matrixTranslations(frames[frame - 1][1])
+        return projectCore.matrixTranslations(frames[frame][1])
+
+    def lookup(self, time, indices, sourceArray, targets, query, meshKey):
+        # Hits of the frame at the given time, None if it was not baked or the inputs have changed
+        frame = int(numpy.searchsorted(self.times, time - 1e-6))
+        if frame >= len(self.times) or abs(self.times[frame] - time) > 1e-6:
+            return None
+        if list(indices) != self.indices or meshKey != self.meshKeys[frame]:
+            return None
+        if getInputHash(sourceArray, targets, query) != self.inputHashes[frame]:
+            return None
+
+        hits = ProjectionHits(indices, sourceArray, projectCore.matrixTranslations(sourceArray), self.deltaVectors[frame],
+                              self.hit[frame], self.hitPoint[frame], self.hitFace[frame], self.hitTriangle[frame])
+        hits.faceNormals = self.faceNormals[frame]
+        return hits
+
+class MeshEntry(object):
+    '''
+    Acceleration of one version of a mesh in the meshRegistry : its BVH, the points and the
+    triangles (getMeshTriangles) it was built from and the MeshNormals, worked out the first time
+    they are needed. key is (topology, pointsHash, connectivity) of getMeshFingerprint and
+    getMeshConnectivity. Nothing in an entry changes once it is built (a new version of the mesh gets
+    its own entry), so the nodes sharing it can query it from any thread. refCount is the number
+    of MeshCache holding it.
+    '''
+
+    def __init__(self, key, bvh, points, triangles):
+        self.key = key
+        self.bvh = bvh
+        self.points = points
+        self.triangles = triangles
+        self.normals = None
+        self.refCount = 0
+
+    def getNormals(self):
+        # Two nodes asking at once may both work them out, either of the results is kept
+        if self.normals is None:
+            self.normals = MeshNormals(self.points, self.triangles, self.key[0][1])
+        return self.normals
+
+    def nbytes(self):
+        # Memory of the arrays of the entry. The arrays a refitted BVH shares with the version it
+        # was refitted from are counted in both, so this is the most the entry can free
+        arrays = list(self.bvh.arrays().values()) + list(self.bvh.adjacency or ()) + [self.points] + list(self.triangles)
+        normals = self.normals
+        if normals is not None:
+            arrays += [normals.faceNormals, normals.faceStarts]
+            if normals.vertexNormals is not None:
+                arrays.append(normals.vertexNormals)
+        return sum(array.nbytes for array in arrays)
+
+class MeshRegistry(object):
+    '''
+    Process wide registry of the mesh acceleration (MeshEntry), keyed by the content of the mesh
+    version (counts, crc32 of the points and crc32 of the triangles), so all the nodes reading
+    the same mesh share one BVH instead of building one each. acquire() hands out the entry of a
+    version, built by the first node asking for it (refitted from the entry of the version before
+    when only the points moved) while the other nodes asking for it wait, and release() gives it
+    back. The entry is also remembered by the MObjectHandle of the mesh data it was acquired for :
+    the nodes reading the same data find it without reading the mesh, so only the first node per
+    version fingerprints it. Maya hands out new data for every new version of a mesh, a shape
+    read through its MDagPath (projectOnMesh) can change in place and is always fingerprinted. Entries no node holds any more stay for the next node or frame which needs them (going
+    back on the timeline), the least recently used are evicted once those unused entries take
+    more than budget bytes. The entries in use are neither evicted nor counted in the budget.
+    '''
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        # Versions being built, by key, with the event their builder sets when it is done
+        self.building = {}
+        # Key of the entry acquired for a mesh data, by MObjectHandle hash code, and the data being
+        # fingerprinted with the event set once it is known
+        self.identities = {}
+        self.identifying = {}
+        self.lock = threading.Lock()
+        self.counters = {'builds': 0, 'refits': 0, 'shares': 0, 'evictions': 0}
+
+    def acquire(self, meshObject, previous=None, fingerprint=None):
+        '''
+        Entry of the mesh version of meshObject, mesh data or MDagPath. previous is the entry the
+        caller holds for the version before, still acquired, and fingerprint the getMeshFingerprint
+        of the mesh if the caller already has it. The entry has to be given back with release()
+        when the caller is done with it.
+        '''
+        handle = None if isinstance(meshObject, OpenMaya.MDagPath) else OpenMaya.MObjectHandle(meshObject)
+        while True:
+            with self.lock:
+                entry = self.findData(handle)
+                if entry is not None:
+                    self.share(entry, previous)
+                    return entry
+                if handle is None:
+                    break
+                identified = self.identifying.get(handle.hashCode())
+                if identified is None:
+                    identified = self.identifying[handle.hashCode()] = threading.Event()
+                    break
+            # Another node is fingerprinting the same data, its entry is taken once it has it
+            identified.wait()
+
+        try:
+            # The triangles are read once, to tell apart the versions with the same counts and
+            # points and to build the BVH if the version is not in the registry yet
+            mFnMesh = OpenMaya.MFnMesh(meshObject)
+            topology, points, pointsHash = fingerprint or getMeshFingerprint(mFnMesh)
+            triangles = getMeshTriangles(mFnMesh)
+            key = (topology, pointsHash, getMeshConnectivity(triangles))
+            entry = self.acquireKey(key, points, triangles, previous)
+            if handle is not None:
+                with self.lock:
+                    self.identities[handle.hashCode()] = (handle, key)
+        finally:
+            if handle is not None:
+                with self.lock:
+                    del self.identifying[handle.hashCode()]
+                identified.set()
+        return entry
+
+    def acquireKey(self, key, points, triangles, previous):
+        # Entry of the version with the given key, built from points and triangles if it is not
+        # in the registry yet
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.share(entry, previous)
+                    return entry
+                built = self.building.get(key)
+                if built is None:
+                    built = self.building[key] = threading.Event()
+                    break
+            # Another node is building this version, waiting for it instead of building it twice.
+            # If its build fails the next one in goes on to build it
+            built.wait()
+
+        entry = None
+        try:
+            entry = self.build(key, points, triangles, previous)
+        finally:
+            with self.lock:
+                del self.building[key]
+                if entry is not None:
+                    entry.refCount = 1
+                    self.entries[key] = entry
+                    self.evict()
+            built.set()
+        return entry
+
+    def build(self, key, points, triangles, previous):
+        # Same counts and triangles as the version before : a copy of its BVH refitted to the new
+        # points, the sorted triangles and the warm start tables are shared with it. Other counts
+        # or other triangles (another mesh with the same counts) get a new BVH
+        if previous is not None and (previous.key[0], previous.key[2]) == (key[0], key[2]):
+            bvh = projectCore.MeshBVH.fromArrays(previous.bvh.arrays())
+            bvh.adjacency = previous.bvh.adjacency
+            bvh.refit(points)
+            triangles = previous.triangles
+            counter = 'refits'
+        else:
+            bvh = projectCore.MeshBVH(points, *triangles)
+            counter = 'builds'
+        with self.lock:
+            self.counters[counter] += 1
+        return MeshEntry(key, bvh, points, triangles)
+
+    def share(self, entry, previous):
+        # One more node holds the entry, called with the lock held. A node getting the entry it
+        # already holds back (its mesh did not change) does not count as a share
+        entry.refCount += 1
+        self.entries.move_to_end(entry.key)
+        if entry is not previous:
+            self.counters['shares'] += 1
+
+    def findData(self, handle):
+        # Entry acquired for the mesh data of the handle, None if there is none. Called with the
+        # lock held, the hash code of data which is gone can come back for other data
+        if handle is None:
+            return None
+        identity = self.identities.get(handle.hashCode())
+        if identity is None:
+            return None
+        dataHandle, key = identity
+        entry = self.entries.get(key)
+        if entry is None or not dataHandle.isAlive() or dataHandle.object() != handle.object():
+            del self.identities[handle.hashCode()]
+            return None
+        return entry
+
+    def getKey(self, meshObject):
+        # (topology, pointsHash) of the entry acquired for the mesh data, like MeshCache.key(),
+        # None if no node acquired one for it
+        handle = None if isinstance(meshObject, OpenMaya.MDagPath) else OpenMaya.MObjectHandle(meshObject)
+        with self.lock:
+            entry = self.findData(handle)
+            return entry.key[:2] if entry is not None else None
+
+    def release(self, entry):
+        with self.lock:
+            entry.refCount -= 1
+            if entry.refCount == 0:
+                self.evict()
+
+    def evict(self):
+        # Dropping the least recently used entries nobody holds until the ones left fit in the
+        # budget, called with the lock held. The entries in use do not count, they are never evicted
+        total = sum(entry.nbytes() for entry in self.entries.values() if entry.refCount == 0)
+        for key, entry in list(self.entries.items()):
+            if total <= self.budget:
+                break
+            if entry.refCount == 0:
+                total -= entry.nbytes()
+                del self.entries[key]
+                self.counters['evictions'] += 1
+        self.identities = dict((hashCode, identity) for hashCode, identity in self.identities.items() if identity[1] in self.entries)
+
+    def setBudget(self, budget):
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def clear(self):
+        # The nodes still holding entries keep them until they release them
+        with self.lock:
+            self.entries.clear()
+            self.identities.clear()
+
+    def asDict(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.entries)
+            stats['entriesInUse'] = sum(1 for entry in self.entries.values() if entry.refCount)
+            stats['bytes'] = sum(entry.nbytes() for entry in self.entries.values())
+            stats['budget'] = self.budget
+            return stats
+
+def getMeshBudget():
+    # Bytes the unused entries of the meshRegistry can take, kMeshBudgetMB unless the
+    # PROJECT_MESH_BUDGET_MB environment variable sets it
+    try:
+        budget = float(os.environ.get(kMeshBudgetVariable, kMeshBudgetMB))
+    except ValueError:
+        sys.stderr.write("%s is not a number of megabytes, using %g\n" % (kMeshBudgetVariable, kMeshBudgetMB))
+        budget = kMeshBudgetMB
+    return int(budget * 1024 * 1024)
+
+meshRegistry = MeshRegistry(getMeshBudget())
+
+class MeshCache(object):
+    '''
+    Holds the meshRegistry entry of the current version of one input mesh of a node. update()
+    switches to the entry of the incoming mesh, which every node reading the same mesh shares. It returns what changed for the node : nothing, the points moved (the BVH
+    is a refit of the one before, the face ids stay) or the topology changed, another mesh with
+    the same counts included. free() gives the entry back.
+    '''
+    kUnchanged = 0
+    kRefit = 1
+    kRebuild = 2
+
+    def __init__(self):
+        self.entry = None
+        self.bvh = None
+        self.topology = None
+        self.pointsHash = None
+        # Bumped every time the BVH changes, so that anything derived from it can tell it is stale
+        self.version = 0
+
+    def update(self, meshObject, fingerprint=None):
+        # fingerprint can be passed in when the caller already has it from getMeshFingerprint.
+        # The entry of the version before is only given back once the new one is acquired, the
+        # new version may be refitted from it
+        previous = self.entry
+        entry = meshRegistry.acquire(meshObject, previous, fingerprint)
+        if entry is previous:
+            meshRegistry.release(entry)
+            return MeshCache.kUnchanged
+        self.entry = entry
+        if previous is not None:
+            meshRegistry.release(previous)
+        sameTriangles = previous is not None and (previous.key[0], previous.key[2]) == (entry.key[0], entry.key[2])
+        status = MeshCache.kRefit if sameTriangles else MeshCache.kRebuild
+
+        self.bvh = entry.bvh
+        self.topology, self.pointsHash = entry.key[:2]
+        self.version += 1
+        return status
+
+    def free(self):
+        if self.entry is not None:
+            meshRegistry.release(self.entry)
+        self.entry = None
+        self.bvh = None
+        self.topology = None
+        self.pointsHash = None
+
+    def getNormals(self):
+        # MeshNormals of the current mesh, shared with the other nodes
+        return self.entry.getNormals()
+
+    def key(self):
+        # Fingerprint of the mesh the BVH was last built or refitted from
+        return (self.topology, self.pointsHash)
+
+class MayaGrid(object):
+    '''
+    Maya's grid accelerator cached on one mesh data object, shared by all the MayaMeshAccel
+    reading that data. Its lock serializes the closestIntersection calls on that data only (the
+    nodes reading other meshes run in parallel) and the nodes using it are counted, the grid is
+    freed when the last one lets it go (its mesh changed, it switched back to the BVH or it was
+    deleted). The grids are found by the MObjectHandle hash code of the mesh data.
+    '''
+    grids = {}
+    gridsLock = threading.Lock()
+
+    def __init__(self, key, meshObject, mFnMesh):
+        self.key = key
+        self.meshObject = meshObject
+        self.mFnMesh = mFnMesh
+        self.lock = threading.Lock()
+        self.users = 0
+
+    @classmethod
+    def acquire(cls, meshObject, mFnMesh):
+        # The grid of the mesh data, one more node uses it
+        key = OpenMaya.MObjectHandle(meshObject).hashCode()
+        with cls.gridsLock:
+            grids = cls.grids.setdefault(key, [])
+            for grid in grids:
+                if grid.meshObject == meshObject:
+                    break
+            else:
+                grid = cls(key, meshObject, mFnMesh)
+                grids.append(grid)
+            grid.users += 1
+        return grid
+
+    def invalidate(self):
+        # The mesh data changed, Maya builds the grid again on the next query
+        with self.lock:
+            self.mFnMesh.freeCachedIntersectionAccelerator()
+
+    def release(self):
+        # One node less uses the grid, the last one frees it
+        with MayaGrid.gridsLock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            grids = MayaGrid.grids.get(self.key, [])
+            if self in grids:
+                grids.remove(self)
+            if not grids:
+                MayaGrid.grids.pop(self.key, None)
+            self.invalidate()
+
+class MayaMeshAccel(object):
+    '''
+    Maya's own acceleration of a mesh, answering the queries of projectCore.MeshBVH so castRays
+    can use it in its place : the ray casts go through MFnMesh.closestIntersection with the
+    uniform grid of autoUniformGridParams and the closest points through an MMeshIntersector.
+    Both are built by Maya on the first query and kept until the mesh changes (same fingerprint
+    as MeshCache) or free() is called. Every ray is one API call, but nothing past stock Maya is needed.
+    The grid is cached by Maya on the mesh data, which nodes running in parallel can share, so
+    the calls using it go through the MayaGrid of that mesh data and it is only freed once no
+    node uses the data any more. A mesh given by its MDagPath (projectOnMesh) is read in world
+    space, the MMeshIntersector gets its shape and world matrix.
+    '''
+
+    def __init__(self):
+        self.meshObject = None
+        self.mFnMesh = None
+        self.grid = None
+        self.accelParams = None
+        self.intersector = None
+        self.worldMatrix = None
+        self.topology = None
+        self.pointsHash = None
+        self.points = None
+        self.triangles = None
+        self.normals = None
+        self.boxMin = None
+        self.boxMax = None
+
+    @property
+    def bvh(self):
+        # Stands in for the BVH of a MeshCache once bound to a mesh
+        return self if self.mFnMesh is not None else None
+
+    def update(self, meshObject, fingerprint=None):
+        mFnMesh = OpenMaya.MFnMesh(meshObject)
+        topology, points, pointsHash = fingerprint or getMeshFingerprint(mFnMesh)
+        isDagPath = isinstance(meshObject, OpenMaya.MDagPath)
+        meshData = meshObject.node() if isDagPath else meshObject
+        if self.mFnMesh is not None and (topology, pointsHash) == self.key():
+            # Other mesh data with the same counts and points can still be wired another way
+            if meshData == self.grid.meshObject or getMeshConnectivity(getMeshTriangles(mFnMesh)) == getMeshConnectivity(self.getTriangles()):
+                return MeshCache.kUnchanged
+
+        # The grid of the old mesh data is given back once the new one is held, it is freed
+        # when no other node uses that data
+        grid = MayaGrid.acquire(meshData, mFnMesh)
+        if grid is self.grid:
+            # Same data with other points, the grid Maya built for them is out of date
+            grid.invalidate()
+        self.free()
+        self.grid = grid
+        self.meshObject = meshObject
+        self.mFnMesh = mFnMesh
+        self.accelParams = mFnMesh.autoUniformGridParams()
+        self.topology = topology
+        self.pointsHash = pointsHash
+        self.points = points
+        self.triangles = None
+        self.normals = None
+
+        # World bounding box of the points, rays missing it are not handed to Maya at all
+        self.boxMin = points.min(axis=0) if len(points) else numpy.full(3, numpy.nan)
+        self.boxMax = points.max(axis=0) if len(points) else numpy.full(3, numpy.nan)
+        return MeshCache.kRebuild
+
+    def free(self):
+        if self.grid is not None:
+            self.grid.release()
+        self.grid = None
+        self.meshObject = None
+        self.mFnMesh = None
+        self.accelParams = None
+        self.intersector = None
+
+    def key(self):
+        return (self.topology, self.pointsHash)
+
+    def bounds(self):
+        return self.boxMin, self.boxMax
+
+    def getTriangles(self):
+        # getMeshTriangles of the current mesh, only read from Maya when they are needed
+        if self.triangles is None:
+            self.triangles = getMeshTriangles(self.mFnMesh)
+        return self.triangles
+
+    def getNormals(self):
+        # MeshNormals of the current mesh
+        if self.normals is None:
+            self.normals = MeshNormals(self.points, self.getTriangles(), self.topology[1])
+        return self.normals
+
+    def closestIntersection(self, origins, directions, maxParam, direction=projectCore.kBoth, warmFaces=None, workers=1,
+                            minParallelRays=projectCore.kMinParallelRays):
+        # Same arrays as MeshBVH.closestIntersection, the warm start and the workers do not apply
+        result = projectCore.missedRays(len(origins))
+        hit, hitPoint, hitParam, hitFace, hitTriangle, hitBary1, hitBary2 = result
+        sign = -1.0 if direction == projectCore.kBackward else 1.0
+        near = projectCore.raysNearBox(self.boxMin, self.boxMax, origins, directions, *projectCore.paramRange(maxParam, direction))
+        intersections = []
+        with self.grid.lock:
+            for ray in numpy.flatnonzero(near):
+                intersections.append((ray, self.mFnMesh.closestIntersection(
+                    OpenMaya.MFloatPoint(*origins[ray]), OpenMaya.MFloatVector(*(sign * directions[ray])), OpenMaya.MSpace.kWorld,
+                    maxParam, direction == projectCore.kBoth, accelParams=self.accelParams)))
+        for ray, intersection in intersections:
+            if intersection is None or intersection[2] < 0:
+                continue
+            point, param, face, triangle, bary1, bary2 = intersection
+            hit[ray] = True
+            hitPoint[ray] = (point.x, point.y, point.z)
+            hitParam[ray] = sign * param
+            hitFace[ray] = face
+            hitTriangle[ray] = triangle
+            hitBary1[ray] = bary1
+            hitBary2[ray] = bary2
+        return result
+
+    def closestPoints(self, points, maxDistance=numpy.inf, workers=1, minParallelRays=projectCore.kMinParallelRays):
+        # Same arrays as MeshBVH.closestPoints, from an MMeshIntersector created on the first call
+        # The intersector works on the shape of a dag path in its object space : the query points
+        # are moved into it by the world matrix given to create and the closest points moved back
+        if self.intersector is None:
+            self.intersector = OpenMaya.MMeshIntersector()
+            if isinstance(self.meshObject, OpenMaya.MDagPath):
+                worldMatrix = self.meshObject.inclusiveMatrix()
+                self.intersector.create(self.meshObject.node(), worldMatrix)
+                self.worldMatrix = getMatrixArray([worldMatrix]).reshape(4, 4)
+            else:
+                self.intersector.create(self.meshObject, OpenMaya.MMatrix())
+                self.worldMatrix = None
+        result = projectCore.missedRays(len(points))
+        found, closestPoint, distance, closestFace, closestTriangle, closestBary1, closestBary2 = result
+        distance[:] = numpy.inf
+        searchDistance = min(maxDistance, sys.float_info.max)
+        for query in range(len(points)):
+            try:
+                pointOnMesh = self.intersector.getClosestPoint(OpenMaya.MPoint(*points[query]), searchDistance)
+            except RuntimeError:
+                continue
+            point = pointOnMesh.point
+            closestPoint[query] = (point.x, point.y, point.z)
+            if self.worldMatrix is not None:
+                closestPoint[query] = numpy.dot(closestPoint[query], self.worldMatrix[:3, :3]) + self.worldMatrix[3, :3]
+            distance[query] = numpy.linalg.norm(closestPoint[query] - points[query])
+            if distance[query] > maxDistance:
+                closestPoint[query] = 0.0
+                distance[query] = numpy.inf
+                continue
+            found[query] = True
+            closestFace[query] = pointOnMesh.face
+            closestTriangle[query] = pointOnMesh.triangle
+            closestBary1[query], closestBary2[query] = pointOnMesh.barycentricCoords
+        return result
+
+class MeshNormals(object):
+    '''
+    World space normals of a mesh version in contiguous arrays, so the normals of the hits are
+    array lookups instead of a getPolygonNormal call per hit. faceNormals are worked out once
+    from the points and the triangles (projectCore.faceNormals), the vertex normals of smooth()
+    the first time it is called. triangles are the (triangles, faceIds, triIds) of getMeshTriangles.
+    '''
+
+    def __init__(self, points, triangles, faceCount):
+        self.points = points
+        self.triangles, self.faceIds, triIds = triangles
+        self.faceNormals = projectCore.faceNormals(points, self.triangles, self.faceIds, faceCount)
+        self.vertexNormals = None
+        # Row of the first triangle of every face, the triangles of a face follow each other
+        triangleCounts = numpy.bincount(self.faceIds, minlength=faceCount)
+        self.faceStarts = numpy.cumsum(triangleCounts) - triangleCounts
+
+    def smooth(self, faces, triangles, points):
+        # Vertex normals blended across the hit triangles (index in the face) at the hit points
+        if self.vertexNormals is None:
+            self.vertexNormals = projectCore.vertexNormals(self.triangles, self.faceIds, self.faceNormals, len(self.points))
+        rows = self.faceStarts[faces] + triangles
+        return projectCore.interpolateNormals(self.points, self.triangles[rows], self.vertexNormals, points)
+
+class MeshSetCache(object):
+    '''
+    Acceleration of the input meshes (colliders) of a node : a MeshCache, or a MayaMeshAccel with
+    the Maya grid accelerator, per element of the inputMesh array under a projectCore.SceneBVH.
+    update() only looks at the meshes it is told may have changed, the others keep their
+    structures as they are, and the top level of the scene is built again when any mesh changed.
+    The face ids of the queries are scene face ids, normals() maps them back to the meshes.
+    The BVHs are entries of the meshRegistry, free() gives them back when the cache is dropped.
+    '''
+
+    def __init__(self):
+        self.caches = {}
+        self.indices = []
+        self.meshObjects = []
+        self.accelerator = kAccelBVH
+        self.bvh = None
+
+    def update(self, meshes, dirty=None, accelerator=kAccelBVH, fingerprints=None):
+        '''
+        meshes are the mesh objects by logical index, dirty the logical indices whose mesh may have
+        changed (None for all of them) and fingerprints optionally the getMeshFingerprint of the
+        meshes. Returns whether the scene face ids changed (a mesh rebuilt, added or removed) and
+        the MeshCache status of every mesh looked at.
+        '''
+        if accelerator != self.accelerator:
+            self.free()
+            self.accelerator = accelerator
+
+        # Dropping the meshes which are gone
+        for index in [index for index in self.caches if index not in meshes]:
+            self.caches[index].free()
+            del self.caches[index]
+
+        statuses = []
+        for index in sorted(meshes):
+            meshCache = self.caches.get(index)
+            if meshCache is None:
+                meshCache = self.caches[index] = MayaMeshAccel() if accelerator == kAccelMayaGrid else MeshCache()
+            elif dirty is not None and index not in dirty:
+                continue
+            statuses.append(meshCache.update(meshes[index], fingerprints.get(index) if fingerprints else None))
+
+        indices = sorted(meshes)
+        faceIdsChanged = indices != self.indices or MeshCache.kRebuild in statuses
+        if faceIdsChanged or MeshCache.kRefit in statuses or (self.bvh is None and indices):
+            self.bvh = None
+            if indices:
+                self.bvh = projectCore.SceneBVH([self.caches[index].bvh for index in indices],
+                                                [self.caches[index].topology[1] for index in indices])
+        self.indices = indices
+        self.meshObjects = [meshes[index] for index in indices]
+        return faceIdsChanged, statuses
+
+    def free(self):
+        # Gives the registry entries back and frees Maya's grids, the cache is empty afterwards
+        for meshCache in self.caches.values():
+            meshCache.free()
+        self.caches = {}
+        self.indices = []
+        self.meshObjects = []
+        self.bvh = None
+
+    def key(self):
+        # Fingerprints of the meshes the structures were built from, by logical index
+        return tuple((index, self.caches[index].key()) for index in self.indices)
+
+    def normals(self, hit, hitFace, hitTriangle=None, hitPoint=None, smooth=False):
+        # World space normals at the hits (scene face ids), from the MeshNormals of every mesh,
+        # zero for the rays without a hit
+        normals = numpy.zeros((len(hit), 3))
+        meshes, faces = self.bvh.splitFaces(hitFace)
+        for mesh in numpy.unique(meshes[hit]):
+            meshHit = hit & (meshes == mesh)
+            meshNormals = self.caches[self.indices[mesh]].getNormals()
+            if smooth:
+                normals[meshHit] = meshNormals.smooth(faces[meshHit], hitTriangle[meshHit], hitPoint[meshHit])
+            else:
+                normals[meshHit] = meshNormals.faceNormals[faces[meshHit]]
+        return normals
+
+def getMeshFingerprint(mFnMesh):
+    # Topology (vertex, face and face-vertex counts), points and crc32 of the points of the mesh
+    topology = (mFnMesh.numVertices, mFnMesh.numPolygons, mFnMesh.numFaceVertices)
+    points = getMeshPoints(mFnMesh)
+    return topology, points, zlib.crc32(points.tobytes())
+
+def getMeshConnectivity(triangles):
+    # crc32 of the getMeshTriangles arrays. Two meshes with the same counts can be wired
+    # differently, only the same triangles make a BVH refittable from one to the other
+    triangles, faceIds, triIds = triangles
+    return zlib.crc32(triangles.tobytes(), zlib.crc32(faceIds.tobytes()))
+
+def getMeshPoints(mFnMesh):
+    # Reading the world space points of the mesh into a numpy array
+    return numpy.array([(point.x, point.y, point.z) for point in mFnMesh.getPoints(OpenMaya.MSpace.kWorld)], dtype=numpy.float64).reshape(-1, 3)
+
+def getMeshTriangles(mFnMesh):
+    # Reading the triangulation of the mesh into numpy arrays
+    triangleCounts, triangleVertices = mFnMesh.getTriangles()
+    triangleCounts = numpy.array(triangleCounts, dtype=numpy.int64)
+    triangles = numpy.array(triangleVertices, dtype=numpy.int64).reshape(-1, 3)
+
+    # Every triangle remembers the polygon it came from and its index inside that polygon
+    faceIds = numpy.repeat(numpy.arange(len(triangleCounts)), triangleCounts)
+    triIds = numpy.arange(len(triangles)) - numpy.repeat(numpy.cumsum(triangleCounts) - triangleCounts, triangleCounts)
+    return triangles, faceIds, triIds
+
+def castRays(bvh, indices, sourceArray, targets, direction, missDistance=None, warmFaces=None, workers=1, minParallelRays=projectCore.kMinParallelRays,
+             previousSources=None):
+    # Nearest hit of every ray from the sources towards the targets with max param 1.0. Rays
+    # which hit get the delta to the hit point, the others keep the delta to their target unless
+    # a missDistance is given, then the closest point of the mesh within it counts as their hit.
+    # With previousSources the earliest hit on the path of a source from there comes first
+    sources = projectCore.matrixTranslations(sourceArray)
+    deltaVectors = targets - sources
+    if bvh is None:
+        result = projectCore.missedRays(len(sources))
+    elif previousSources is not None:
+        result = projectCore.sweptIntersection(bvh, previousSources, sources, deltaVectors, 1.0, direction, warmFaces, workers, minParallelRays)
+        if missDistance is not None:
+            projectCore.snapMissedRays(bvh, sources, result, missDistance, workers, minParallelRays)
+    else:
+        result = bvh.closestIntersection(sources, deltaVectors, 1.0, direction, warmFaces, workers, minParallelRays)
+        if missDistance is not None:
+            projectCore.snapMissedRays(bvh, sources, result, missDistance, workers, minParallelRays)
+    hit, hitPoint, hitRayParam, hitFace, hitTriangle, hitBary1, hitBary2 = result
+    deltaVectors[hit] = hitPoint[hit] - sources[hit]
+    return ProjectionHits(indices, sourceArray, sources, deltaVectors, hit, hitPoint, hitFace, hitTriangle)
+
+def getDotProducts(hits, normals):
+    # Dot product between the hit ray (hit to source) and the normal at the hit, 1.0 without a hit
+    dotProducts = numpy.ones(len(hits.indices))
+    dotProducts[hits.hit] = (normals[hits.hit] * (hits.sources[hits.hit] - hits.hitPoint[hits.hit])).sum(axis=1)
+    return dotProducts
+
+def getRotations(hits, normals, rotateOrder):
+    # Rotation of the frame of every source laid on the normal at its hit, zero without a hit
+    rotations = numpy.zeros((len(hits.indices), 3))
+    if hits.hit.any():
+        sourceAxes = projectCore.matrixAxes(hits.sourceArray[hits.hit])
+        rotations[hits.hit] = projectCore.frameRotations(normals[hits.hit], sourceAxes[:, 0], sourceAxes[:, 2], rotateOrder)
+    return rotations
+
+def getInputHash(sourceArray, targets, query):
+    # crc32 of the inputs of a ray cast
+    inputHash = zlib.crc32(numpy.ascontiguousarray(sourceArray, dtype=numpy.float64).tobytes())
+    inputHash = zlib.crc32(numpy.ascontiguousarray(targets, dtype=numpy.float64).tobytes(), inputHash)
+    return zlib.crc32(repr(query).encode(), inputHash)
+
+def getMissDistance(missMode, maxDistance):
+    # Max distance of the closest point fallback for castRays, None in the target miss mode
+    if missMode != kMissClosestPoint:
+        return None
+    return maxDistance if maxDistance > 0.0 else numpy.inf
+
+def isSweepStep(previousTime, time):
+    # Whether the time stepped forward by at most kMaxSweepStep (playback or sub-steps)
+    return 0.0 < time - previousTime <= kMaxSweepStep + 1e-6
+
+def getRayArrays(sourceMatrices, targetMatrices):
+    # Every connected inputMatrix is one projection, missing targets get the identity
+    indices = sorted(sourceMatrices)
+    identity = OpenMaya.MMatrix()
+    sourceArray = getMatrixArray([sourceMatrices[index] for index in indices])
+    targets = projectCore.matrixTranslations(getMatrixArray([targetMatrices.get(index, identity) for index in indices])).copy()
+    return indices, sourceArray, targets
+
+def getPlugMatrix(plug):
+    return OpenMaya.MFnMatrixData(plug.asMObject()).matrix()
+
+def getPlugArrayMatrices(arrayPlug):
+    # Reads a matrix array plug into a dictionary keyed by the logical index
+    matrices = {}
+    for physical in range(arrayPlug.evaluateNumElements()):
+        elementPlug = arrayPlug.elementByPhysicalIndex(physical)
+        matrices[elementPlug.logicalIndex()] = getPlugMatrix(elementPlug)
+    return matrices
+
+def getPlugArrayMeshes(arrayPlug):
+    # Reads a mesh array plug into a dictionary keyed by the logical index, empty elements are left out
+    meshes = {}
+    for physical in range(arrayPlug.evaluateNumElements()):
+        elementPlug = arrayPlug.elementByPhysicalIndex(physical)
+        meshObject = elementPlug.asMObject()
+        if not meshObject.isNull():
+            meshes[elementPlug.logicalIndex()] = meshObject
+    return meshes
+
+def getArrayValues(arrayHandle, getter):
+    # Reads an input array attribute into a dictionary keyed by the logical index
+    values = {}
+    for physical in range(len(arrayHandle)):
+        arrayHandle.jumpToPhysicalElement(physical)
+        values[arrayHandle.elementLogicalIndex()] = getattr(arrayHandle.inputValue(), getter)()
+    return values
+
+def setArrayValues(datahandle, attribute, indices, values, setter):
+    # Writes one value per logical index into an output array attribute. The builder starts empty
+    # (the one of the array handle has the elements already there), so the elements of removed
+    # inputs are dropped instead of keeping their last values
+    arrayHandle = datahandle.outputArrayValue(attribute)
+    builder = OpenMaya.MArrayDataBuilder(datahandle, attribute, len(indices))
+    for index, value in zip(indices, values):
+        elementHandle = builder.addElement(index)
+        if setter == 'set3Float':
+            elementHandle.set3Float(float(value[0]), float(value[1]), float(value[2]))
+        else:
+            getattr(elementHandle, setter)(float(value))
+    arrayHandle.set(builder)
+    arrayHandle.setAllClean()
+
+def projectOnMesh(meshes, sources, targets, values=1.0, direction=projectCore.kBoth, rotateOrder=projectCore.kXYZ,
+                  missMode=kMissTarget, maxDistance=0.0, normalMode=kNormalFace, accelerator=kAccelBVH, workers=0,
+                  previousSources=None, cache=None):
+    '''
+    Projection of the project nodes for a whole batch of points in one call, without creating or
+    connecting any node : for pipeline tools which only need the results.
+
+    meshes is a mesh (name, MDagPath or mesh data MObject) or a list of them, which are the
+    colliders of inputMesh. sources and targets are lists of MMatrix, (count, 16) or (count, 4, 4)
+    arrays of matrices or (count, 3) arrays of points. Points get the identity axes, so their
+    rotations are the ones of the world axes laid on the hit. values, direction, rotateOrder,
+    missMode, maxDistance, normalMode, accelerator and workers are the attributes of the nodes,
+    previousSources the source points of the last frame for the swept query.
+
+    The rays go through the same engine as compute (MeshSetCache, castRays) and the BVHs are the
+    ones of the meshRegistry, shared with the nodes reading the same meshes. Passing the same
+    MeshSetCache as cache to every call keeps the meshes held between the calls, the caller frees
+    it (MeshSetCache.free) when done.
+    Returns the (count, 3) positions (resultVector), (count, 3) rotations in degrees
+    (resultRotate), (count,) dot products and (count,) hit flags as numpy arrays.
+    '''
+    if not isinstance(meshes, (list, tuple)):
+        meshes = [meshes]
+    sourceArray = getSourceArray(sources)
+    targets = getTargetPoints(targets)
+    if len(targets) != len(sourceArray):
+        raise RuntimeError("projectOnMesh got %d sources and %d targets" % (len(sourceArray), len(targets)))
+    values = numpy.broadcast_to(numpy.asarray(values, dtype=numpy.float64), (len(sourceArray),))
+
+    meshSet = cache if cache is not None else MeshSetCache()
+    try:
+        meshSet.update(dict(enumerate(getMeshObject(mesh) for mesh in meshes)), accelerator=accelerator)
+        bvh = meshSet.bvh if len(sourceArray) else None
+        hits = castRays(bvh, list(range(len(sourceArray))), sourceArray, targets, direction, getMissDistance(missMode, maxDistance),
+                        workers=workers, previousSources=previousSources)
+
+        normals = numpy.zeros((len(sourceArray), 3))
+        if hits.hit.any():
+            normals = meshSet.normals(hits.hit, hits.hitFace, hits.hitTriangle, hits.hitPoint, normalMode == kNormalSmooth)
+    finally:
+        if cache is None:
+            meshSet.free()
+    positions = hits.sources + hits.deltaVectors * values[:, None]
+    return positions, getRotations(hits, normals, rotateOrder), getDotProducts(hits, normals), hits.hit
+
+def getMeshObject(mesh):
+    # Mesh names are looked up to their dag path, so the points are read in world space
+    if isinstance(mesh, str):
+        selection = OpenMaya.MSelectionList()
+        selection.add(mesh)
+        return selection.getDagPath(0)
+    return mesh
+
+def getSourceArray(sources):
+    # (count, 16) source matrices from MMatrix, matrix arrays or points (identity axes)
+    if len(sources) and isinstance(sources[0], OpenMaya.MMatrix):
+        return getMatrixArray(sources)
+    sources = numpy.asarray(sources, dtype=numpy.float64)
+    if sources.size and sources.shape[-1] == 3:
+        sourceArray = numpy.tile(numpy.identity(4).reshape(16), (len(sources), 1))
+        sourceArray[:, 12:15] = sources.reshape(-1, 3)
+        return sourceArray
+    return sources.reshape(-1, 16)
+
+def getTargetPoints(targets):
+    # (count, 3) target positions from MMatrix, matrix arrays or points
+    if len(targets) and isinstance(targets[0], OpenMaya.MMatrix):
+        return numpy.array([getTranslation(matrix) for matrix in targets], dtype=numpy.float64)
+    targets = numpy.asarray(targets, dtype=numpy.float64)
+    if targets.size and targets.shape[-1] == 3:
+        return targets.reshape(-1, 3)
+    return projectCore.matrixTranslations(targets.reshape(-1, 16)).copy()
+
+def getTranslation(matrix):
+    # The translation of the matrix is its elements 12 to 14, reading them directly is the same as
+    # MTransformationMatrix.translation(kWorld) without creating any API objects
+    return [matrix[12], matrix[13], matrix[14]]
+
+def getMatrixArray(matrices):
+    # Flattens a list of MMatrix into a (count, 16) numpy array for the batched projectCore helpers
+    return numpy.array([tuple(matrix) for matrix in matrices], dtype=numpy.float64).reshape(-1, 16)
+
+def getProjectNodes(names):
+    # (name, node) of the given project nodes, every project node of the scene when no names are given
+    nodes = []
+    if names:
+        for name in names:
+            selection = OpenMaya.MSelectionList()
+            selection.add(name)
+            node = OpenMaya.MFnDependencyNode(selection.getDependNode(0)).userNode()
+            if not isinstance(node, project):
+                raise RuntimeError("%s is not a %s or %s" % (name, kNodeName, kArrayNodeName))
+            nodes.append((name, node))
+        return nodes
+
+    iterator = OpenMaya.MItDependencyNodes(OpenMaya.MFn.kPluginDependNode)
+    while not iterator.isDone():
+        mFnDependencyNode = OpenMaya.MFnDependencyNode(iterator.thisNode())
+        if mFnDependencyNode.typeName in (kNodeName, kArrayNodeName):
+            nodes.append((mFnDependencyNode.name(), mFnDependencyNode.userNode()))
+        iterator.next()
+    return nodes
+
+def getRayInputs(node):
+    # Inputs of the ray cast, a change to any of them means new hits
+    return (node.inputMatrix, node.targetMatrix, node.inMesh, node.direction, node.warmStart, node.missMode, node.maxDistance,
+            node.accelerator, node.sweep)
+
+def setAttributeAffects(nodeClass):
+    # The ray inputs affect every output, so does time as it picks the baked frame. value only re-blends resultVector from the hit,
+    # rotateOrder only changes how the hit frame is written to resultRotate and normalMode the normal used at the hit
+    for inputAttribute in getRayInputs(nodeClass) + (nodeClass.time,):
+        for outputAttribute in (nodeClass.deltaVector, nodeClass.resultVector, nodeClass.resultRotate, nodeClass.dotProduct):
+            nodeClass.attributeAffects(inputAttribute, outputAttribute)
+    nodeClass.attributeAffects(nodeClass.value, nodeClass.resultVector)
+    nodeClass.attributeAffects(nodeClass.rotateOrder, nodeClass.resultRotate)
+    nodeClass.attributeAffects(nodeClass.normalMode, nodeClass.resultRotate)
+    nodeClass.attributeAffects(nodeClass.normalMode, nodeClass.dotProduct)
+
+def createDirectionAttribute():
+    # Which way along the ray the hits are searched, both directions is what the node always did
+    mFnEnumAttribute = OpenMaya.MFnEnumAttribute()
+    direction = mFnEnumAttribute.create("direction", "dir", projectCore.kBoth)
+    mFnEnumAttribute.addField("forward", projectCore.kForward)
+    mFnEnumAttribute.addField("backward", projectCore.kBackward)
+    mFnEnumAttribute.addField("both", projectCore.kBoth)
+    mFnEnumAttribute.readable = True
+    mFnEnumAttribute.writable = True
+    mFnEnumAttribute.storable = True
+    mFnEnumAttribute.keyable = True
+    return direction
+
+def createRotateOrderAttribute():
+    # Rotate order of resultRotate, same fields as the rotateOrder of a transform
+    mFnEnumAttribute = OpenMaya.MFnEnumAttribute()
+    rotateOrder = mFnEnumAttribute.create("rotateOrder", "ro", projectCore.kXYZ)
+    for name, value in (("xyz", projectCore.kXYZ), ("yzx", projectCore.kYZX), ("zxy", projectCore.kZXY),
+                        ("xzy", projectCore.kXZY), ("yxz", projectCore.kYXZ), ("zyx", projectCore.kZYX)):
+        mFnEnumAttribute.addField(name, value)
+    mFnEnumAttribute.readable = True
+    mFnEnumAttribute.writable = True
+    mFnEnumAttribute.storable = True
+    mFnEnumAttribute.keyable = True
+    return rotateOrder
+
+def createMissAttributes():
+    # What a ray which hits nothing does : go to the target (what the node always did) or snap
+    # the source to the closest point of the mesh within maxDistance (0 for no limit)
+    mFnEnumAttribute = OpenMaya.MFnEnumAttribute()
+    missMode = mFnEnumAttribute.create("missMode", "mm", kMissTarget)
+    mFnEnumAttribute.addField("target", kMissTarget)
+    mFnEnumAttribute.addField("closestPoint", kMissClosestPoint)
+    mFnEnumAttribute.readable = True
+    mFnEnumAttribute.writable = True
+    mFnEnumAttribute.storable = True
+    mFnEnumAttribute.keyable = True
+
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    maxDistance = mFnNumericAttribute.create("maxDistance", "md", OpenMaya.MFnNumericData.kDouble, 0.0)
+    mFnNumericAttribute.setMin(0.0)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    mFnNumericAttribute.keyable = True
+    return missMode, maxDistance
+
+def createAcceleratorAttribute():
+    # Which acceleration answers the mesh queries : the BVH (default) or Maya's own uniform grid,
+    # which needs nothing past stock Maya but costs one API call per ray
+    mFnEnumAttribute = OpenMaya.MFnEnumAttribute()
+    accelerator = mFnEnumAttribute.create("accelerator", "acc", kAccelBVH)
+    mFnEnumAttribute.addField("bvh", kAccelBVH)
+    mFnEnumAttribute.addField("mayaGrid", kAccelMayaGrid)
+    mFnEnumAttribute.readable = True
+    mFnEnumAttribute.writable = True
+    mFnEnumAttribute.storable = True
+    mFnEnumAttribute.keyable = False
+    return accelerator
+
+def createSweepAttribute():
+    # Turns the swept query on : the sources stop on the earliest hit of their path since the last
+    # frame before casting their ray, so fast sources do not go through thin surfaces. Needs the
+    # time attribute connected to time1
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    sweep = mFnNumericAttribute.create("sweep", "swp", OpenMaya.MFnNumericData.kBoolean, False)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    mFnNumericAttribute.keyable = True
+    return sweep
+
+def createNormalModeAttribute():
+    # Normal used at the hits by resultRotate and dotProduct : the face normal (what the node
+    # always did) or the vertex normals blended across the hit triangle
+    mFnEnumAttribute = OpenMaya.MFnEnumAttribute()
+    normalMode = mFnEnumAttribute.create("normalMode", "nm", kNormalFace)
+    mFnEnumAttribute.addField("face", kNormalFace)
+    mFnEnumAttribute.addField("smooth", kNormalSmooth)
+    mFnEnumAttribute.readable = True
+    mFnEnumAttribute.writable = True
+    mFnEnumAttribute.storable = True
+    mFnEnumAttribute.keyable = True
+    return normalMode
+
+def createTimeAttribute():
+    # Time used to find the baked frame, the projectBake command connects it to time1.outTime
+    mFnUnitAttribute = OpenMaya.MFnUnitAttribute()
+    time = mFnUnitAttribute.create("time", "tm", OpenMaya.MFnUnitAttribute.kTime, 0.0)
+    mFnUnitAttribute.readable = True
+    mFnUnitAttribute.writable = True
+    mFnUnitAttribute.storable = True
+    mFnUnitAttribute.keyable = False
+    return time
+
+def createParallelAttributes():
+    # Worker threads of the ray cast (0 is one per cpu) and the minimum number of rays every
+    # worker has to get before a batch is split. The results do not depend on them
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    workers = mFnNumericAttribute.create("workers", "wk", OpenMaya.MFnNumericData.kInt, 0)
+    mFnNumericAttribute.setMin(0)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    mFnNumericAttribute.keyable = False
+
+    parallelThreshold = mFnNumericAttribute.create("parallelThreshold", "pth", OpenMaya.MFnNumericData.kInt, projectCore.kMinParallelRays)
+    mFnNumericAttribute.setMin(1)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    mFnNumericAttribute.keyable = False
+    return workers, parallelThreshold
+
+def createWarmStartAttribute():
+    # Turns the warm start from the faces hit on the last ray cast on or off, the hits are the
+    # nearest ones either way
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    warmStart = mFnNumericAttribute.create("warmStart", "ws", OpenMaya.MFnNumericData.kBoolean, True)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    mFnNumericAttribute.keyable = False
+    return warmStart
+
+def bakeCommandCreator():
+    return projectBake()
+
+def bakeSyntaxCreator():
+    syntax = OpenMaya.MSyntax()
+    syntax.addFlag(projectBake.kStartTimeFlag[0], projectBake.kStartTimeFlag[1], OpenMaya.MSyntax.kDouble)
+    syntax.addFlag(projectBake.kEndTimeFlag[0], projectBake.kEndTimeFlag[1], OpenMaya.MSyntax.kDouble)
+    syntax.addFlag(projectBake.kByFlag[0], projectBake.kByFlag[1], OpenMaya.MSyntax.kDouble)
+    syntax.addFlag(projectBake.kClearFlag[0], projectBake.kClearFlag[1])
+    syntax.setObjectType(OpenMaya.MSyntax.kStringObjects, 1, 1)
+    return syntax
+
+def statsCommandCreator():
+    return projectStats()
+
+def statsSyntaxCreator():
+    syntax = OpenMaya.MSyntax()
+    syntax.addFlag(projectStats.kEnableFlag[0], projectStats.kEnableFlag[1], OpenMaya.MSyntax.kBoolean)
+    syntax.addFlag(projectStats.kResetFlag[0], projectStats.kResetFlag[1])
+    syntax.addFlag(projectStats.kFileFlag[0], projectStats.kFileFlag[1], OpenMaya.MSyntax.kString)
+    syntax.addFlag(projectStats.kMeshRegistryFlag[0], projectStats.kMeshRegistryFlag[1])
+    syntax.addFlag(projectStats.kMeshBudgetFlag[0], projectStats.kMeshBudgetFlag[1], OpenMaya.MSyntax.kDouble)
+    syntax.setObjectType(OpenMaya.MSyntax.kStringObjects, 0)
+    return syntax
+
+# Creator
+def nodeCreator():
+    return project()
+
+def nodeInitializer():
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    mFnTypedAttribute = OpenMaya.MFnTypedAttribute()
+    mFnMatrixAttribute = OpenMaya.MFnMatrixAttribute()
+
+    project.inputMatrix = mFnMatrixAttribute.create("inputMatrix","inMat",OpenMaya.MFnMatrixAttribute.kDouble)
+    mFnMatrixAttribute.readable = True
+    mFnMatrixAttribute.writable = True
+    mFnMatrixAttribute.storable = True
+    #mFnMatrixAttribute.hidden(0)
+    mFnMatrixAttribute.connectable = True
+
+    project.targetMatrix = mFnMatrixAttribute.create("targetMatrix","tarMat",OpenMaya.MFnMatrixAttribute.kDouble)
+    mFnMatrixAttribute.readable = True
+    mFnMatrixAttribute.writable = True
+    mFnMatrixAttribute.storable = True
+    #mFnMatrixAttribute.hidden(0)
+    mFnMatrixAttribute.connectable = True
+
+    project.deltaVector = mFnNumericAttribute.create("deltaVector","deltaVect",OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.storable = False
+    mFnNumericAttribute.connectable = True
+
+    project.resultVector = mFnNumericAttribute.create("resultVector","rsVect",OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    #mFnNumericAttribute.hidden(0)
+    mFnNumericAttribute.connectable = True
+
+    project.value = mFnNumericAttribute.create("value", "val", OpenMaya.MFnNumericData.kFloat,0.0)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.keyable = True
+
+    project.resultRotate = mFnNumericAttribute.create("resultRotate", "resRot", OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.storable = True
+    #mFnNumericAttribute.hidden(0)
+    mFnNumericAttribute.connectable = True
+
+    project.dotProduct = mFnNumericAttribute.create("dotProduct", "dot", OpenMaya.MFnNumericData.kFloat, 0.0)
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.keyable = False
+    mFnNumericAttribute.connectable = True
+
+    project.inMesh = mFnTypedAttribute.create("inputMesh", "inMesh", OpenMaya.MFnData.kMesh)
+    mFnTypedAttribute.array = True
+    mFnTypedAttribute.readable = False
+
+    project.direction = createDirectionAttribute()
+    project.rotateOrder = createRotateOrderAttribute()
+    project.warmStart = createWarmStartAttribute()
+    project.missMode, project.maxDistance = createMissAttributes()
+    project.accelerator = createAcceleratorAttribute()
+    project.sweep = createSweepAttribute()
+    project.normalMode = createNormalModeAttribute()
+    project.time = createTimeAttribute()
+
+    project.addAttribute(project.inputMatrix)
+    project.addAttribute(project.targetMatrix)
+    project.addAttribute(project.resultVector)
+    project.addAttribute(project.deltaVector)
+    project.addAttribute(project.value)
+    project.addAttribute(project.inMesh)
+    project.addAttribute(project.resultRotate)
+    project.addAttribute(project.dotProduct)
+    project.addAttribute(project.direction)
+    project.addAttribute(project.rotateOrder)
+    project.addAttribute(project.warmStart)
+    project.addAttribute(project.missMode)
+    project.addAttribute(project.maxDistance)
+    project.addAttribute(project.accelerator)
+    project.addAttribute(project.sweep)
+    project.addAttribute(project.normalMode)
+    project.addAttribute(project.time)
+
+    setAttributeAffects(project)
+
+def arrayNodeCreator():
+    return projectArray()
+
+def arrayNodeInitializer():
+    mFnNumericAttribute = OpenMaya.MFnNumericAttribute()
+    mFnTypedAttribute = OpenMaya.MFnTypedAttribute()
+    mFnMatrixAttribute = OpenMaya.MFnMatrixAttribute()
+
+    projectArray.inputMatrix = mFnMatrixAttribute.create("inputMatrix","inMat",OpenMaya.MFnMatrixAttribute.kDouble)
+    mFnMatrixAttribute.array = True
+    mFnMatrixAttribute.readable = True
+    mFnMatrixAttribute.writable = True
+    mFnMatrixAttribute.storable = True
+    mFnMatrixAttribute.connectable = True
+
+    projectArray.targetMatrix = mFnMatrixAttribute.create("targetMatrix","tarMat",OpenMaya.MFnMatrixAttribute.kDouble)
+    mFnMatrixAttribute.array = True
+    mFnMatrixAttribute.readable = True
+    mFnMatrixAttribute.writable = True
+    mFnMatrixAttribute.storable = True
+    mFnMatrixAttribute.connectable = True
+
+    projectArray.value = mFnNumericAttribute.create("value", "val", OpenMaya.MFnNumericData.kFloat,0.0)
+    mFnNumericAttribute.array = True
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = True
+    mFnNumericAttribute.keyable = True
+
+    projectArray.resultVector = mFnNumericAttribute.create("resultVector","rsVect",OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.array = True
+    mFnNumericAttribute.usesArrayDataBuilder = True
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.storable = False
+    mFnNumericAttribute.connectable = True
+
+    projectArray.resultRotate = mFnNumericAttribute.create("resultRotate", "resRot", OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.array = True
+    mFnNumericAttribute.usesArrayDataBuilder = True
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.storable = False
+    mFnNumericAttribute.connectable = True
+
+    projectArray.deltaVector = mFnNumericAttribute.create("deltaVector","deltaVect",OpenMaya.MFnNumericData.k3Float)
+    mFnNumericAttribute.array = True
+    mFnNumericAttribute.usesArrayDataBuilder = True
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.storable = False
+    mFnNumericAttribute.connectable = True
+
+    projectArray.dotProduct = mFnNumericAttribute.create("dotProduct", "dot", OpenMaya.MFnNumericData.kFloat, 0.0)
+    mFnNumericAttribute.array = True
+    mFnNumericAttribute.usesArrayDataBuilder = True
+    mFnNumericAttribute.readable = True
+    mFnNumericAttribute.writable = False
+    mFnNumericAttribute.storable = False
+    mFnNumericAttribute.connectable = True
+
+    projectArray.inMesh = mFnTypedAttribute.create("inputMesh", "inMesh", OpenMaya.MFnData.kMesh)
+    mFnTypedAttribute.array = True
+    mFnTypedAttribute.readable = False
+
+    projectArray.direction = createDirectionAttribute()
+    projectArray.rotateOrder = createRotateOrderAttribute()
+    projectArray.warmStart = createWarmStartAttribute()
+    projectArray.missMode, projectArray.maxDistance = createMissAttributes()
+    projectArray.accelerator = createAcceleratorAttribute()
+    projectArray.sweep = createSweepAttribute()
+    projectArray.normalMode = createNormalModeAttribute()
+    projectArray.time = createTimeAttribute()
+    projectArray.workers, projectArray.parallelThreshold = createParallelAttributes()
+
+    projectArray.addAttribute(projectArray.inputMatrix)
+    projectArray.addAttribute(projectArray.targetMatrix)
+    projectArray.addAttribute(projectArray.value)
+    projectArray.addAttribute(projectArray.inMesh)
+    projectArray.addAttribute(projectArray.resultVector)
+    projectArray.addAttribute(projectArray.resultRotate)
+    projectArray.addAttribute(projectArray.deltaVector)
+    projectArray.addAttribute(projectArray.dotProduct)
+    projectArray.addAttribute(projectArray.direction)
+    projectArray.addAttribute(projectArray.rotateOrder)
+    projectArray.addAttribute(projectArray.warmStart)
+    projectArray.addAttribute(projectArray.missMode)
+    projectArray.addAttribute(projectArray.maxDistance)
+    projectArray.addAttribute(projectArray.accelerator)
+    projectArray.addAttribute(projectArray.sweep)
+    projectArray.addAttribute(projectArray.normalMode)
+    projectArray.addAttribute(projectArray.time)
+    projectArray.addAttribute(projectArray.workers)
+    projectArray.addAttribute(projectArray.parallelThreshold)
+
+    setAttributeAffects(projectArray)
+
+def nodeRemoved(node, clientData):
+    # A project node is being deleted, its meshes go back to the meshRegistry
+    OpenMaya.MFnDependencyNode(node).userNode().release()
+
+# Initialize the script plug-in
+def initializePlugin(mobject):
+    mplugin = OpenMaya.MFnPlugin(mobject, 'Pranay Meher', '2.0')
+    try:
+        mplugin.registerNode( kNodeName, kNodeId, nodeCreator, nodeInitializer )
+    except:
+        sys.stderr.write( "Failed to register command: %s\n" % kNodeName )
+        raise
+    try:
+        mplugin.registerNode( kArrayNodeName, kArrayNodeId, arrayNodeCreator, arrayNodeInitializer )
+    except:
+        sys.stderr.write( "Failed to register command: %s\n" % kArrayNodeName )
+        raise
+    try:
+        mplugin.registerCommand( kBakeCommandName, bakeCommandCreator, bakeSyntaxCreator )
+    except:
+        sys.stderr.write( "Failed to register command: %s\n" % kBakeCommandName )
+        raise
+    try:
+        mplugin.registerCommand( kStatsCommandName, statsCommandCreator, statsSyntaxCreator )
+    except:
+        sys.stderr.write( "Failed to register command: %s\n" % kStatsCommandName )
+        raise
+    try:
+        for nodeName in (kNodeName, kArrayNodeName):
+            callbackIds.append(OpenMaya.MDGMessage.addNodeRemovedCallback(nodeRemoved, nodeName))
+    except:
+        sys.stderr.write( "Failed to add the node removed callbacks\n" )
+        raise
+
+# Uninitialize the script plug-in
+def uninitializePlugin(mobject):
+    mplugin = OpenMaya.MFnPlugin(mobject)
+    try:
+        OpenMaya.MMessage.removeCallbacks(callbackIds)
+    except:
+        sys.stderr.write( "Failed to remove the node removed callbacks\n" )
+    del callbackIds[:]
+    meshRegistry.clear()
+    projectCore.shutdownThreadPools()
+    try:
+        mplugin.deregisterNode( kNodeName )
+    except:
+        sys.stderr.write( "Failed to unregister command: %s\n" % kNodeName )
+    try:
+        mplugin.deregisterNode( kArrayNodeName )
+    except:
+        sys.stderr.write( "Failed to unregister command: %s\n" % kArrayNodeName )
+    try:
+        mplugin.deregisterCommand( kBakeCommandName )
+    except:
+        sys.stderr.write( "Failed to unregister command: %s\n" % kBakeCommandName )
+    try:
+        mplugin.deregisterCommand( kStatsCommandName )
+    except:
+        sys.stderr.write( "Failed to unregister command: %s\n" % kStatsCommandName )
@@ -0,0 +1,901 @@
+'''
+projectCore - Maya independent ray casting engine of the project plugin.
+
+Everything in here only needs numpy, so it runs headless (farm blades, tests, benchmarks) as
+well as inside the plugin. Triangles are numpy arrays of points and vertex indices, rays are
+batches of origins and directions, and the queries answer with hit points, ray params, face ids,
+triangle ids and barycentric coordinates from a vectorized Moller-Trumbore test.
+
+projectPoints() is the projection the projectNode does : a ray from every source towards its
+target, the hit closest to the source within param 1 and a blend between the source and the hit (or the target
+when nothing is hit) by value.
+'''
+import os
+import math
+import threading
+from concurrent import futures
+
+import numpy
+
+# Direction modes of the ray queries, same order as the direction attribute of the nodes
+kForward = 0
+kBackward = 1
+kBoth = 2
+
+# Rotate orders, same values as MEulerRotation and the rotateOrder attribute of a transform
+kXYZ = 0
+kYZX = 1
+kZXY = 2
+kXZY = 3
+kYXZ = 4
+kZYX = 5
+kRotateOrderAxes = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0))
+
+# Batches are only split across worker threads when every worker gets at least this many rays,
+# below that the thread handoff costs more than it saves
+kMinParallelRays = 256
+
+# Worker thread pools shared by all the queries, one per worker count
+threadPools = {}
+threadPoolsLock = threading.Lock()
+
+class MeshBVH(object):
+    '''
+    Bounding volume hierarchy over the triangles of a mesh.
+
+    The triangles are sorted along a morton curve of their centroids and grouped into leaves of
+    leafSize triangles. The tree is a complete binary tree stored in flat arrays (children of
+    node i are 2i+1 and 2i+2) so it can be built and queried level by level with numpy instead
+    of walking it node by node in python.
+    '''
+    leafSize = 8
+
+    def __init__(self, points, triangles, faceIds=None, triIds=None):
+        points = numpy.asarray(points, dtype=numpy.float64)
+        triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+        self.triangleCount = len(triangles)
+
+        # Plain triangle soups are their own faces
+        if faceIds is None:
+            faceIds = numpy.arange(self.triangleCount)
+        if triIds is None:
+            triIds = numpy.zeros(self.triangleCount, dtype=numpy.int64)
+
+        # Sorting the triangles along the morton curve so that neighbouring triangles end up
+        # in the same leaf
+        centroids = points[triangles].mean(axis=1)
+        self.order = numpy.argsort(mortonCodes(centroids), kind='stable')
+        self.triangles = triangles[self.order]
+        self.faceIds = numpy.asarray(faceIds)[self.order]
+        self.triIds = numpy.asarray(triIds)[self.order]
+
+        self.setLayout()
+        self.refit(points)
+
+    # Arrays which make up a built BVH, see arrays() and fromArrays()
+    kArrayNames = ('order', 'triangles', 'faceIds', 'triIds', 'v0', 'e1', 'e2', 'nodeMin', 'nodeMax')
+
+    def setLayout(self):
+        # Number of leaves is rounded up to a power of 2 so that the tree is complete
+        leafCount = max(1, -(-self.triangleCount // self.leafSize))
+        self.depth = int(math.ceil(math.log(leafCount, 2))) if leafCount > 1 else 0
+        self.leafOffset = (1 << self.depth) - 1
+        # Face and vertex to triangle tables for the warm start, built when first needed
+        self.adjacency = None
+
+    def arrays(self):
+        '''
+        The arrays of the BVH by name, enough to rebuild it with fromArrays() in another process
+        (shared memory, memory mapped files) without sorting or fitting anything again.
+        '''
+        return dict((name, getattr(self, name)) for name in self.kArrayNames)
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        '''BVH over the given arrays (from arrays()), they are used as they are, nothing is copied.'''
+        bvh = cls.__new__(cls)
+        for name in cls.kArrayNames:
+            setattr(bvh, name, arrays[name])
+        bvh.triangleCount = len(bvh.triangles)
+        bvh.setLayout()
+        return bvh
+
+    def refit(self, points):
+        '''
+        Recomputes the triangles and the node boxes for new point positions. The tree layout is
+        kept as it is, so this is only valid as long as the topology of the mesh is the same.
+        '''
+        corners = numpy.asarray(points, dtype=numpy.float64)[self.triangles]
+
+        # Storing the triangles as a corner and two edges, that is all Moller-Trumbore needs
+        self.v0 = corners[:, 0]
+        self.e1 = corners[:, 1] - corners[:, 0]
+        self.e2 = corners[:, 2] - corners[:, 0]
+
+        nodeCount = 2 * (1 << self.depth) - 1
+        self.nodeMin = numpy.full((nodeCount, 3), numpy.nan)
+        self.nodeMax = numpy.full((nodeCount, 3), numpy.nan)
+
+        # Leaf boxes from the triangle boxes, the padding leaves stay empty (nan), a nan box is
+        # never crossed by a ray and fmin/fmax leave it out of the parent boxes
+        if self.triangleCount:
+            starts = numpy.arange(0, self.triangleCount, self.leafSize)
+            leaves = slice(self.leafOffset, self.leafOffset + len(starts))
+            self.nodeMin[leaves] = numpy.minimum.reduceat(corners.min(axis=1), starts)
+            self.nodeMax[leaves] = numpy.maximum.reduceat(corners.max(axis=1), starts)
+
+        # Now merging the boxes level by level up to the root
+        fitParents(self.nodeMin, self.nodeMax, self.depth)
+
+    def bounds(self):
+        # Bounding box of the mesh, the box of the root node (nan for an empty mesh)
+        return self.nodeMin[0], self.nodeMax[0]
+
+    def allIntersections(self, raySource, rayDirection, maxParam, direction=kBoth):
+        '''
+        Same idea as MFnMesh.allIntersections for a single ray. Returns the hit points, ray params,
+        face ids, triangle ids and barycentric coordinates sorted by the ray param.
+        '''
+        origins = numpy.asarray(raySource, dtype=numpy.float64).reshape(1, 3)
+        directions = numpy.asarray(rayDirection, dtype=numpy.float64).reshape(1, 3)
+        minParam, maxParam = paramRange(maxParam, direction)
+        rays, leaves, distance = self.leafPairs(origins, directions, minParam, maxParam)
+        rays, candidates, param, bary1, bary2 = self.testLeaves(rays, leaves, origins, directions, minParam, maxParam)
+
+        order = numpy.argsort(param, kind='stable')
+        candidates = candidates[order]
+        param = param[order]
+        points = origins[0] + param[:, None] * directions[0]
+        return points, param, self.faceIds[candidates], self.triIds[candidates], bary1[order], bary2[order]
+
+    def closestIntersection(self, origins, directions, maxParam, direction=kBoth, warmFaces=None, workers=1, minParallelRays=kMinParallelRays):
+        '''
+        Batched nearest hit query. Returns per ray arrays of the hit closest to the ray source
+        within the param range of the direction mode (kForward, kBackward or kBoth) : hit flags,
+        hit points, ray params, face ids, triangle ids and barycentric coordinates. Rays without a
+        hit have a face id of -1.
+
+        The leaves crossed by every ray are visited in the order the ray enters them and a ray
+        stops as soon as its closest hit is nearer than the next leaf, so the triangles of the
+        leaves further down the ray are never tested.
+
+        warmFaces optionally gives a face id per ray (-1 for none), usually the face the ray hit
+        on the previous frame. The triangles around it (its one ring) are tested first and a ray
+        which hits one of them starts the tree walk with that hit as its best one, so only the
+        leaves nearer than it are tested. This is what makes a contact which moves a little from
+        frame to frame cheap, and a surface coming in between the source and the one ring is still
+        found : the hits are the nearest ones, with or without warmFaces.
+
+        workers splits the batch in contiguous chunks of rays queried on that many threads (0 for
+        one per cpu), numpy releases the GIL in the heavy kernels. A batch stays on the calling
+        thread unless every worker gets at least minParallelRays rays. Every ray is worked out on
+        its own, so the results are the same bit for bit whatever the split.
+
+        Rays whose segment does not cross the bounding box of the mesh are answered as misses
+        first, without any warm start, tree or triangle work (feet in the air).
+        '''
+        origins = numpy.asarray(origins, dtype=numpy.float64).reshape(-1, 3)
+        directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+        if warmFaces is not None:
+            warmFaces = numpy.asarray(warmFaces, dtype=numpy.int64).reshape(-1)
+        near = raysNearBox(self.nodeMin[0], self.nodeMax[0], origins, directions, *paramRange(maxParam, direction))
+        if near.all():
+            return self.closestIntersectionBatch(origins, directions, maxParam, direction, warmFaces, workers, minParallelRays)
+
+        result = missedRays(len(origins))
+        if near.any():
+            nearResult = self.closestIntersectionBatch(origins[near], directions[near], maxParam, direction,
+                                                       None if warmFaces is None else warmFaces[near], workers, minParallelRays)
+            for array, nearArray in zip(result, nearResult):
+                array[near] = nearArray
+        return result
+
+    def closestIntersectionBatch(self, origins, directions, maxParam, direction=kBoth, warmFaces=None, workers=1, minParallelRays=kMinParallelRays):
+        # closestIntersection of rays which may hit the mesh, split across the worker threads
+        chunks = rayChunks(len(origins), workers, minParallelRays)
+        if len(chunks) == 1:
+            return self.closestIntersectionChunk(origins, directions, maxParam, direction, warmFaces)
+
+        # The adjacency is built once here, the workers only read it
+        if warmFaces is not None:
+            self.buildAdjacency()
+        pool = getThreadPool(len(chunks))
+        jobs = [pool.submit(self.closestIntersectionChunk, origins[chunk], directions[chunk], maxParam, direction,
+                            None if warmFaces is None else warmFaces[chunk]) for chunk in chunks]
+        results = [job.result() for job in jobs]
+        return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+
+    def closestIntersectionChunk(self, origins, directions, maxParam, direction=kBoth, warmFaces=None):
+        # closestIntersection of one batch of rays on the calling thread
+        minParam, maxParam = paramRange(maxParam, direction)
+        result = missedRays(len(origins))
+        hit, hitPoint, hitParam, hitFace, hitTriangle, hitBary1, hitBary2 = result
+        hitCandidate = numpy.zeros(len(origins), dtype=numpy.int64)
+        best = numpy.full(len(origins), numpy.inf)
+
+        def keepClosest(pairRays, candidates, param, bary1, bary2):
+            # Nearest hit of every ray among the pairs, kept if it beats the best one so far
+            if not len(pairRays):
+                return
+            key = numpy.abs(param)
+            order = numpy.lexsort((param, key, pairRays))
+            first = numpy.concatenate(([True], pairRays[order][1:] != pairRays[order][:-1]))
+            order = order[first]
+            order = order[key[order] < best[pairRays[order]]]
+            closestRays = pairRays[order]
+            best[closestRays] = key[order]
+            hitParam[closestRays] = param[order]
+            hitCandidate[closestRays] = candidates[order]
+            hitBary1[closestRays] = bary1[order]
+            hitBary2[closestRays] = bary2[order]
+            hit[closestRays] = True
+
+        # Warm start from the one ring of the given faces
+        if warmFaces is not None and self.triangleCount:
+            warmFaces = numpy.asarray(warmFaces, dtype=numpy.int64).reshape(-1)
+            warmRays = numpy.flatnonzero((warmFaces >= 0) & (warmFaces <= self.faceIds.max()))
+            keepClosest(*self.testTriangles(*self.oneRing(warmRays, warmFaces[warmRays]), origins=origins,
+                                            directions=directions, minParam=minParam, maxParam=maxParam))
+
+        # Sorting the leaves of every ray by their distance along the ray and ranking them. The rays
+        # with a warm hit go through the tree too, only down the boxes nearer than that hit
+        rays, leaves, distance = self.leafPairs(origins, directions, numpy.maximum(minParam, -best), numpy.minimum(maxParam, best))
+        order = numpy.lexsort((distance, rays))
+        rays = rays[order]
+        leaves = leaves[order]
+        distance = distance[order]
+        rank = numpy.arange(len(rays))
+        if len(rays):
+            starts = numpy.flatnonzero(numpy.concatenate(([True], rays[1:] != rays[:-1])))
+            rank -= numpy.repeat(starts, numpy.diff(numpy.append(starts, len(rays))))
+
+        # Every round tests the next nearest leaf of the rays which can still find a closer hit
+        for currentRank in range(int(rank.max()) + 1 if len(rank) else 0):
+            active = numpy.flatnonzero(rank == currentRank)
+            active = active[distance[active] <= best[rays[active]]]
+            if not len(active):
+                break
+            keepClosest(*self.testLeaves(rays[active], leaves[active], origins, directions, minParam, maxParam))
+
+        hitFace[hit] = self.faceIds[hitCandidate[hit]]
+        hitTriangle[hit] = self.triIds[hitCandidate[hit]]
+        hitPoint[hit] = origins[hit] + hitParam[hit, None] * directions[hit]
+        return result
+
+    def closestPoints(self, points, maxDistance=numpy.inf, workers=1, minParallelRays=kMinParallelRays):
+        '''
+        Batched closest point query, same idea as MFnMesh.getClosestPoint. Returns per point
+        arrays of the point on the mesh closest to every given point within maxDistance : found
+        flags, closest points, distances, face ids, triangle ids and barycentric coordinates.
+        Points with nothing within maxDistance have a face id of -1 and an infinite distance.
+
+        Uses the same tree as the ray queries : the nodes are walked down keeping only the ones
+        whose box can be closer than the farthest corner of the best box so far, then the leaves
+        are tested nearest first and a point stops as soon as its closest point is nearer than
+        the next leaf. workers and minParallelRays split the batch like closestIntersection.
+        '''
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        chunks = rayChunks(len(points), workers, minParallelRays)
+        if len(chunks) == 1:
+            return self.closestPointsChunk(points, maxDistance)
+        pool = getThreadPool(len(chunks))
+        jobs = [pool.submit(self.closestPointsChunk, points[chunk], maxDistance) for chunk in chunks]
+        results = [job.result() for job in jobs]
+        return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+
+    def closestPointsChunk(self, points, maxDistance=numpy.inf):
+        # closestPoints of one batch of points on the calling thread. Distances are squared until the end
+        result = missedRays(len(points))
+        found, closestPoint, distance, closestFace, closestTriangle, closestBary1, closestBary2 = result
+        closestCandidate = numpy.zeros(len(points), dtype=numpy.int64)
+        best = numpy.full(len(points), float(maxDistance) ** 2)
+        distance[:] = numpy.inf
+        if not self.triangleCount:
+            return result
+
+        # Walking down the tree, a node is kept while its box is not further than the farthest
+        # corner of any box of the same point (every box holds a triangle within that distance)
+        queries = numpy.arange(len(points))
+        nodes = numpy.zeros(len(points), dtype=numpy.int64)
+        bound = best.copy()
+        for level in range(self.depth + 1):
+            near, far = boxDistances(self.nodeMin[nodes], self.nodeMax[nodes], points[queries])
+            numpy.fmin.at(bound, queries, far)
+            keep = near <= bound[queries]
+            queries = queries[keep]
+            nodes = nodes[keep]
+            near = near[keep]
+            if not len(queries):
+                return result
+            if level < self.depth:
+                queries = numpy.repeat(queries, 2)
+                nodes = numpy.stack((2 * nodes + 1, 2 * nodes + 2), axis=1).ravel()
+
+        # Ranking the leaves of every point by their distance, like the ray rounds
+        order = numpy.lexsort((near, queries))
+        queries = queries[order]
+        leaves = nodes[order] - self.leafOffset
+        near = near[order]
+        starts = numpy.flatnonzero(numpy.concatenate(([True], queries[1:] != queries[:-1])))
+        rank = numpy.arange(len(queries)) - numpy.repeat(starts, numpy.diff(numpy.append(starts, len(queries))))
+
+        for currentRank in range(int(rank.max()) + 1):
+            active = numpy.flatnonzero(rank == currentRank)
+            active = active[near[active] <= best[queries[active]]]
+            if not len(active):
+                break
+            candidates = (leaves[active, None] * self.leafSize + numpy.arange(self.leafSize)).ravel()
+            pairQueries = numpy.repeat(queries[active], self.leafSize)
+            keep = candidates < self.triangleCount
+            candidates = candidates[keep]
+            pairQueries = pairQueries[keep]
+            squared, bary1, bary2 = closestPointsOnTriangles(self.v0[candidates], self.e1[candidates], self.e2[candidates], points[pairQueries])
+
+            # Nearest triangle of every point in this round, kept if it is within the best so far
+            order = numpy.lexsort((squared, pairQueries))
+            first = numpy.concatenate(([True], pairQueries[order][1:] != pairQueries[order][:-1]))
+            order = order[first]
+            order = order[squared[order] <= best[pairQueries[order]]]
+            closestQueries = pairQueries[order]
+            best[closestQueries] = squared[order]
+            closestCandidate[closestQueries] = candidates[order]
+            closestBary1[closestQueries] = bary1[order]
+            closestBary2[closestQueries] = bary2[order]
+            found[closestQueries] = True
+
+        candidates = closestCandidate[found]
+        closestFace[found] = self.faceIds[candidates]
+        closestTriangle[found] = self.triIds[candidates]
+        closestPoint[found] = (self.v0[candidates] + closestBary1[found, None] * self.e1[candidates]
+                               + closestBary2[found, None] * self.e2[candidates])
+        distance[found] = numpy.sqrt(best[found])
+        return result
+
+    def oneRing(self, rays, faces):
+        '''
+        Triangles sharing a vertex with the triangles of the given faces, as (ray, triangle) pairs
+        for the given rays (one face per ray). Triangles are indices into the sorted arrays of the
+        BVH and a triangle can come up more than once for a ray.
+        '''
+        faceOffsets, faceTriangles, vertexOffsets, vertexTriangles = self.buildAdjacency()
+
+        # Faces to their triangles, to their vertices, to all the triangles using them
+        owners, triangles = gatherRows(faceOffsets, faceTriangles, faces)
+        vertices = self.triangles[triangles].ravel()
+        owners = numpy.repeat(owners, 3)
+        vertexOwners, ring = gatherRows(vertexOffsets, vertexTriangles, vertices)
+        return numpy.asarray(rays)[owners[vertexOwners]], ring
+
+    def buildAdjacency(self):
+        # Face to triangles and vertex to triangles tables, built on the first call. They stay
+        # valid through refit, they only depend on the topology
+        if self.adjacency is None:
+            faceOrder = numpy.argsort(self.faceIds, kind='stable')
+            faceOffsets = numpy.searchsorted(self.faceIds[faceOrder], numpy.arange(self.faceIds.max() + 2))
+            vertices = self.triangles.ravel()
+            vertexOrder = numpy.argsort(vertices, kind='stable')
+            vertexOffsets = numpy.searchsorted(vertices[vertexOrder], numpy.arange(vertices.max() + 2))
+            self.adjacency = (faceOffsets, faceOrder, vertexOffsets, vertexOrder // 3)
+        return self.adjacency
+
+    def leafPairs(self, origins, directions, minParam, maxParam):
+        # (ray, leaf) pairs of the leaves crossed by the rays, see boxPairs
+        return boxPairs(self.nodeMin, self.nodeMax, self.depth, origins, directions, minParam, maxParam)
+
+    def testLeaves(self, rays, leaves, origins, directions, minParam, maxParam):
+        # Tests every triangle of the given (ray, leaf) pairs. Returns the (ray, triangle) hits
+        # within the param range, the triangles are indices into the sorted arrays of the BVH
+        candidates = (leaves[:, None] * self.leafSize + numpy.arange(self.leafSize)).ravel()
+        rays = numpy.repeat(rays, self.leafSize)
+        keep = candidates < self.triangleCount
+        return self.testTriangles(rays[keep], candidates[keep], origins, directions, minParam, maxParam)
+
+    def testTriangles(self, rays, candidates, origins, directions, minParam, maxParam):
+        # Tests the given (ray, triangle) pairs, returns the ones which hit within the param range
+        hit, param, bary1, bary2 = intersectTriangles(self.v0[candidates], self.e1[candidates], self.e2[candidates], origins[rays], directions[rays])
+        hit &= (param >= minParam) & (param <= maxParam)
+        return rays[hit], candidates[hit], param[hit], bary1[hit], bary2[hit]
+
+class SceneBVH(object):
+    '''
+    Two level acceleration structure over several meshes (colliders) : a BVH per mesh under a
+    top level tree over their bounding boxes, built the same way as the one of MeshBVH with one
+    mesh per leaf. It answers the queries of MeshBVH across all the meshes, a ray only queries
+    the meshes whose box it crosses, nearest box first, and skips the ones further than its
+    closest hit so far. The per mesh BVHs are used as they are, so the meshes which did not
+    change keep theirs and only the top level is built again.
+
+    The bvhs can be anything answering closestIntersection, closestPoints and bounds like
+    MeshBVH. faceCounts are the polygon counts of the meshes (from the face ids of the BVHs by
+    default). The face ids of the queries are scene face ids : the faces of mesh i start at
+    faceOffsets[i], splitFaces() turns them back into (mesh, face) pairs.
+    '''
+
+    def __init__(self, bvhs, faceCounts=None):
+        self.bvhs = list(bvhs)
+        if faceCounts is None:
+            faceCounts = [int(bvh.faceIds.max()) + 1 if bvh.triangleCount else 0 for bvh in self.bvhs]
+        self.faceOffsets = numpy.concatenate(([0], numpy.cumsum(faceCounts, dtype=numpy.int64)))
+        self.boxMin = numpy.full((len(self.bvhs), 3), numpy.nan)
+        self.boxMax = numpy.full((len(self.bvhs), 3), numpy.nan)
+        for mesh, bvh in enumerate(self.bvhs):
+            self.boxMin[mesh], self.boxMax[mesh] = bvh.bounds()
+
+        # Top level tree, the meshes sorted along the morton curve of their box centers
+        centers = numpy.nan_to_num((self.boxMin + self.boxMax) * 0.5)
+        self.order = numpy.argsort(mortonCodes(centers), kind='stable')
+        leafCount = max(1, len(self.bvhs))
+        self.depth = int(math.ceil(math.log(leafCount, 2))) if leafCount > 1 else 0
+        self.leafOffset = (1 << self.depth) - 1
+        self.nodeMin = numpy.full((2 * (1 << self.depth) - 1, 3), numpy.nan)
+        self.nodeMax = numpy.full((2 * (1 << self.depth) - 1, 3), numpy.nan)
+        self.nodeMin[self.leafOffset:self.leafOffset + len(self.bvhs)] = self.boxMin[self.order]
+        self.nodeMax[self.leafOffset:self.leafOffset + len(self.bvhs)] = self.boxMax[self.order]
+        fitParents(self.nodeMin, self.nodeMax, self.depth)
+
+    def bounds(self):
+        return self.nodeMin[0], self.nodeMax[0]
+
+    def splitFaces(self, faces):
+        # Mesh indices and mesh face ids of scene face ids, -1 for both where the face is -1
+        faces = numpy.asarray(faces, dtype=numpy.int64)
+        meshes = numpy.searchsorted(self.faceOffsets, faces, side='right') - 1
+        meshes = numpy.where(faces >= 0, numpy.minimum(meshes, len(self.bvhs) - 1), -1)
+        return meshes, numpy.where(faces >= 0, faces - self.faceOffsets[numpy.maximum(meshes, 0)], -1)
+
+    def closestIntersection(self, origins, directions, maxParam, direction=kBoth, warmFaces=None, workers=1, minParallelRays=kMinParallelRays):
+        '''Same as MeshBVH.closestIntersection across all the meshes, with scene face ids.'''
+        origins = numpy.asarray(origins, dtype=numpy.float64).reshape(-1, 3)
+        directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+        if len(self.bvhs) == 1:
+            return self.bvhs[0].closestIntersection(origins, directions, maxParam, direction, warmFaces, workers, minParallelRays)
+
+        result = missedRays(len(origins))
+        hit, hitPoint, hitParam, hitFace, hitTriangle, hitBary1, hitBary2 = result
+        best = numpy.full(len(origins), numpy.inf)
+        if warmFaces is not None:
+            warmMeshes, warmFaces = self.splitFaces(numpy.asarray(warmFaces).reshape(-1))
+
+        rays, leaves, distance = boxPairs(self.nodeMin, self.nodeMax, self.depth, origins, directions, *paramRange(maxParam, direction))
+        meshes = self.order[leaves]
+        for mesh in meshesByDistance(meshes, distance):
+            pairs = numpy.flatnonzero(meshes == mesh)
+            meshRays = rays[pairs[distance[pairs] <= best[rays[pairs]]]]
+            if not len(meshRays):
+                continue
+            meshWarmFaces = None
+            if warmFaces is not None:
+                meshWarmFaces = numpy.where(warmMeshes[meshRays] == mesh, warmFaces[meshRays], -1)
+            meshResult = self.bvhs[mesh].closestIntersection(origins[meshRays], directions[meshRays], maxParam, direction,
+                                                             meshWarmFaces, workers, minParallelRays)
+
+            # Keeping the hits closer than the ones found on the other meshes
+            closer = meshResult[0] & (numpy.abs(meshResult[2]) < best[meshRays])
+            closerRays = meshRays[closer]
+            for array, meshArray in zip(result, meshResult):
+                array[closerRays] = meshArray[closer]
+            hitFace[closerRays] += self.faceOffsets[mesh]
+            best[closerRays] = numpy.abs(hitParam[closerRays])
+        return result
+
+    def closestPoints(self, points, maxDistance=numpy.inf, workers=1, minParallelRays=kMinParallelRays):
+        '''Same as MeshBVH.closestPoints across all the meshes, with scene face ids.'''
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        if len(self.bvhs) == 1:
+            return self.bvhs[0].closestPoints(points, maxDistance, workers, minParallelRays)
+
+        result = missedRays(len(points))
+        found, closestPoint, distance, closestFace, closestTriangle, closestBary1, closestBary2 = result
+        distance[:] = numpy.inf
+        best = numpy.full(len(points), float(maxDistance))
+        near = boxDistances(self.boxMin[None], self.boxMax[None], points[:, None])[0]
+        for mesh in numpy.argsort(numpy.nan_to_num(near.min(axis=0), nan=numpy.inf), kind='stable'):
+            meshPoints = numpy.flatnonzero(near[:, mesh] <= best * best)
+            if not len(meshPoints):
+                continue
+            meshResult = self.bvhs[mesh].closestPoints(points[meshPoints], maxDistance, workers, minParallelRays)
+            closer = meshResult[0] & (meshResult[2] < best[meshPoints])
+            closerPoints = meshPoints[closer]
+            for array, meshArray in zip(result, meshResult):
+                array[closerPoints] = meshArray[closer]
+            closestFace[closerPoints] += self.faceOffsets[mesh]
+            best[closerPoints] = distance[closerPoints]
+        return result
+
+def projectPoints(bvh, sources, targets, values, direction=kBoth, missDistance=None, previousSources=None):
+    '''
+    Projects every source towards its target onto the mesh of the bvh. Returns the blended
+    positions (source + (hit or target - source) * value) followed by the per ray hit arrays of
+    MeshBVH.closestIntersection : hit flags, hit points, ray params, face ids, triangle ids and
+    barycentrics. direction is kForward, kBackward or kBoth. With a missDistance the sources of
+    the rays which missed snap to the closest point of the mesh within it (see snapMissedRays).
+    With previousSources the sources stop on the earliest hit of their path (see sweptIntersection).
+    '''
+    sources = numpy.asarray(sources, dtype=numpy.float64).reshape(-1, 3)
+    targets = numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 3)
+    values = numpy.broadcast_to(numpy.asarray(values, dtype=numpy.float64), (len(sources),))
+
+    deltaVectors = targets - sources
+    if bvh is None:
+        hitResult = missedRays(len(sources))
+    elif previousSources is not None:
+        hitResult = sweptIntersection(bvh, previousSources, sources, deltaVectors, 1.0, direction)
+    else:
+        hitResult = bvh.closestIntersection(sources, deltaVectors, 1.0, direction)
+        if missDistance is not None:
+            snapMissedRays(bvh, sources, hitResult, missDistance)
+    hit, hitPoint = hitResult[0], hitResult[1]
+    deltaVectors[hit] = hitPoint[hit] - sources[hit]
+
+    computedVectors = sources + deltaVectors * values[:, None]
+    return (computedVectors,) + tuple(hitResult)
+
+def snapMissedRays(bvh, sources, hitResult, maxDistance, workers=1, minParallelRays=kMinParallelRays):
+    '''
+    Closest point fallback of a ray query : the rays of hitResult (the arrays returned by
+    MeshBVH.closestIntersection, updated in place) which missed get the point of the mesh closest
+    to their source within maxDistance (0 or inf for no limit) as their hit. Their ray param is
+    nan as the point is not on the ray. Returns the rays which were snapped.
+    '''
+    hit, hitPoint, hitParam, hitFace, hitTriangle, hitBary1, hitBary2 = hitResult
+    missed = numpy.flatnonzero(~hit)
+    if not len(missed):
+        return missed
+    found, closestPoint, distance, closestFace, closestTriangle, closestBary1, closestBary2 = bvh.closestPoints(
+        numpy.asarray(sources, dtype=numpy.float64).reshape(-1, 3)[missed], maxDistance or numpy.inf, workers, minParallelRays)
+    snapped = missed[found]
+    hit[snapped] = True
+    hitPoint[snapped] = closestPoint[found]
+    hitParam[snapped] = numpy.nan
+    hitFace[snapped] = closestFace[found]
+    hitTriangle[snapped] = closestTriangle[found]
+    hitBary1[snapped] = closestBary1[found]
+    hitBary2[snapped] = closestBary2[found]
+    return snapped
+
+def sweptIntersection(bvh, previousSources, origins, directions, maxParam, direction=kBoth, warmFaces=None, workers=1,
+                      minParallelRays=kMinParallelRays):
+    '''
+    Ray query for sources which moved from previousSources to origins since the last query. The
+    path of every source which moved is cast first (forward, previous source to source) and the
+    earliest hit along it is the contact of the ray, so a source going through a thin surface in
+    one step still stops on it instead of tunneling. The sources whose path is clear then cast
+    their ray as closestIntersection does. Both are one batch each, the result has the arrays of
+    closestIntersection with a nan ray param for the path contacts as they are not on the ray.
+    '''
+    origins = numpy.asarray(origins, dtype=numpy.float64).reshape(-1, 3)
+    directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+    previousSources = numpy.asarray(previousSources, dtype=numpy.float64).reshape(-1, 3)
+    paths = origins - previousSources
+    moved = numpy.flatnonzero((paths != 0.0).any(axis=1))
+
+    result = missedRays(len(origins))
+    clear = numpy.ones(len(origins), dtype=bool)
+    if len(moved):
+        pathResult = bvh.closestIntersection(previousSources[moved], paths[moved], 1.0, kForward, None, workers, minParallelRays)
+        contacts = pathResult[0]
+        for array, pathArray in zip(result, pathResult):
+            array[moved[contacts]] = pathArray[contacts]
+        result[2][moved[contacts]] = numpy.nan
+        clear[moved[contacts]] = False
+
+    rays = numpy.flatnonzero(clear)
+    if len(rays):
+        if warmFaces is not None:
+            warmFaces = numpy.asarray(warmFaces, dtype=numpy.int64).reshape(-1)[rays]
+        rayResult = bvh.closestIntersection(origins[rays], directions[rays], maxParam, direction, warmFaces, workers, minParallelRays)
+        for array, rayArray in zip(result, rayResult):
+            array[rays] = rayArray
+    return result
+
+def faceNormals(points, triangles, faceIds=None, faceCount=None):
+    '''
+    Unit normals of the faces of a triangulated mesh, from the sum of the cross products of the
+    triangles of every face (the area vector of the polygon, same as Newell's method for a fan
+    triangulation). Returns a (faceCount, 3) array, faces without triangles get a zero normal.
+    '''
+    points = numpy.asarray(points, dtype=numpy.float64)
+    triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+    if faceIds is None:
+        faceIds = numpy.arange(len(triangles))
+    if faceCount is None:
+        faceCount = int(faceIds.max()) + 1 if len(faceIds) else 0
+    corners = points[triangles]
+    crosses = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals = numpy.zeros((faceCount, 3))
+    for axis in range(3):
+        normals[:, axis] = numpy.bincount(faceIds, crosses[:, axis], minlength=faceCount)
+    return normalized(normals)
+
+def vertexNormals(triangles, faceIds, faceNormals, vertexCount):
+    '''
+    Unit normals of the vertices of a triangulated mesh, the average of the normals of the faces
+    around every vertex (MFnMesh.getVertexNormal without angle weighting). Every mesh edge is
+    smooth, hard edges and locked normals are not followed. Returns a (vertexCount, 3) array.
+    '''
+    triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+    faceIds = numpy.asarray(faceIds, dtype=numpy.int64)
+    # Every face counts once per vertex, however many of its triangles share the vertex
+    faceVertices = numpy.unique(numpy.column_stack((numpy.repeat(faceIds, 3), triangles.reshape(-1))), axis=0)
+    normals = numpy.zeros((vertexCount, 3))
+    for axis in range(3):
+        normals[:, axis] = numpy.bincount(faceVertices[:, 1], faceNormals[faceVertices[:, 0], axis], minlength=vertexCount)
+    return normalized(normals)
+
+def interpolateNormals(points, triangles, vertexNormals, hitPoints):
+    '''
+    Smooth unit normals at points lying on triangles ((count, 3) vertex indices, one triangle per
+    point) : the normals of the three vertices blended by the barycentric coordinates of the point.
+    The coordinates are worked out again from the points, so the hits of any query can be used
+    whatever convention it gives its barycentrics in.
+    '''
+    corners = numpy.asarray(points, dtype=numpy.float64)[triangles]
+    squared, bary1, bary2 = closestPointsOnTriangles(corners[:, 0], corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0],
+                                                     numpy.asarray(hitPoints, dtype=numpy.float64).reshape(-1, 3))
+    cornerNormals = vertexNormals[triangles]
+    normals = ((1.0 - bary1 - bary2)[:, None] * cornerNormals[:, 0] + bary1[:, None] * cornerNormals[:, 1]
+               + bary2[:, None] * cornerNormals[:, 2])
+    return normalized(normals)
+
+def matrixTranslations(matrices):
+    '''
+    Translations of an array of flattened 4x4 matrices (count, 16), Maya layout with the
+    translation in elements 12 to 14. Returns a (count, 3) view, nothing is copied.
+    '''
+    matrices = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 16)
+    return matrices[:, 12:15]
+
+def matrixAxes(matrices):
+    '''
+    Normalized x, y and z axes (the first three rows) of an array of flattened 4x4 matrices.
+    Returns a (count, 3, 3) array, axes[:, 0] are the x axes. Zero length axes stay zero.
+    '''
+    matrices = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 16)
+    axes = matrices[:, :12].reshape(-1, 3, 4)[:, :, :3]
+    lengths = numpy.sqrt((axes * axes).sum(axis=-1))
+    lengths[lengths == 0.0] = 1.0
+    return axes / lengths[:, :, None]
+
+def frameRotations(normals, xAxes, zAxes, rotateOrder=kXYZ):
+    '''
+    Euler rotations (degrees) of the frames sitting on the hit faces : y is the face normal, z is
+    the z axis of the source projected on the face and x completes the right handed frame. When
+    the source z axis is along the normal the source x axis is projected instead. Takes (count, 3)
+    arrays and returns a (count, 3) array of x, y, z angles in the given rotate order.
+    '''
+    normals = normalized(numpy.asarray(normals, dtype=numpy.float64).reshape(-1, 3))
+    xAxes = numpy.asarray(xAxes, dtype=numpy.float64).reshape(-1, 3)
+    zAxes = numpy.asarray(zAxes, dtype=numpy.float64).reshape(-1, 3)
+
+    # Removing the normal component of the source axes, falling back on x where z is degenerate
+    projectedZ = zAxes - (zAxes * normals).sum(axis=1)[:, None] * normals
+    projectedX = xAxes - (xAxes * normals).sum(axis=1)[:, None] * normals
+    newZ = normalized(projectedZ)
+    newX = normalized(numpy.cross(normals, newZ))
+    degenerate = (projectedZ * projectedZ).sum(axis=1) < 1e-12
+    if degenerate.any():
+        newX[degenerate] = normalized(projectedX[degenerate])
+        newZ[degenerate] = numpy.cross(newX[degenerate], normals[degenerate])
+
+    rows = numpy.stack((newX, normals, newZ), axis=1)
+    return numpy.degrees(eulerFromRows(rows, rotateOrder))
+
+def eulerFromRows(rows, rotateOrder=kXYZ):
+    '''
+    Euler angles (radians) of an array of (count, 3, 3) orthonormal rotation matrices in Maya's
+    row vector layout, for the given rotate order. Gimbal locked frames put the whole rotation
+    around the first two axes.
+    '''
+    first, second, third = kRotateOrderAxes[rotateOrder]
+    sign = 1.0 if rotateOrder in (kXYZ, kYZX, kZXY) else -1.0
+
+    # rows[:, a, b] is element (b, a) of the column vector matrix third * second * first
+    cosSecond = numpy.hypot(rows[:, first, first], rows[:, first, second])
+    angles = numpy.zeros((len(rows), 3))
+    angles[:, second] = numpy.arctan2(-sign * rows[:, first, third], cosSecond)
+    angles[:, first] = numpy.arctan2(sign * rows[:, second, third], rows[:, third, third])
+    angles[:, third] = numpy.arctan2(sign * rows[:, first, second], rows[:, first, first])
+
+    locked = cosSecond < 1e-9
+    if locked.any():
+        angles[locked, first] = numpy.arctan2(-sign * rows[locked, third, second], rows[locked, second, second])
+        angles[locked, third] = 0.0
+    return angles
+
+def normalized(vectors):
+    # Unit length copies of an array of vectors, zero vectors stay zero
+    lengths = numpy.sqrt((vectors * vectors).sum(axis=-1))
+    lengths[lengths == 0.0] = 1.0
+    return vectors / lengths[..., None]
+
+def paramRange(maxParam, direction):
+    # Range of ray params a direction mode accepts
+    if direction == kForward:
+        return 0.0, maxParam
+    if direction == kBackward:
+        return -maxParam, 0.0
+    return -maxParam, maxParam
+
+def missedRays(rayCount):
+    # Hit arrays of rays which did not hit anything
+    return (numpy.zeros(rayCount, dtype=bool), numpy.zeros((rayCount, 3)), numpy.zeros(rayCount),
+            numpy.full(rayCount, -1, dtype=numpy.int64), numpy.full(rayCount, -1, dtype=numpy.int64),
+            numpy.zeros(rayCount), numpy.zeros(rayCount))
+
+def intersectTriangles(v0, e1, e2, origin, direction):
+    # Moller-Trumbore ray/triangle test over arrays of triangles, both faces are hit
+    pvec = numpy.cross(direction, e2)
+    det = (e1 * pvec).sum(axis=-1)
+    hit = numpy.abs(det) > 1e-12
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        invDet = 1.0 / det
+        tvec = origin - v0
+        bary1 = (tvec * pvec).sum(axis=-1) * invDet
+        qvec = numpy.cross(tvec, e1)
+        bary2 = (direction * qvec).sum(axis=-1) * invDet
+        param = (e2 * qvec).sum(axis=-1) * invDet
+        # Degenerate triangles have nan coordinates, the comparisons stay in the errstate too
+        hit &= (bary1 >= 0.0) & (bary2 >= 0.0) & (bary1 + bary2 <= 1.0)
+    return hit, param, bary1, bary2
+
+def closestPointsOnTriangles(v0, e1, e2, points):
+    # Closest points of arrays of triangles to arrays of points. Returns the squared distances and
+    # the barycentric coordinates (the point is v0 + bary1 * e1 + bary2 * e2). The point projected
+    # on the plane is taken when it falls inside the triangle, the closest edge point otherwise
+    offsets = points - v0
+    e1e1 = (e1 * e1).sum(axis=-1)
+    e1e2 = (e1 * e2).sum(axis=-1)
+    e2e2 = (e2 * e2).sum(axis=-1)
+    e1Offset = (e1 * offsets).sum(axis=-1)
+    e2Offset = (e2 * offsets).sum(axis=-1)
+    det = e1e1 * e2e2 - e1e2 * e1e2
+    e3 = e2 - e1
+    e3e3 = (e3 * e3).sum(axis=-1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inside = numpy.stack(((e2e2 * e1Offset - e1e2 * e2Offset) / det, (e1e1 * e2Offset - e1e2 * e1Offset) / det), axis=-1)
+        edge1 = numpy.clip(numpy.nan_to_num(e1Offset / e1e1), 0.0, 1.0)
+        edge2 = numpy.clip(numpy.nan_to_num(e2Offset / e2e2), 0.0, 1.0)
+        edge3 = numpy.clip(numpy.nan_to_num(((offsets - e1) * e3).sum(axis=-1) / e3e3), 0.0, 1.0)
+
+    # Candidates (count, 4, 2) : the plane projection and the three edges
+    zeros = numpy.zeros(len(offsets))
+    barys = numpy.stack((inside, numpy.stack((edge1, zeros), axis=-1), numpy.stack((zeros, edge2), axis=-1),
+                         numpy.stack((1.0 - edge3, edge3), axis=-1)), axis=1)
+    vectors = barys[..., 0, None] * e1[:, None] + barys[..., 1, None] * e2[:, None] - offsets[:, None]
+    squared = (vectors * vectors).sum(axis=-1)
+    valid = (numpy.abs(det) > 1e-24) & (inside[:, 0] >= 0.0) & (inside[:, 1] >= 0.0) & (inside.sum(axis=-1) <= 1.0)
+    squared[~valid, 0] = numpy.inf
+    nearest = squared.argmin(axis=1)
+    rows = numpy.arange(len(offsets))
+    return squared[rows, nearest], barys[rows, nearest, 0], barys[rows, nearest, 1]
+
+def boxDistances(boxMin, boxMax, points):
+    # Squared distances from the points to the nearest and farthest points of their boxes, empty
+    # (nan) boxes come out nan for both
+    nearest = numpy.maximum(numpy.maximum(boxMin - points, points - boxMax), 0.0)
+    farthest = numpy.maximum(numpy.abs(points - boxMin), numpy.abs(points - boxMax))
+    return (nearest * nearest).sum(axis=-1), (farthest * farthest).sum(axis=-1)
+
+def rayChunks(rayCount, workers, minParallelRays=kMinParallelRays):
+    # Contiguous slices of a batch of rays, one per worker, a single slice for the whole batch
+    # when it is too small to be worth splitting. workers 0 is one per cpu
+    workers = workers or os.cpu_count() or 1
+    chunkCount = max(1, min(workers, rayCount // max(1, minParallelRays)))
+    bounds = numpy.linspace(0, rayCount, chunkCount + 1).astype(numpy.int64)
+    return [slice(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def getThreadPool(workers):
+    # Shared pool of the given number of worker threads, created on first use
+    with threadPoolsLock:
+        pool = threadPools.get(workers)
+        if pool is None:
+            pool = threadPools[workers] = futures.ThreadPoolExecutor(max_workers=workers)
+    return pool
+
+def shutdownThreadPools():
+    # Stops the worker threads of all the pools (waiting for the queries running on them), the
+    # next query with workers creates its pool again
+    with threadPoolsLock:
+        pools = list(threadPools.values())
+        threadPools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+def gatherRows(offsets, items, rows):
+    # Items of the given rows of a table stored as offsets and a flat array of items (row i is
+    # items[offsets[i]:offsets[i + 1]]). Returns the position in rows every item came from and the items
+    starts = offsets[rows]
+    counts = offsets[numpy.asarray(rows) + 1] - starts
+    owners = numpy.repeat(numpy.arange(len(counts)), counts)
+    positions = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts - starts, counts)
+    return owners, items[positions]
+
+def fitParents(nodeMin, nodeMax, depth):
+    # Fits the boxes of the inner nodes of a complete binary tree to its leaf boxes, level by
+    # level up to the root. Empty (nan) boxes are left out by fmin / fmax
+    for level in range(depth - 1, -1, -1):
+        first = (1 << level) - 1
+        count = 1 << level
+        children = slice(2 * first + 1, 2 * first + 1 + 2 * count)
+        childMin = nodeMin[children].reshape(count, 2, 3)
+        childMax = nodeMax[children].reshape(count, 2, 3)
+        nodeMin[first:first + count] = numpy.fmin(childMin[:, 0], childMin[:, 1])
+        nodeMax[first:first + count] = numpy.fmax(childMax[:, 0], childMax[:, 1])
+
+def boxPairs(nodeMin, nodeMax, depth, origins, directions, minParam, maxParam):
+    # Walks down a complete binary tree of boxes with (ray, node) pairs, keeping only the nodes
+    # whose box is crossed by their ray within the param range. Returns the rays, the leaves they
+    # cross and the distance (in ray params) from the ray source to where it enters the leaf.
+    # minParam and maxParam are one range for all the rays or arrays of one range per ray
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1.0 / directions
+    minParams = numpy.broadcast_to(numpy.asarray(minParam, dtype=numpy.float64), (len(origins),))
+    maxParams = numpy.broadcast_to(numpy.asarray(maxParam, dtype=numpy.float64), (len(origins),))
+    rays = numpy.arange(len(origins))
+    nodes = numpy.zeros(len(origins), dtype=numpy.int64)
+    for level in range(depth + 1):
+        near, far = slabTest(nodeMin[nodes], nodeMax[nodes], origins[rays], inverse[rays])
+        near = numpy.maximum(near, minParams[rays])
+        far = numpy.minimum(far, maxParams[rays])
+        keep = near <= far
+        rays = rays[keep]
+        nodes = nodes[keep]
+        if not len(rays):
+            return rays, nodes, numpy.zeros(0)
+        if level < depth:
+            rays = numpy.repeat(rays, 2)
+            nodes = numpy.stack((2 * nodes + 1, 2 * nodes + 2), axis=1).ravel()
+
+    near = near[keep]
+    far = far[keep]
+    distance = numpy.where((near <= 0.0) & (far >= 0.0), 0.0, numpy.minimum(numpy.abs(near), numpy.abs(far)))
+    return rays, nodes - ((1 << depth) - 1), distance
+
+def meshesByDistance(meshes, distance):
+    # Meshes of (ray, mesh) pairs, the one with the nearest pair first
+    order = numpy.argsort(distance, kind='stable')
+    unique, first = numpy.unique(meshes[order], return_index=True)
+    return unique[numpy.argsort(first, kind='stable')]
+
+def raysNearBox(boxMin, boxMax, origins, directions, minParam, maxParam):
+    # Flags of the rays whose segment (params minParam to maxParam) crosses the box, an empty
+    # (nan) box is crossed by none
+    with numpy.errstate(divide='ignore'):
+        inverse = 1.0 / directions
+    near, far = slabTest(numpy.broadcast_to(boxMin, origins.shape), numpy.broadcast_to(boxMax, origins.shape), origins, inverse)
+    return numpy.maximum(near, minParam) <= numpy.minimum(far, maxParam)
+
+def slabTest(boxMin, boxMax, origin, inverse):
+    # Entry and exit ray params of the boxes. A ray parallel to a slab is inside it for any param
+    # when its origin is between the planes (faces included) and outside it otherwise, this also
+    # covers the nan of 0 * inf. Empty (nan) boxes come out with nan params which fail every comparison
+    with numpy.errstate(invalid='ignore'):
+        t1 = (boxMin - origin) * inverse
+        t2 = (boxMax - origin) * inverse
+    near = numpy.fmin(t1, t2)
+    far = numpy.fmax(t1, t2)
+    parallel = numpy.isinf(inverse)
+    if parallel.any():
+        parallel = numpy.broadcast_to(parallel, near.shape)
+        with numpy.errstate(invalid='ignore'):
+            outside = ~((boxMin <= origin) & (origin <= boxMax))
+        near = numpy.where(parallel, numpy.where(outside, numpy.inf, -numpy.inf), near)
+        far = numpy.where(parallel, numpy.where(outside, -numpy.inf, numpy.inf), far)
+        empty = numpy.isnan(boxMin[..., 0])
+        near[empty] = numpy.nan
+    return near.max(axis=-1), far.min(axis=-1)
+
+def mortonCodes(centroids, bits=21):
+    # 63 bit morton codes of the centroids, 21 bits per axis. The cells are cubes sized on the
+    # longest side of the bounding box so flat meshes (terrains) do not get thin slab leaves
+    if not len(centroids):
+        return numpy.zeros(0, dtype=numpy.int64)
+    low = centroids.min(axis=0)
+    extent = float((centroids.max(axis=0) - low).max()) or 1.0
+    cellCount = (1 << bits) - 1
+    cells = numpy.clip(((centroids - low) / extent * cellCount).astype(numpy.int64), 0, cellCount)
+    codes = numpy.zeros(len(centroids), dtype=numpy.int64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + 2 - axis)
+    return codes
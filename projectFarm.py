@@ -0,0 +1,328 @@
+'''
+projectFarm - headless batch projection of point pairs onto a mesh.
+
+Does what the projectNode does for every (source, target) pair of a file, without Maya : the ray
+from the source towards the target is cast onto the mesh and the hit position, the rotation of the
+frame on the hit face and the dot product between the face normal and the ray are written out.
+Used to snap scattered instances (trees, rocks) onto terrain before publishing.
+
+The mesh is read and its BVH built once in the main process, then shared with the worker
+processes through shared memory along with the rays and the result arrays, so nothing big is
+pickled or copied per worker. The rays are cut into shards the workers pick up as they go.
+With projectIO files (.prj, see projectIO.py) nothing is read or built at all : the mesh with its
+BVH, the rays and the results are mapped by every process and the workers write into the
+results file.
+
+    python projectFarm.py terrain.obj placements.npz -o snapped.npz
+    python projectFarm.py terrain.obj placements.npz -o snapped.npz --processes 32 --direction forward
+    python projectFarm.py terrain.prj placements.prj -o snapped.prj
+
+Mesh files : .obj (v and f lines, polygons are fan triangulated) or .npz with points (n, 3),
+triangles (m, 3) and optionally faceIds (m,), the polygon of every triangle.
+Ray files : .npz with sources (n, 3) and targets (n, 3), optionally values (n,) to blend between
+the source and the hit like the value attribute of the node (1.0 when missing).
+Result file : .npz with positions (n, 3), rotations (n, 3) in degrees, dotProducts (n,),
+hit (n,) and faceIds (n,), -1 for the rays which missed.
+
+Sources are points, so the rotations are the ones a source with the world axes would get : y
+along the face normal and z the world z projected on the face. A ray without a hit keeps its
+target position, a zero rotation and a dot product of 1.0, like the node. With --miss-mode
+closest-point it snaps its source to the closest point of the mesh instead (within --max-distance).
+'''
+import os
+import sys
+import time
+import argparse
+from concurrent import futures
+from multiprocessing import shared_memory
+
+import numpy
+
+import projectIO
+import projectCore
+
+kDirections = {'forward': projectCore.kForward, 'backward': projectCore.kBackward, 'both': projectCore.kBoth}
+kRotateOrders = ('xyz', 'yzx', 'zxy', 'xzy', 'yxz', 'zyx')
+kShardSize = 65536
+
+# Shared state of a worker process, set by initWorker
+workerState = {}
+
+
+class SharedArrays(object):
+    '''
+    Named numpy arrays packed into one shared memory block. The process creating it passes
+    name and layout to the others, which attach to the same memory without copying anything.
+    '''
+
+    def __init__(self, sharedMemory, layout, owner=False):
+        self.sharedMemory = sharedMemory
+        self.layout = layout
+        self.owner = owner
+        self.arrays = dict((key, numpy.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf, offset=offset))
+                           for key, dtype, shape, offset in layout)
+
+    @classmethod
+    def create(cls, arrays):
+        # Lays the arrays out 64 byte aligned and copies them in
+        layout = []
+        size = 0
+        for key, array in arrays.items():
+            array = numpy.asarray(array)
+            layout.append((key, array.dtype.str, array.shape, size))
+            size += -(-array.nbytes // 64) * 64
+        shared = cls(shared_memory.SharedMemory(create=True, size=max(size, 1)), layout, owner=True)
+        for key, array in arrays.items():
+            shared.arrays[key][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, name, layout):
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    @property
+    def name(self):
+        return self.sharedMemory.name
+
+    def close(self):
+        self.arrays = {}
+        self.sharedMemory.close()
+        if self.owner:
+            self.sharedMemory.unlink()
+
+
+def readObj(path):
+    # Points and fan triangulated faces of an obj file, faceIds are the obj faces
+    points = []
+    triangles = []
+    faceIds = []
+    with open(path) as objFile:
+        for line in objFile:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0] == 'v':
+                points.append((float(fields[1]), float(fields[2]), float(fields[3])))
+            elif fields[0] == 'f':
+                # Vertex indices start at 1, negative ones count back from the last point
+                vertices = [int(field.split('/')[0]) for field in fields[1:]]
+                vertices = [vertex - 1 if vertex > 0 else len(points) + vertex for vertex in vertices]
+                faceId = len(faceIds) and faceIds[-1] + 1
+                for corner in range(1, len(vertices) - 1):
+                    triangles.append((vertices[0], vertices[corner], vertices[corner + 1]))
+                    faceIds.append(faceId)
+    return numpy.array(points, dtype=numpy.float64).reshape(-1, 3), numpy.array(triangles, dtype=numpy.int64).reshape(-1, 3), numpy.array(faceIds, dtype=numpy.int64)
+
+
+def readMesh(path):
+    # Points, triangles and face ids of a mesh file
+    if path.lower().endswith('.obj'):
+        return readObj(path)
+    with numpy.load(path) as meshFile:
+        triangles = meshFile['triangles'].astype(numpy.int64).reshape(-1, 3)
+        faceIds = meshFile['faceIds'].astype(numpy.int64) if 'faceIds' in meshFile else numpy.arange(len(triangles))
+        return meshFile['points'].astype(numpy.float64).reshape(-1, 3), triangles, faceIds
+
+
+def readRays(path):
+    # Sources, targets and blend values of a ray file
+    with numpy.load(path) as rayFile:
+        sources = rayFile['sources'].astype(numpy.float64).reshape(-1, 3)
+        targets = rayFile['targets'].astype(numpy.float64).reshape(-1, 3)
+        values = rayFile['values'].astype(numpy.float64) if 'values' in rayFile else numpy.ones(len(sources))
+    if len(targets) != len(sources) or len(values) != len(sources):
+        raise ValueError('%s : sources, targets and values have different lengths' % path)
+    return sources, targets, values
+
+
+def projectRays(bvh, normals, rays, results, start, end, direction, rotateOrder, missDistance=None):
+    '''
+    Projects the rays start to end and writes the results in place. rays and results are dicts
+    of arrays (the shared ones in the workers), normals are the face normals of the mesh. With a
+    missDistance the rays which miss snap to the closest point of the mesh within it.
+    '''
+    sources = rays['sources'][start:end]
+    projected = projectCore.projectPoints(bvh, sources, rays['targets'][start:end], rays['values'][start:end], direction, missDistance)
+    computedVectors, hit, hitPoint, hitParam, hitFace = projected[:5]
+
+    faceNormals = normals[hitFace[hit]]
+    rotations = numpy.zeros((end - start, 3))
+    dotProducts = numpy.ones(end - start)
+    if hit.any():
+        axes = numpy.zeros((len(faceNormals), 3))
+        rotations[hit] = projectCore.frameRotations(faceNormals, axes + (1.0, 0.0, 0.0), axes + (0.0, 0.0, 1.0), rotateOrder)
+        dotProducts[hit] = (faceNormals * (sources[hit] - hitPoint[hit])).sum(axis=1)
+
+    results['positions'][start:end] = computedVectors
+    results['rotations'][start:end] = rotations
+    results['dotProducts'][start:end] = dotProducts
+    results['hit'][start:end] = hit
+    results['faceIds'][start:end] = hitFace
+    return end - start
+
+
+def initWorker(meshName, meshLayout, raysName, raysLayout, direction, rotateOrder, missDistance):
+    # Attaches a worker process to the shared mesh, rays and results
+    meshShared = SharedArrays.attach(meshName, meshLayout)
+    raysShared = SharedArrays.attach(raysName, raysLayout)
+    workerState.update(meshShared=meshShared, raysShared=raysShared, direction=direction, rotateOrder=rotateOrder,
+                       missDistance=missDistance, bvh=projectCore.MeshBVH.fromArrays(meshShared.arrays))
+
+
+def projectShard(start, end):
+    # Projects one shard of the rays in a worker process
+    arrays = workerState['raysShared'].arrays
+    return projectRays(workerState['bvh'], workerState['meshShared'].arrays['faceNormals'], arrays, arrays,
+                       start, end, workerState['direction'], workerState['rotateOrder'], workerState['missDistance'])
+
+
+def resultArrays(rayCount):
+    return {
+        'positions': numpy.zeros((rayCount, 3)),
+        'rotations': numpy.zeros((rayCount, 3)),
+        'dotProducts': numpy.ones(rayCount),
+        'hit': numpy.zeros(rayCount, dtype=bool),
+        'faceIds': numpy.full(rayCount, -1, dtype=numpy.int64),
+    }
+
+
+def initFileWorker(meshPath, raysPath, outputPath, direction, rotateOrder, missDistance):
+    # Maps the mesh, rays and results files in a worker process
+    bvh, normals = projectIO.openMesh(meshPath)
+    workerState.update(bvh=bvh, normals=normals, rays=projectIO.openRays(raysPath),
+                       results=projectIO.openArrays(outputPath, 'r+', kind='results')[1],
+                       direction=direction, rotateOrder=rotateOrder, missDistance=missDistance)
+
+
+def projectFileShard(start, end):
+    # Projects one shard of the rays in a worker process, straight into the results file
+    projectRays(workerState['bvh'], workerState['normals'], workerState['rays'], workerState['results'],
+                start, end, workerState['direction'], workerState['rotateOrder'], workerState['missDistance'])
+    return end - start
+
+
+def shardRanges(rayCount, processes, shardSize):
+    # Start and end of every shard and the number of processes worth starting for them
+    starts = list(range(0, rayCount, max(1, shardSize)))
+    ends = [min(start + shardSize, rayCount) for start in starts]
+    return starts, ends, min(processes or os.cpu_count() or 1, len(starts))
+
+
+def projectMesh(points, triangles, faceIds, sources, targets, values=None, direction=projectCore.kBoth,
+                rotateOrder=projectCore.kXYZ, processes=0, shardSize=kShardSize, missDistance=None):
+    '''
+    Projects every (source, target) pair onto the mesh, across a pool of processes (0 for one
+    per cpu). Returns a dict of result arrays : positions, rotations, dotProducts, hit and faceIds.
+    Batches of a single shard are projected in this process. With a missDistance (inf for no
+    limit) the sources of the rays which miss snap to the closest point of the mesh within it.
+    '''
+    sources = numpy.asarray(sources, dtype=numpy.float64).reshape(-1, 3)
+    if values is None:
+        values = numpy.ones(len(sources))
+    bvh = projectCore.MeshBVH(points, triangles, faceIds)
+    normals = projectCore.faceNormals(points, triangles, faceIds)
+    rays = {'sources': sources, 'targets': numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 3),
+            'values': numpy.asarray(values, dtype=numpy.float64).reshape(-1)}
+    return projectBVH(bvh, normals, rays, direction, rotateOrder, processes, shardSize, missDistance)
+
+
+def projectBVH(bvh, normals, rays, direction=projectCore.kBoth, rotateOrder=projectCore.kXYZ, processes=0, shardSize=kShardSize,
+               missDistance=None):
+    # projectMesh with the BVH and face normals of the mesh already there
+    rayCount = len(rays['sources'])
+    starts, ends, processes = shardRanges(rayCount, processes, shardSize)
+    if processes <= 1:
+        results = resultArrays(rayCount)
+        for start, end in zip(starts, ends):
+            projectRays(bvh, normals, rays, results, start, end, direction, rotateOrder, missDistance)
+        return results
+
+    meshArrays = bvh.arrays()
+    meshArrays['faceNormals'] = normals
+    rayArrays = dict(rays)
+    rayArrays.update(resultArrays(rayCount))
+    meshShared = SharedArrays.create(meshArrays)
+    raysShared = SharedArrays.create(rayArrays)
+    try:
+        with futures.ProcessPoolExecutor(processes, initializer=initWorker,
+                                         initargs=(meshShared.name, meshShared.layout, raysShared.name, raysShared.layout,
+                                                   direction, rotateOrder, missDistance)) as pool:
+            sum(pool.map(projectShard, starts, ends))
+        return dict((key, raysShared.arrays[key].copy()) for key in resultArrays(0))
+    finally:
+        meshShared.close()
+        raysShared.close()
+
+
+def projectFiles(meshPath, raysPath, outputPath, direction=projectCore.kBoth, rotateOrder=projectCore.kXYZ,
+                 processes=0, shardSize=kShardSize, missDistance=None):
+    '''
+    Projects the rays of raysPath onto the mesh of meshPath into outputPath, returns the results.
+    projectIO files (.prj) are mapped instead of read : a mesh file brings its BVH along, and when
+    all three files are projectIO files the workers map them themselves and write their shards
+    straight into the results file, so nothing goes through shared memory.
+    '''
+    if isArrayFile(meshPath):
+        bvh, normals = projectIO.openMesh(meshPath)
+    else:
+        points, triangles, faceIds = readMesh(meshPath)
+        bvh = projectCore.MeshBVH(points, triangles, faceIds)
+        normals = projectCore.faceNormals(points, triangles, faceIds)
+    if isArrayFile(raysPath):
+        rays = projectIO.openRays(raysPath)
+    else:
+        rays = dict(zip(('sources', 'targets', 'values'), readRays(raysPath)))
+
+    rayCount = len(rays['sources'])
+    if not isArrayFile(outputPath):
+        results = projectBVH(bvh, normals, rays, direction, rotateOrder, processes, shardSize, missDistance)
+        numpy.savez(outputPath, **results)
+        return results
+
+    results = projectIO.createResults(outputPath, rayCount)
+    starts, ends, processes = shardRanges(rayCount, processes, shardSize)
+    if processes <= 1:
+        for start, end in zip(starts, ends):
+            projectRays(bvh, normals, rays, results, start, end, direction, rotateOrder, missDistance)
+    elif isArrayFile(meshPath) and isArrayFile(raysPath):
+        with futures.ProcessPoolExecutor(processes, initializer=initFileWorker,
+                                         initargs=(meshPath, raysPath, outputPath, direction, rotateOrder, missDistance)) as pool:
+            sum(pool.map(projectFileShard, starts, ends))
+    else:
+        for key, array in projectBVH(bvh, normals, rays, direction, rotateOrder, processes, shardSize, missDistance).items():
+            results[key][...] = array
+    for array in results.values():
+        array.flush()
+    return results
+
+
+def isArrayFile(path):
+    return path.lower().endswith(projectIO.kExtension)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('mesh', help='mesh file (.obj, .npz or .prj)')
+    parser.add_argument('rays', help='ray file (.npz with sources and targets or .prj)')
+    parser.add_argument('-o', '--output', required=True, help='result file (.npz or .prj)')
+    parser.add_argument('--processes', type=int, default=0, help='worker processes, 0 for one per cpu')
+    parser.add_argument('--shard-size', type=int, default=kShardSize, help='rays per task handed to a worker')
+    parser.add_argument('--direction', choices=sorted(kDirections), default='both')
+    parser.add_argument('--rotate-order', choices=kRotateOrders, default='xyz')
+    parser.add_argument('--miss-mode', choices=('target', 'closest-point'), default='target',
+                        help='what a ray which hits nothing does, closest-point snaps the source onto the mesh')
+    parser.add_argument('--max-distance', type=float, default=0.0, help='max distance of the closest-point miss mode, 0 for no limit')
+    options = parser.parse_args(arguments)
+    missDistance = None
+    if options.miss_mode == 'closest-point':
+        missDistance = options.max_distance or numpy.inf
+
+    start = time.time()
+    results = projectFiles(options.mesh, options.rays, options.output, kDirections[options.direction],
+                           kRotateOrders.index(options.rotate_order), options.processes, options.shard_size, missDistance)
+    sys.stdout.write('%d rays, %d hits in %.2fs\n' % (len(results['hit']), results['hit'].sum(), time.time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
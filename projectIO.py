@@ -0,0 +1,197 @@
+'''
+projectIO - binary files for headless projection runs, opened with numpy.memmap.
+
+Meshes, ray batches and results are stored as a few flat arrays in one file, so a job maps them
+in instead of parsing and copying them : it starts at once and the worker processes of a blade
+share the same pages of the file through the OS cache instead of holding a copy each. A mesh file
+also stores its BVH, which is never built again by the jobs reading it.
+
+File layout (all little endian) :
+
+    bytes 0-7     magic b'PRJARR01'
+    bytes 8-15    uint64, length in bytes of the json header
+    header        utf-8 json : {"kind": "mesh" | "rays" | "results",
+                                "meta": {...},
+                                "arrays": [{"name", "dtype", "shape", "offset"}, ...]}
+    data          every array in C order at its offset (from the start of the file), offsets
+                  are multiples of 64
+
+Arrays of the kinds :
+
+    mesh      points (n, 3) f8, triangles (m, 3) i8, faceIds (m,) i8, faceNormals (f, 3) f8 and
+              the BVH arrays of projectCore.MeshBVH.arrays(), meta holds the leafSize of the BVH
+    rays      sources (n, 3) f8, targets (n, 3) f8, values (n,) f8
+    results   positions (n, 3) f8, rotations (n, 3) f8, dotProducts (n,) f8, hit (n,) bool,
+              faceIds (n,) i8
+
+Converting files for a run :
+
+    python projectIO.py mesh terrain.obj terrain.prj
+    python projectIO.py rays placements.npz placements.prj
+'''
+import sys
+import json
+import struct
+import argparse
+
+import numpy
+
+import projectCore
+
+kMagic = b'PRJARR01'
+kExtension = '.prj'
+kAlignment = 64
+kResultArrays = (('positions', '<f8', (3,)), ('rotations', '<f8', (3,)), ('dotProducts', '<f8', ()),
+                 ('hit', '|b1', ()), ('faceIds', '<i8', ()))
+
+
+def writeArrays(path, kind, arrays, meta=None):
+    '''
+    Writes named arrays (a list of (name, array) pairs or a dict) to path. Returns the entries
+    of the header, the arrays can be given as (dtype, shape) to only reserve their space.
+    '''
+    items = list(arrays.items()) if isinstance(arrays, dict) else list(arrays)
+    entries = []
+    for name, array in items:
+        if isinstance(array, tuple):
+            dtype, shape = numpy.dtype(array[0]).newbyteorder('<'), tuple(array[1])
+        else:
+            array = numpy.asarray(array)
+            dtype, shape = array.dtype.newbyteorder('<'), array.shape
+        entries.append({'name': name, 'dtype': dtype.str, 'shape': list(shape), 'offset': 0})
+
+    # The header size depends on the offsets, so they are worked out until the header stops growing
+    headerSize = 0
+    while True:
+        offset = alignUp(16 + headerSize)
+        for entry in entries:
+            entry['offset'] = offset
+            offset = alignUp(offset + entryBytes(entry))
+        header = json.dumps({'kind': kind, 'meta': meta or {}, 'arrays': entries}).encode('utf-8')
+        if len(header) <= headerSize:
+            break
+        headerSize = len(header) + 64
+
+    with open(path, 'wb') as outFile:
+        outFile.write(kMagic)
+        outFile.write(struct.pack('<Q', headerSize))
+        outFile.write(header.ljust(headerSize))
+        outFile.truncate(max(offset, 16 + headerSize))
+        for (name, array), entry in zip(items, entries):
+            if not isinstance(array, tuple):
+                outFile.seek(entry['offset'])
+                outFile.write(numpy.ascontiguousarray(array, dtype=numpy.dtype(entry['dtype'])).tobytes())
+    return entries
+
+
+def readHeader(path):
+    # Kind, meta and array entries of a file
+    with open(path, 'rb') as inFile:
+        if inFile.read(8) != kMagic:
+            raise ValueError('%s is not a projectIO file' % path)
+        headerSize = struct.unpack('<Q', inFile.read(8))[0]
+        header = json.loads(inFile.read(headerSize).decode('utf-8'))
+    return header['kind'], header['meta'], header['arrays']
+
+
+def openArrays(path, mode='r', kind=None):
+    '''
+    Maps the arrays of a file, returns (meta, dict of numpy.memmap). mode 'r' is read only,
+    'r+' writes go to the file. Nothing is read until the arrays are used.
+    '''
+    fileKind, meta, entries = readHeader(path)
+    if kind is not None and fileKind != kind:
+        raise ValueError('%s holds %s, not %s' % (path, fileKind, kind))
+    arrays = {}
+    for entry in entries:
+        shape = tuple(entry['shape'])
+        if not entryBytes(entry):
+            # numpy can not map zero bytes, an empty array viewed as a memmap has nothing to flush
+            arrays[entry['name']] = numpy.zeros(shape, dtype=entry['dtype']).view(numpy.memmap)
+        else:
+            arrays[entry['name']] = numpy.memmap(path, dtype=entry['dtype'], mode=mode, offset=entry['offset'], shape=shape)
+    return meta, arrays
+
+
+def writeMesh(path, points, triangles, faceIds=None):
+    '''Builds the BVH of the mesh and writes it to path with the mesh and its face normals.'''
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+    if faceIds is None:
+        faceIds = numpy.arange(len(triangles))
+    faceIds = numpy.asarray(faceIds, dtype=numpy.int64)
+    bvh = projectCore.MeshBVH(points, triangles, faceIds)
+    arrays = [('points', points), ('triangles', triangles), ('faceIds', faceIds),
+              ('faceNormals', projectCore.faceNormals(points, triangles, faceIds))]
+    arrays.extend(('bvh.' + name, array) for name, array in sorted(bvh.arrays().items()))
+    writeArrays(path, 'mesh', arrays, {'leafSize': projectCore.MeshBVH.leafSize})
+
+
+def openMesh(path):
+    '''
+    Maps a mesh file, returns (bvh, faceNormals). The BVH works straight from the mapped arrays,
+    it is only built again if it was written with another leaf size.
+    '''
+    meta, arrays = openArrays(path, kind='mesh')
+    if meta.get('leafSize') == projectCore.MeshBVH.leafSize:
+        bvh = projectCore.MeshBVH.fromArrays(dict((name, arrays['bvh.' + name]) for name in projectCore.MeshBVH.kArrayNames))
+    else:
+        bvh = projectCore.MeshBVH(arrays['points'], arrays['triangles'], arrays['faceIds'])
+    return bvh, arrays['faceNormals']
+
+
+def writeRays(path, sources, targets, values=None):
+    sources = numpy.asarray(sources, dtype=numpy.float64).reshape(-1, 3)
+    if values is None:
+        values = numpy.ones(len(sources))
+    writeArrays(path, 'rays', [('sources', sources), ('targets', numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 3)),
+                               ('values', numpy.asarray(values, dtype=numpy.float64).reshape(-1))])
+
+
+def openRays(path):
+    # Maps a ray file, returns a dict with sources, targets and values
+    return openArrays(path, kind='rays')[1]
+
+
+def createResults(path, rayCount):
+    '''
+    Creates a results file for rayCount rays and maps it for writing. The workers of a run map
+    it too ('r+') and write their rays straight into the file.
+    '''
+    writeArrays(path, 'results', [(name, (dtype, (rayCount,) + shape)) for name, dtype, shape in kResultArrays])
+    results = openArrays(path, 'r+', kind='results')[1]
+    results['dotProducts'][:] = 1.0
+    results['faceIds'][:] = -1
+    return results
+
+
+def writeResults(path, results):
+    writeArrays(path, 'results', [(name, results[name]) for name, dtype, shape in kResultArrays])
+
+
+def alignUp(offset):
+    return -(-offset // kAlignment) * kAlignment
+
+
+def entryBytes(entry):
+    return int(numpy.prod(entry['shape'], dtype=numpy.int64)) * numpy.dtype(entry['dtype']).itemsize
+
+
+def main(arguments=None):
+    import projectFarm
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('kind', choices=('mesh', 'rays'), help='what is converted')
+    parser.add_argument('input', help='.obj or .npz mesh, .npz rays')
+    parser.add_argument('output', help='projectIO file to write')
+    options = parser.parse_args(arguments)
+
+    if options.kind == 'mesh':
+        writeMesh(options.output, *projectFarm.readMesh(options.input))
+    else:
+        writeRays(options.output, *projectFarm.readRays(options.input))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())